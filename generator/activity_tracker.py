@@ -0,0 +1,230 @@
+"""
+Page view and session activity writes for index().
+
+Every page load used to run UserSession.get_or_create, a full save() (with full_clean) and a
+PageView insert before rendering. write_page_views() persists any number of views in one
+transaction: the missing UserSession rows in one bulk insert, pages_visited as one F()
+UPDATE per distinct increment (counters.py) and the PageView rows in one bulk insert.
+
+With PAGE_VIEW_BUFFERED on, index() only appends the view to a per-process buffer; a
+background thread writes it every PAGE_VIEW_FLUSH_INTERVAL seconds, or as soon as
+PAGE_VIEW_FLUSH_BATCH views are waiting. The buffer holds at most PAGE_VIEW_MAX_BUFFER views;
+beyond that PAGE_VIEW_OVERFLOW decides: 'drop' discards the view (counted), 'inline' makes
+the request write the buffer itself, so a slow database pushes back on requests instead of
+piling up memory. The buffer is flushed on interpreter exit and from gunicorn's
+worker_exit hook.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from django.utils import timezone
+
+from .counters import get_counters
+from .models import PageView, UserSession
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop', 'inline')
+
+PageViewRecord = namedtuple('PageViewRecord', 'session_key path method timestamp referrer')
+
+PATH_MAX_LENGTH = PageView._meta.get_field('path').max_length
+REFERRER_MAX_LENGTH = UserSession._meta.get_field('referrer').max_length
+
+
+def write_page_views(views):
+    """Persist PageViewRecords: create missing sessions, bump pages_visited, insert PageViews"""
+    if not views:
+        return
+    visits = Counter(view.session_key for view in views)
+    referrers = {}
+    for view in views:
+        referrers.setdefault(view.session_key, view.referrer)
+
+    with transaction.atomic():
+        existing = set(UserSession.objects.filter(session_id__in=visits).values_list('session_id', flat=True))
+        # New sessions start from 0 so the increment below counts their first view too
+        # (a session created by get_or_create starts at 1 with its first view)
+        UserSession.objects.bulk_create(
+            [
+                UserSession(session_id=key, referrer=referrers[key], pages_visited=0)
+                for key in visits if key not in existing
+            ],
+            ignore_conflicts=True,
+        )
+
+        get_counters().add('pages_visited', visits)
+
+        session_ids = dict(UserSession.objects.filter(session_id__in=visits).values_list('session_id', 'id'))
+        PageView.objects.bulk_create([
+            PageView(session_id=session_ids[view.session_key], path=view.path, method=view.method,
+                     timestamp=view.timestamp)
+            for view in views
+        ])
+
+
+class PageViewTracker:
+    """Write-behind buffer of page views with a bounded size and an observable backlog"""
+
+    def __init__(self, buffered=True, flush_interval=2.0, flush_batch=500, max_buffer=5000, overflow='drop'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ImproperlyConfigured(f"PAGE_VIEW_OVERFLOW must be one of {OVERFLOW_POLICIES}, not {overflow!r}")
+        self.buffered = buffered
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.max_buffer = max_buffer
+        self.overflow = overflow
+        self.peak_buffer = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.ran_inline = 0
+        self.flushes = 0
+        self._buffer = []
+        self._overflowing = False
+        self._stopping = False
+        self._thread = None
+        self._wakeup = threading.Condition()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            buffered=settings.PAGE_VIEW_BUFFERED,
+            flush_interval=settings.PAGE_VIEW_FLUSH_INTERVAL,
+            flush_batch=settings.PAGE_VIEW_FLUSH_BATCH,
+            max_buffer=settings.PAGE_VIEW_MAX_BUFFER,
+            overflow=settings.PAGE_VIEW_OVERFLOW,
+        )
+
+    def record(self, session_key, path, method='GET', referrer=''):
+        """Track a page view; returns False if it was dropped"""
+        view = PageViewRecord(
+            session_key, path[:PATH_MAX_LENGTH], method, timezone.now(), (referrer or '')[:REFERRER_MAX_LENGTH]
+        )
+        if not self.buffered:
+            self._write([view])
+            return True
+
+        with self._wakeup:
+            full = len(self._buffer) >= self.max_buffer
+            if full and self.overflow == 'drop':
+                self.dropped += 1
+                if not self._overflowing:
+                    self._overflowing = True
+                    logger.warning(f"Page view buffer full ({self.max_buffer}), dropping page views until it drains")
+                return False
+            if full:
+                self.ran_inline += 1
+            else:
+                self._buffer.append(view)
+                self.peak_buffer = max(self.peak_buffer, len(self._buffer))
+                if len(self._buffer) >= self.flush_batch:
+                    self._wakeup.notify_all()
+                self._start_flusher()
+
+        if full:
+            logger.warning(f"Page view buffer full ({self.max_buffer}), writing it inline")
+            self.flush(extra=[view])
+        return True
+
+    def _start_flusher(self):
+        if self._thread is None and not self._stopping:
+            self._thread = threading.Thread(target=self._run, name='page-view-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                self._wakeup.wait_for(
+                    lambda: self._stopping or len(self._buffer) >= self.flush_batch, self.flush_interval
+                )
+                if self._stopping:
+                    return
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def flush(self, extra=()):
+        """Write everything buffered so far (plus `extra` views); returns the number written"""
+        with self._wakeup:
+            views, self._buffer = self._buffer + list(extra), []
+            self._overflowing = False
+        for start in range(0, len(views), self.flush_batch):
+            self._write(views[start:start + self.flush_batch])
+        return len(views)
+
+    def _write(self, views):
+        try:
+            write_page_views(views)
+            failed = False
+        except Exception as e:
+            logger.error(f"Writing {len(views)} page views failed: {e}")
+            failed = True
+        with self._wakeup:
+            self.flushes += 1
+            if failed:
+                self.failed += len(views)
+            else:
+                self.written += len(views)
+
+    def shutdown(self, timeout=None):
+        """Stop the flusher thread and write what is left in the buffer"""
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        """Per-process buffer gauge and counters"""
+        with self._wakeup:
+            return {
+                'buffered': len(self._buffer),
+                'peak_buffer': self.peak_buffer,
+                'max_buffer': self.max_buffer,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'ran_inline': self.ran_inline,
+                'flushes': self.flushes,
+            }
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_page_view_tracker():
+    """Process-wide PageViewTracker, built from settings on first use"""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = PageViewTracker.from_settings()
+    return _tracker
+
+
+@atexit.register
+def flush_page_views(timeout=None):
+    """Write this process's buffered page views (interpreter exit, gunicorn worker_exit)"""
+    if _tracker is not None:
+        _tracker.shutdown(timeout if timeout is not None else settings.PAGE_VIEW_FLUSH_INTERVAL)
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    global _tracker
+    if setting.startswith('PAGE_VIEW_'):
+        flush_page_views()
+        _tracker = None
@@ -1,11 +1,18 @@
 from django.contrib import admin
 from django.db.models import Count, Avg, Q
+from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django.urls import path
 from django.shortcuts import render
 from django.http import JsonResponse
-from .models import UserSession, PromptGeneration, PageView, TemplateUsage, ImprovementSuggestion
+from .models import UserSession, PromptGeneration, PageView, TemplateUsage, ImprovementSuggestion, GenerationJob
+from .response_cache import get_response_cache
+from .singleflight import get_single_flight
+from .analytics import PromptAnalyzer
+from .deferred_analysis import get_analysis_executor, stale_version_counts
+from .activity_tracker import get_page_view_tracker
+from .traffic import get_traffic_classifier
 
 
 @admin.register(UserSession)
@@ -408,7 +415,8 @@ class PromptGenerationAdmin(admin.ModelAdmin):
         'enhancement_mode', 'success', 'copied_to_clipboard', 'template_used', 
         'subject_category', 'age_group_category', 'methodology_category',
         'complexity_level', 'timestamp',
-        'selected_theory', 'theory_auto_suggested'
+        'selected_theory', 'theory_auto_suggested', 'served_from_cache', 'analysis_pending',
+        'analyzer_version'
     ]
     
     search_fields = ['subject', 'task', 'role', 'generated_prompt']
@@ -428,6 +436,13 @@ class PromptGenerationAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
     
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['cache_stats'] = AnalyticsSummary.get_cache_stats()
+        extra_context['analysis_stats'] = AnalyticsSummary.get_analysis_stats()
+        extra_context['traffic_stats'] = AnalyticsSummary.get_traffic_stats()
+        return super().changelist_view(request, extra_context)
+    
     # NEW: Theory Analytics Dashboard View
     def theory_analytics_view(self, request):
         """Main dashboard view with charts"""
@@ -481,7 +496,8 @@ class PromptGenerationAdmin(admin.ModelAdmin):
                 'total_prompts': analytics_data['total_prompts'],
                 'success_rate': analytics_data['success_rate'],
                 'copy_rate': analytics_data['copy_rate'],
-                'auto_suggestion_rate': analytics_data['theory_selection_method']['auto_suggestion_rate']
+                'auto_suggestion_rate': analytics_data['theory_selection_method']['auto_suggestion_rate'],
+                'cache_hit_rate': analytics_data['cache_stats']['hit_rate']
             }
         }
         
@@ -619,17 +635,70 @@ class ImprovementSuggestionAdmin(admin.ModelAdmin):
         return obj.suggestion_text[:100] + '...' if len(obj.suggestion_text) > 100 else obj.suggestion_text
     suggestion_preview.short_description = 'Suggestion Preview'
 
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ['job_id_short', 'status', 'created_at', 'started_at', 'finished_at', 'attempts', 'worker_id']
+    list_filter = ['status', 'created_at']
+    readonly_fields = ['id', 'created_at', 'started_at', 'finished_at', 'lease_expires_at', 'prompt_generation']
+    date_hierarchy = 'created_at'
+    
+    def job_id_short(self, obj):
+        return str(obj.id)[:8] + '...'
+    job_id_short.short_description = 'Job'
+
 # Enhanced Analytics Summary with Theory Selection Data
 class AnalyticsSummary:
     """Enhanced analytics summary with educational research metrics including theory selection"""
     
+    @staticmethod
+    def get_cache_stats():
+        """Gemini response cache hit ratio (all workers, from stored rows) plus this process's counters"""
+        cache_counts = PromptGeneration.objects.aggregate(
+            total=Count('id'),
+            cached=Count('id', filter=Q(served_from_cache=True))
+        )
+        total = cache_counts['total'] or 0
+        cached = cache_counts['cached'] or 0
+        return {
+            'total': total,
+            'cached': cached,
+            'hit_rate': f"{(cached/total*100):.1f}%" if total > 0 else "0%",
+            'process': get_response_cache().stats(),
+            'single_flight': get_single_flight().stats()
+        }
+    
+    @staticmethod
+    def get_analysis_stats():
+        """Rows still waiting for the deferred PromptAnalyzer pass, this process's executor gauge
+        and the rows analysed by an older PromptAnalyzer version"""
+        stale_versions = stale_version_counts()
+        return {
+            'pending': PromptGeneration.objects.filter(analysis_pending=True).count(),
+            'process': get_analysis_executor().stats(),
+            'version': PromptAnalyzer.VERSION,
+            'stale': sum(rows for version, rows in stale_versions),
+            'stale_versions': stale_versions,
+            'form_cache': PromptAnalyzer.form_cache_stats()['total'],
+        }
+    
+    @staticmethod
+    def get_traffic_stats():
+        """This process's automated requests kept out of the analytics and its page view writer"""
+        return {
+            'traffic': get_traffic_classifier().stats(),
+            'page_views': get_page_view_tracker().stats(),
+        }
+    
     @staticmethod
     def get_summary():
         from django.db.models import Count, Avg
         from datetime import datetime, timedelta
         
-        today = datetime.now().date()
-        week_ago = today - timedelta(days=7)
+        # Midnight a week ago as a datetime: a __date lookup would wrap the column in a
+        # function and keep the timestamp indexes from being used
+        week_ago = timezone.make_aware(
+            datetime.combine(timezone.localdate() - timedelta(days=7), datetime.min.time())
+        )
         
         # Basic stats
         total_sessions = UserSession.objects.count()
@@ -638,8 +707,8 @@ class AnalyticsSummary:
         copied_prompts = PromptGeneration.objects.filter(copied_to_clipboard=True).count()
         
         # Weekly stats
-        weekly_sessions = UserSession.objects.filter(start_time__date__gte=week_ago).count()
-        weekly_prompts = PromptGeneration.objects.filter(timestamp__date__gte=week_ago).count()
+        weekly_sessions = UserSession.objects.filter(start_time__gte=week_ago).count()
+        weekly_prompts = PromptGeneration.objects.filter(timestamp__gte=week_ago).count()
         
         # Popular templates
         popular_templates = TemplateUsage.objects.order_by('-usage_count')[:5]
@@ -664,32 +733,33 @@ class AnalyticsSummary:
             complexity_level__isnull=True
         ).values('complexity_level').annotate(count=Count('id')).order_by('-count')
         
-        # Theory Selection Analytics
-        theory_distribution = PromptGeneration.objects.exclude(
-            selected_theory__isnull=True
-        ).exclude(selected_theory='').values('selected_theory').annotate(count=Count('id')).order_by('-count')
+        # Theory Selection Analytics (selected_theory > '' skips both NULL and '' and
+        # matches the condition of the partial promptgen_theory_idx)
+        theory_distribution = PromptGeneration.objects.filter(
+            selected_theory__gt=''
+        ).values('selected_theory').annotate(count=Count('id')).order_by('-count')
         
         # Theory Auto-suggestion vs Manual Selection
-        theory_selection_method = PromptGeneration.objects.exclude(
-            selected_theory__isnull=True
-        ).exclude(selected_theory='').aggregate(
+        theory_selection_method = PromptGeneration.objects.filter(
+            selected_theory__gt=''
+        ).aggregate(
             total_with_theory=Count('id'),
             auto_suggested=Count('id', filter=Q(theory_auto_suggested=True)),
             manual_selected=Count('id', filter=Q(theory_auto_suggested=False))
         )
         
         # Theory effectiveness (theories used with copied prompts)
-        theory_effectiveness = PromptGeneration.objects.exclude(
-            selected_theory__isnull=True
-        ).exclude(selected_theory='').values('selected_theory').annotate(
+        theory_effectiveness = PromptGeneration.objects.filter(
+            selected_theory__gt=''
+        ).values('selected_theory').annotate(
             total_usage=Count('id'),
             copied_count=Count('id', filter=Q(copied_to_clipboard=True))
         ).order_by('-copied_count')
         
         # Enhanced vs Basic mode with theories
-        enhancement_theory_cross = PromptGeneration.objects.exclude(
-            selected_theory__isnull=True
-        ).exclude(selected_theory='').values('enhancement_mode', 'selected_theory').annotate(count=Count('id'))
+        enhancement_theory_cross = PromptGeneration.objects.filter(
+            selected_theory__gt=''
+        ).values('enhancement_mode', 'selected_theory').annotate(count=Count('id'))
                  
         # Content Analysis Averages
         avg_content_metrics = PromptGeneration.objects.aggregate(
@@ -734,6 +804,7 @@ class AnalyticsSummary:
             },
             'theory_effectiveness': theory_effectiveness,
             'enhancement_theory_cross': enhancement_theory_cross,
+            'cache_stats': AnalyticsSummary.get_cache_stats(),
                         
             # Content Metrics
             'avg_content_metrics': {
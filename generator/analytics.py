@@ -1,12 +1,10 @@
+import hashlib
+import json
 import re
 from collections import Counter
-try:
-    from textstat import flesch_reading_ease, syllable_count
-except ImportError:
-    def flesch_reading_ease(text):
-        return 60.0  # default "standard" score
-    def syllable_count(text):
-        return len(text.split())  # crude approximation
+from functools import cached_property, lru_cache
+from .keyword_matcher import KeywordMatcher
+from .readability import flesch_reading_ease
 
 class PromptAnalyzer:
     """Comprehensive analysis of educational prompts for research purposes"""
@@ -483,40 +481,130 @@ class PromptAnalyzer:
         ]
     }
 
+    # Learning environments from the context dropdown, mapped to an age group
+    CONTEXT_ENVIRONMENTS = {
+        'traditional classroom': 'Primary',
+        'online/remote learning': 'Upper_Secondary',
+        'hybrid classroom': 'Upper_Secondary',
+        'homeschool setting': 'Primary',
+        'after-school program': 'Primary'
+    }
+
+    MIXED_CONTEXT_TERMS = ['mixed-ability', 'esl/efl', 'learning difficulties']
+
+    # Primary verbs at the start of a task (checked before the full Bloom's analysis)
+    PRIMARY_TASK_VERBS = {
+        'Expert': ['create', 'design', 'develop', 'build', 'construct', 'compose', 'generate', 'produce'],
+        'Advanced': ['analyze', 'evaluate', 'compare', 'contrast', 'assess', 'critique', 'examine', 'judge'],
+        'Intermediate': ['apply', 'demonstrate', 'solve', 'use', 'implement', 'practice', 'show'],
+        'Basic': ['list', 'name', 'identify', 'recall', 'define', 'describe', 'explain', 'summarize']
+    }
+
+    # Terms behind the educational task overrides in assess_complexity
+    COMPLEXITY_OVERRIDE_TERMS = [
+        'complete lesson plan', 'lesson plan with objectives', 'unit plan',
+        'assessment rubric', 'create rubric', 'design rubric',
+        'warm-up activity', 'complex', 'advanced', 'create', 'vocabulary', 'list'
+    ]
+
+    SPECIFICITY_TERMS = ['students will', 'learning objective', 'step by step',
+                         'for example', 'specifically', 'in particular']
+
+    ACTION_VERBS = ['create', 'design', 'develop', 'implement', 'analyze',
+                    'evaluate', 'compare', 'explain', 'demonstrate']
+
+    # Every table above compiled into one automaton - see build_keyword_matcher() below
+    KEYWORD_MATCHER = None
+
+    # Bump when the classification/scoring code changes; table edits are picked up by
+    # analyzer_fingerprint() on their own
+    # 3: built-in readability engine (textstat raised on unknown words -> constant 5.0)
+    # 4: word-boundary tables match next to punctuation and line breaks, not only spaces
+    SCORING_VERSION = 4
+
+    # Fingerprint stored on every analysed PromptGeneration - see analyzer_fingerprint() below
+    VERSION = None
+
+    # Role, context, methodology and the opening of the task mostly come from dropdowns and
+    # templates, so classifiers reading only those fields are memoized per lowercased value
+    FORM_CACHE_SIZE = 1024
+
     # === ENHANCED CLASSIFICATION METHODS ===
 
+    @staticmethod
+    def classify(data, generated_prompt=""):
+        """
+        All four categories of a generation. The form-field component (role, context,
+        methodology, primary task verb) is memoized; only the generated-text scoring for
+        subject and complexity runs per prompt, and only when the form fields don't decide.
+        """
+        subject_text = data.get("subject", "")
+        task_text = data.get("task", "")
+        methodology_text = data.get("methodology", "")
+        return {
+            'subject_category': (
+                PromptAnalyzer.role_subject_category(data.get("role") or "") or
+                PromptAnalyzer.content_subject_category(subject_text, task_text, generated_prompt)
+            ),
+            'age_group_category': PromptAnalyzer.categorize_age_group(data.get("context", "")),
+            'methodology_category': PromptAnalyzer.categorize_methodology(methodology_text),
+            'complexity_level': (
+                PromptAnalyzer.primary_task_complexity(task_text) or
+                PromptAnalyzer.blooms_complexity_level(generated_prompt, task_text, methodology_text)
+            ),
+        }
+
+    @staticmethod
+    def _form_caches():
+        return {
+            'role': PromptAnalyzer._role_subject_category,
+            'age_group': PromptAnalyzer._categorize_age_group,
+            'methodology': PromptAnalyzer._categorize_methodology,
+            'primary_task': PromptAnalyzer._primary_task_complexity,
+        }
+
+    @staticmethod
+    def form_cache_stats():
+        """Hits/misses of the memoized form-field classifiers"""
+        stats = {name: cache.cache_info()._asdict() for name, cache in PromptAnalyzer._form_caches().items()}
+        hits = sum(info['hits'] for info in stats.values())
+        misses = sum(info['misses'] for info in stats.values())
+        stats['total'] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        }
+        return stats
+
+    @staticmethod
+    def clear_form_cache():
+        for cache in PromptAnalyzer._form_caches().values():
+            cache.cache_clear()
+
     @staticmethod
     def enhanced_context_classification(context_text, generated_prompt=""):
         """Enhanced context classification with complete dropdown coverage"""
-        combined_text = f"{context_text} {generated_prompt}".lower()
+        matches = PromptDocument.of(generated_prompt).matches_with(context_text)
+        context_lower = context_text.lower()
         
         scores = {}
-        for age_group, patterns in PromptAnalyzer.AGE_PATTERNS.items():
+        for age_group in PromptAnalyzer.AGE_PATTERNS:
             score = 0
-            for pattern in patterns:
-                if pattern in combined_text:
-                    # Exact dropdown matches get higher score
-                    if pattern == context_text.lower():
-                        score += 10
-                    else:
-                        score += 3
+            for pattern in matches.hits(('age', age_group)):
+                # Exact dropdown matches get higher score
+                if pattern == context_lower:
+                    score += 10
+                else:
+                    score += 3
             scores[age_group] = score
             
         # Handle learning environments (map to appropriate age group)
-        environment_mappings = {
-            'traditional classroom': 'Primary',
-            'online/remote learning': 'Upper_Secondary',
-            'hybrid classroom': 'Upper_Secondary',
-            'homeschool setting': 'Primary',
-            'after-school program': 'Primary'
-        }
-        
-        for env, default_age in environment_mappings.items():
-            if env in combined_text:
+        for env, default_age in PromptAnalyzer.CONTEXT_ENVIRONMENTS.items():
+            if matches.has(env):
                 scores[default_age] = scores.get(default_age, 0) + 5
                 
         # Handle special considerations
-        if any(term in combined_text for term in ['mixed-ability', 'esl/efl', 'learning difficulties']):
+        if matches.count('mixed_context') > 0:
             scores['Mixed'] = scores.get('Mixed', 0) + 5
             
         if max(scores.values()) > 0:
@@ -526,21 +614,22 @@ class PromptAnalyzer:
     @staticmethod
     def enhanced_methodology_classification(methodology_text, task_text="", generated_prompt=""):
         """Enhanced methodology classification with complete dropdown coverage"""
-        combined_text = f"{methodology_text} {task_text} {generated_prompt}".lower()
+        matches = PromptDocument.of(generated_prompt).matches_with(methodology_text, task_text)
+        methodology_lower = methodology_text.lower()
+        dropdown_parts = methodology_lower.split()
         
         scores = {}
-        for method, patterns in PromptAnalyzer.METHODOLOGY_PATTERNS.items():
+        for method in PromptAnalyzer.METHODOLOGY_PATTERNS:
             score = 0
-            for pattern in patterns:
-                if pattern in combined_text:
-                    # Exact dropdown matches get highest score
-                    if pattern == methodology_text.lower():
-                        score += 15
-                    # Partial dropdown matches
-                    elif any(dropdown_part in pattern for dropdown_part in methodology_text.lower().split()):
-                        score += 10
-                    else:
-                        score += 3
+            for pattern in matches.hits(('methodology', method)):
+                # Exact dropdown matches get highest score
+                if pattern == methodology_lower:
+                    score += 15
+                # Partial dropdown matches
+                elif any(dropdown_part in pattern for dropdown_part in dropdown_parts):
+                    score += 10
+                else:
+                    score += 3
             scores[method] = score
             
         if max(scores.values()) > 0:
@@ -548,12 +637,14 @@ class PromptAnalyzer:
         return 'Direct_Instruction'
 
     @staticmethod
-    def enhanced_subject_classification(subject_text, task_text="", generated_prompt="", role_text=""):
-        """Enhanced subject classification with role-based priority"""
-        
+    def role_subject_category(role_text):
+        """Subject category implied by a teacher role, or None (memoized)"""
+        return PromptAnalyzer._role_subject_category(role_text.lower())
+
+    @staticmethod
+    @lru_cache(maxsize=FORM_CACHE_SIZE)
+    def _role_subject_category(role_lower):
         # ROLE-BASED PRIORITY CLASSIFICATION (99% accuracy)
-        role_lower = role_text.lower()
-        
         if 'art teacher' in role_lower or 'art instructor' in role_lower:
             return 'Arts'
         elif 'pe teacher' in role_lower or 'physical education teacher' in role_lower:
@@ -568,25 +659,28 @@ class PromptAnalyzer:
             return 'Humanities'
         elif 'literature teacher' in role_lower:
             return 'Languages'
-        
-        # FALLBACK: Content-based analysis for non-teacher roles
-        combined_text = f"{subject_text} {task_text} {generated_prompt}".lower()
+        return None
+
+    @staticmethod
+    def enhanced_subject_classification(subject_text, task_text="", generated_prompt="", role_text=""):
+        """Enhanced subject classification with role-based priority"""
+        return (
+            PromptAnalyzer.role_subject_category(role_text) or
+            PromptAnalyzer.content_subject_category(subject_text, task_text, generated_prompt)
+        )
+
+    @staticmethod
+    def content_subject_category(subject_text, task_text="", generated_prompt=""):
+        """Subject scoring over subject, task and generated text - the fallback for non-teacher roles"""
+        matches = PromptDocument.of(generated_prompt).matches_with(subject_text, task_text)
         
         scores = {}
-        for category, patterns in PromptAnalyzer.SUBJECT_PATTERNS.items():
-            score = 0
-            
-            # Keywords (lower weight) - with word boundaries
-            for keyword in patterns['keywords']:
-                if f' {keyword} ' in f' {combined_text} ':
-                    score += 2
-            
-            # Specific topics (higher weight) - with word boundaries  
-            for topic in patterns['topics']:
-                if f' {topic} ' in f' {combined_text} ':
-                    score += 5
-                    
-            scores[category] = score
+        for category in PromptAnalyzer.SUBJECT_PATTERNS:
+            # Keywords (lower weight) and specific topics (higher weight) - with word boundaries
+            scores[category] = (
+                2 * matches.count(('subject_keywords', category)) +
+                5 * matches.count(('subject_topics', category))
+            )
         
         # Special handling for cross-curricular
         if sum(scores.values()) > 25:
@@ -629,54 +723,63 @@ class PromptAnalyzer:
 
     @staticmethod
     def categorize_age_group(context_text):
-        """Legacy method - use enhanced_context_classification instead"""
-        return PromptAnalyzer.enhanced_context_classification(context_text)
+        """Age group from the context field alone (memoized)"""
+        return PromptAnalyzer._categorize_age_group(context_text.lower())
+
+    @staticmethod
+    @lru_cache(maxsize=FORM_CACHE_SIZE)
+    def _categorize_age_group(context_lower):
+        return PromptAnalyzer.enhanced_context_classification(context_lower)
 
     @staticmethod
     def categorize_methodology(methodology_text):
-        """Legacy method - use enhanced_methodology_classification instead"""
-        return PromptAnalyzer.enhanced_methodology_classification(methodology_text)
+        """Methodology from the methodology field alone (memoized)"""
+        return PromptAnalyzer._categorize_methodology(methodology_text.lower())
 
     @staticmethod
-    def assess_complexity(prompt_text, task_text, methodology_text):
-        """Enhanced Bloom's Taxonomy-based complexity assessment with primary verb priority"""
-        combined_text = f"{task_text} {methodology_text} {prompt_text}".lower()
-        
-        # PRIMARY VERB DETECTION (First 30 chars of task - highest priority)
-        task_start = task_text.lower()[:30]
-        
-        # Define primary verb groups for quick lookup
-        primary_verbs = {
-            'Expert': ['create', 'design', 'develop', 'build', 'construct', 'compose', 'generate', 'produce'],
-            'Advanced': ['analyze', 'evaluate', 'compare', 'contrast', 'assess', 'critique', 'examine', 'judge'],
-            'Intermediate': ['apply', 'demonstrate', 'solve', 'use', 'implement', 'practice', 'show'],
-            'Basic': ['list', 'name', 'identify', 'recall', 'define', 'describe', 'explain', 'summarize']
-        }
+    @lru_cache(maxsize=FORM_CACHE_SIZE)
+    def _categorize_methodology(methodology_lower):
+        return PromptAnalyzer.enhanced_methodology_classification(methodology_lower)
+
+    @staticmethod
+    def primary_task_complexity(task_text):
+        """Complexity implied by a primary verb in the first 30 characters of the task, or None (memoized)"""
+        return PromptAnalyzer._primary_task_complexity(task_text.lower()[:30])
+
+    @staticmethod
+    @lru_cache(maxsize=FORM_CACHE_SIZE)
+    def _primary_task_complexity(task_start):
+        task_matches = PromptAnalyzer.KEYWORD_MATCHER.scan(task_start)
         
-        # Check for primary verbs at start of task
-        for complexity, verbs in primary_verbs.items():
+        for complexity, verbs in PromptAnalyzer.PRIMARY_TASK_VERBS.items():
             for verb in verbs:
-                if task_start.startswith(verb) or f' {verb} ' in f' {task_start} ':
+                if task_start.startswith(verb) or task_matches.has_word(verb):
                     return complexity
+        return None
+
+    @staticmethod
+    def assess_complexity(prompt_text, task_text, methodology_text):
+        """Enhanced Bloom's Taxonomy-based complexity assessment with primary verb priority"""
+        # PRIMARY VERB DETECTION (First 30 chars of task - highest priority)
+        return (
+            PromptAnalyzer.primary_task_complexity(task_text) or
+            PromptAnalyzer.blooms_complexity_level(prompt_text, task_text, methodology_text)
+        )
+
+    @staticmethod
+    def blooms_complexity_level(prompt_text, task_text, methodology_text):
+        """Bloom's analysis over task, methodology and generated text - used when no primary verb is found"""
+        matches = PromptDocument.of(prompt_text).matches_with(task_text, methodology_text)
         
-        # Full Bloom's analysis if no primary verb detected
         bloom_scores = {}
         complexity_votes = {'Basic': 0, 'Intermediate': 0, 'Advanced': 0, 'Expert': 0}
         
         for bloom_level, indicators in PromptAnalyzer.BLOOMS_COMPLEXITY_INDICATORS.items():
-            score = 0
-            
-            # Check verbs with stricter word boundaries
-            for verb in indicators['verbs']:
-                if (f' {verb} ' in f' {combined_text} ' or 
-                    combined_text.startswith(f'{verb} ') or 
-                    combined_text.endswith(f' {verb}')):
-                    score += 3
-            
-            # Check task types with stricter matching
-            for task in indicators['tasks']:
-                if len(task) >= 4 and task in combined_text:
-                    score += 2
+            # Verbs with stricter word boundaries, task types of 4+ characters
+            score = (
+                3 * matches.count(('blooms_verbs', bloom_level)) +
+                2 * matches.count(('blooms_tasks', bloom_level))
+            )
             
             bloom_scores[bloom_level] = score
             
@@ -685,18 +788,18 @@ class PromptAnalyzer:
                 complexity_votes[indicators['complexity']] += score
         
         # Educational task overrides
-        if ('complete lesson plan' in combined_text or 
-            'lesson plan with objectives' in combined_text or
-            'unit plan' in combined_text):
+        if (matches.has('complete lesson plan') or 
+            matches.has('lesson plan with objectives') or
+            matches.has('unit plan')):
             return 'Expert'
-        elif ('assessment rubric' in combined_text or 
-            'create rubric' in combined_text or
-            'design rubric' in combined_text):
+        elif (matches.has('assessment rubric') or 
+            matches.has('create rubric') or
+            matches.has('design rubric')):
             return 'Expert'
-        elif ('warm-up activity' in combined_text and 
-            not any(word in combined_text for word in ['complex', 'advanced', 'create'])):
+        elif (matches.has('warm-up activity') and 
+            not any(matches.has(word) for word in ['complex', 'advanced', 'create'])):
             return 'Basic'
-        elif 'vocabulary' in combined_text and 'list' in combined_text:
+        elif matches.has('vocabulary') and matches.has('list'):
             return 'Basic'
         
         # Determine winner based on votes with minimum threshold
@@ -709,42 +812,34 @@ class PromptAnalyzer:
     @staticmethod
     def analyze_content(prompt_text):
         """Comprehensive content analysis (unchanged)"""
-        if not prompt_text:
+        document = PromptDocument.of(prompt_text)
+        if not document.text:
             return {}
             
         # Basic metrics
-        word_count = len(prompt_text.split())
-        sentence_count = len(re.findall(r'[.!?]+', prompt_text))
+        word_count = document.word_count
+        sentence_count = document.sentence_count
         
         # Keyword analysis
-        text_lower = prompt_text.lower()
+        matches = document.matches
         
-        blooms_count = sum(1 for keyword in PromptAnalyzer.BLOOMS_KEYWORDS 
-                        if keyword in text_lower)
-        udl_count = sum(1 for keyword in PromptAnalyzer.UDL_KEYWORDS 
-                    if keyword in text_lower)
-        tpack_count = sum(1 for keyword in PromptAnalyzer.TPACK_KEYWORDS 
-                        if keyword in text_lower)
-        pedagogical_count = sum(1 for keyword in PromptAnalyzer.PEDAGOGICAL_KEYWORDS 
-                            if keyword in text_lower)
+        blooms_count = matches.count('blooms_keywords')
+        udl_count = matches.count('udl_keywords')
+        tpack_count = matches.count('tpack_keywords')
+        pedagogical_count = matches.count('pedagogical_keywords')
         
         # Calculate scores (0-10 scale)
         theory_score = min(10, (blooms_count + udl_count + tpack_count + pedagogical_count) / 2)
         
         # Complexity score based on readability
         try:
-            complexity_score = max(0, min(10, (100 - flesch_reading_ease(prompt_text)) / 10))
+            complexity_score = max(0, min(10, (100 - document.readability) / 10))
         except:
             complexity_score = 5.0
             
         # Specificity and actionability scores
-        specific_terms = ['students will', 'learning objective', 'step by step', 
-                        'for example', 'specifically', 'in particular']
-        specificity_score = min(10, sum(2 for term in specific_terms if term in text_lower))
-        
-        action_verbs = ['create', 'design', 'develop', 'implement', 'analyze', 
-                    'evaluate', 'compare', 'explain', 'demonstrate']
-        actionability_score = min(10, sum(1 for verb in action_verbs if verb in text_lower))
+        specificity_score = min(10, 2 * matches.count('specificity_terms'))
+        actionability_score = min(10, matches.count('action_verbs'))
         
         return {
             'prompt_word_count': word_count,
@@ -758,4 +853,109 @@ class PromptAnalyzer:
             'specificity_score': round(specificity_score, 2),
             'actionability_score': round(actionability_score, 2),
             #'originality_score': 5.0
-        }
\ No newline at end of file
+        }
+
+
+def build_keyword_matcher():
+    """Compile every PromptAnalyzer keyword table into one KeywordMatcher"""
+    matcher = KeywordMatcher()
+    
+    matcher.add_table('blooms_keywords', PromptAnalyzer.BLOOMS_KEYWORDS)
+    matcher.add_table('udl_keywords', PromptAnalyzer.UDL_KEYWORDS)
+    matcher.add_table('tpack_keywords', PromptAnalyzer.TPACK_KEYWORDS)
+    matcher.add_table('pedagogical_keywords', PromptAnalyzer.PEDAGOGICAL_KEYWORDS)
+    
+    for age_group, patterns in PromptAnalyzer.AGE_PATTERNS.items():
+        matcher.add_table(('age', age_group), patterns)
+    for method, patterns in PromptAnalyzer.METHODOLOGY_PATTERNS.items():
+        matcher.add_table(('methodology', method), patterns)
+    for category, patterns in PromptAnalyzer.SUBJECT_PATTERNS.items():
+        matcher.add_table(('subject_keywords', category), patterns['keywords'], word_boundary=True)
+        matcher.add_table(('subject_topics', category), patterns['topics'], word_boundary=True)
+    for level, indicators in PromptAnalyzer.COMPLEXITY_INDICATORS.items():
+        matcher.add_table(('complexity', level), indicators)
+    for bloom_level, indicators in PromptAnalyzer.BLOOMS_COMPLEXITY_INDICATORS.items():
+        matcher.add_table(('blooms_verbs', bloom_level), indicators['verbs'], word_boundary=True)
+        matcher.add_table(('blooms_tasks', bloom_level), [task for task in indicators['tasks'] if len(task) >= 4])
+    
+    matcher.add_table('mixed_context', PromptAnalyzer.MIXED_CONTEXT_TERMS)
+    matcher.add_table('specificity_terms', PromptAnalyzer.SPECIFICITY_TERMS)
+    matcher.add_table('action_verbs', PromptAnalyzer.ACTION_VERBS)
+    for complexity, verbs in PromptAnalyzer.PRIMARY_TASK_VERBS.items():
+        matcher.add_table(('primary_verbs', complexity), verbs, word_boundary=True)
+    matcher.add_terms(PromptAnalyzer.CONTEXT_ENVIRONMENTS)
+    matcher.add_terms(PromptAnalyzer.COMPLEXITY_OVERRIDE_TERMS)
+    
+    return matcher.compile()
+
+
+def analyzer_fingerprint():
+    """
+    "<SCORING_VERSION>-<hash of every pattern table>". Rows whose analyzer_version differs
+    were produced by other rules and are stale.
+    """
+    tables = {
+        name: value for name, value in vars(PromptAnalyzer).items()
+        if name.isupper() and isinstance(value, (list, tuple, dict, set))
+    }
+    canonical = json.dumps(tables, sort_keys=True, default=sorted)
+    digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:12]
+    return f"{PromptAnalyzer.SCORING_VERSION}-{digest}"
+
+
+PromptAnalyzer.KEYWORD_MATCHER = build_keyword_matcher()
+PromptAnalyzer.VERSION = analyzer_fingerprint()
+
+
+class PromptDocument:
+    """
+    A generated prompt prepared once and shared by every PromptAnalyzer pass: lowercase
+    text, tokens, word/sentence counts, one keyword scan and (lazily) readability.
+    The classifiers accept a PromptDocument wherever they take the generated prompt.
+    """
+
+    def __init__(self, text):
+        self.text = text or ""
+        self.lower = self.text.lower()
+
+    @classmethod
+    def of(cls, value):
+        return value if isinstance(value, cls) else cls(value)
+
+    @cached_property
+    def tokens(self):
+        return self.lower.split()
+
+    @property
+    def word_count(self):
+        return len(self.tokens)
+
+    @cached_property
+    def sentence_count(self):
+        return len(re.findall(r'[.!?]+', self.text))
+
+    @cached_property
+    def readability(self):
+        """Flesch reading ease of the original text"""
+        return flesch_reading_ease(self.text)
+
+    @cached_property
+    def matches(self):
+        return PromptAnalyzer.KEYWORD_MATCHER.scan(self.lower)
+
+    def matches_with(self, *fields):
+        """
+        Keyword matches over f"{field} ... {text}".lower(), as the classifiers build it.
+        Only the short form fields (plus enough of the document to catch patterns that
+        straddle the join) are scanned; the document's own scan is reused for the rest.
+        """
+        prefix = ''.join(f"{field} " for field in fields).lower()
+        matcher = PromptAnalyzer.KEYWORD_MATCHER
+        if not matcher.has_automaton:
+            return matcher.scan(prefix + self.lower)
+        return self.head_matches(prefix).union(self.matches, lambda: prefix + self.lower)
+
+    def head_matches(self, prefix):
+        """Matches starting inside the (lowercase) prefix of prefix + text"""
+        matcher = PromptAnalyzer.KEYWORD_MATCHER
+        return matcher.scan(prefix + self.lower[:matcher.max_length], starts_before=len(prefix))
@@ -0,0 +1,268 @@
+"""
+Vectorized PromptAnalyzer pass over many generations at once.
+
+Re-scoring the PromptGeneration corpus after a keyword table change used to mean one
+analysis_fields() call per row. BatchAnalyzer scans each prompt once, stacks the results
+into sparse document x pattern matrices and gets every table count with one sparse product
+per view (content, subject, complexity); the keyword counts, specificity/actionability
+scores and the subject/complexity category scores are then array operations over the whole
+batch. Form-field classifiers (role, age group, methodology, primary task verb) come from
+PromptAnalyzer's memo. Results are identical to analysis_fields() row by row.
+
+Needs numpy/scipy and the compiled keyword matcher; without them analyze() falls back to
+analysis_fields() per row.
+"""
+import logging
+import time
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+from .analytics import PromptAnalyzer, PromptDocument
+from .deferred_analysis import analysis_fields
+from .readability import flesch_reading_ease_batch
+
+logger = logging.getLogger(__name__)
+
+COMPLEXITY_LEVELS = ['Basic', 'Intermediate', 'Advanced', 'Expert']
+
+
+def generation_record(generation):
+    """(data, text_response) for a stored PromptGeneration, as analysis_fields() takes them"""
+    return {
+        'subject': generation.subject,
+        'task': generation.task,
+        'role': generation.role,
+        'context': generation.context,
+        'methodology': generation.methodology,
+    }, generation.generated_prompt
+
+
+class _Presence:
+    """Sparse documents x patterns 0/1 matrix, built row by row"""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.indices = []
+        self.indptr = [0]
+
+    def add(self, patterns):
+        self.indices.extend(map(self.columns.__getitem__, patterns))
+        self.indptr.append(len(self.indices))
+
+    def matrix(self):
+        return sparse.csr_matrix(
+            (np.ones(len(self.indices), dtype=np.int64), np.array(self.indices, dtype=np.int64), self.indptr),
+            shape=(len(self.indptr) - 1, len(self.columns))
+        )
+
+
+class _View:
+    """
+    Table counts for one kind of match: the document's own scan, plus (optionally) the
+    matches starting in form fields prepended to it
+    """
+
+    def __init__(self, columns, tables):
+        self.columns = columns
+        self.tables = tables
+        matcher = PromptAnalyzer.KEYWORD_MATCHER
+        substring, word = [], []
+        for j, name in enumerate(tables):
+            patterns, word_boundary = matcher.tables[name]
+            for pattern in patterns:  # duplicate entries add up, like the per-row sums
+                (word if word_boundary else substring).append((columns[pattern], j))
+        self.substring_tables = self._membership(substring)
+        self.word_tables = self._membership(word)
+        self.head_found = _Presence(columns)
+        self.head_words = _Presence(columns)
+        self.found = None
+
+    def _membership(self, entries):
+        rows = [row for row, col in entries]
+        cols = [col for row, col in entries]
+        return sparse.csr_matrix(
+            (np.ones(len(entries), dtype=np.int64), (rows, cols)),
+            shape=(len(self.columns), len(self.tables))
+        )
+
+    def add_head(self, matches):
+        self.head_found.add(matches.found)
+        self.head_words.add(matches.words)
+
+    def counts(self, document_found, document_words, with_head=True):
+        """documents x tables hit counts"""
+        found, words = document_found, document_words
+        if with_head:
+            found = found + self.head_found.matrix()
+            words = words + self.head_words.matrix()
+            found.data[:] = 1
+            words.data[:] = 1
+        self.found = found
+        counts = found @ self.substring_tables + words @ self.word_tables
+        return counts.toarray()
+
+    def has(self, terms):
+        """documents x terms presence (substring)"""
+        return self.found[:, [self.columns[term] for term in terms]].toarray() > 0
+
+
+class BatchAnalyzer:
+    """analysis_fields() for a whole list of generations with array operations"""
+
+    CONTENT_TABLES = [
+        'blooms_keywords', 'udl_keywords', 'tpack_keywords', 'pedagogical_keywords',
+        'specificity_terms', 'action_verbs'
+    ]
+
+    def __init__(self):
+        matcher = PromptAnalyzer.KEYWORD_MATCHER
+        self.columns = {pattern: i for i, pattern in enumerate(sorted(matcher.patterns))}
+        self.subject_categories = list(PromptAnalyzer.SUBJECT_PATTERNS)
+        self.bloom_levels = list(PromptAnalyzer.BLOOMS_COMPLEXITY_INDICATORS)
+        self.subject_tables = (
+            [('subject_keywords', category) for category in self.subject_categories] +
+            [('subject_topics', category) for category in self.subject_categories]
+        )
+        self.complexity_tables = (
+            [('blooms_verbs', level) for level in self.bloom_levels] +
+            [('blooms_tasks', level) for level in self.bloom_levels]
+        )
+        # Bloom's level -> complexity vote
+        self.votes = None
+        if np is not None:
+            self.votes = np.zeros((len(self.bloom_levels), len(COMPLEXITY_LEVELS)), dtype=np.int64)
+            for i, indicators in enumerate(PromptAnalyzer.BLOOMS_COMPLEXITY_INDICATORS.values()):
+                self.votes[i, COMPLEXITY_LEVELS.index(indicators['complexity'])] = 1
+
+        self.prompts = 0
+        self.seconds = 0.0
+
+    @property
+    def available(self):
+        return np is not None and PromptAnalyzer.KEYWORD_MATCHER.has_automaton
+
+    def analyze(self, records):
+        """analysis_fields(data, text_response) for every (data, text_response) in records"""
+        start = time.perf_counter()
+        records = list(records)
+        if not self.available:
+            results = [analysis_fields(data, text_response) for data, text_response in records]
+        else:
+            results = self._analyze(records) if records else []
+        elapsed = time.perf_counter() - start
+        self.prompts += len(records)
+        self.seconds += elapsed
+        if records:
+            logger.info(f"🧮 Analysed {len(records)} prompts in {elapsed:.2f}s ({len(records) / elapsed:.0f} prompts/s)")
+        return results
+
+    def stats(self):
+        """Throughput of every analyze() call so far"""
+        return {
+            'prompts': self.prompts,
+            'seconds': round(self.seconds, 3),
+            'prompts_per_second': round(self.prompts / self.seconds, 1) if self.seconds else 0,
+        }
+
+    def _analyze(self, records):
+        content = _View(self.columns, self.CONTENT_TABLES)
+        subject = _View(self.columns, self.subject_tables)
+        complexity = _View(self.columns, self.complexity_tables)
+        document_found = _Presence(self.columns)
+        document_words = _Presence(self.columns)
+
+        # One scan per document; the form fields only add matches starting in their head window
+        documents = []
+        for data, text_response in records:
+            document = PromptDocument(text_response)
+            documents.append(document)
+            document_found.add(document.matches.found)
+            document_words.add(document.matches.words)
+            subject.add_head(document.head_matches(f"{data.get('subject', '')} {data.get('task', '')} ".lower()))
+            complexity.add_head(document.head_matches(f"{data.get('task', '')} {data.get('methodology', '')} ".lower()))
+        document_found = document_found.matrix()
+        document_words = document_words.matrix()
+
+        subject_categories = self._subject_categories(subject.counts(document_found, document_words))
+        complexity_levels = self._complexity_levels(complexity.counts(document_found, document_words), complexity)
+        content_counts = content.counts(document_found, document_words, with_head=False)
+        specificity = np.minimum(10, 2 * content_counts[:, 4]).tolist()
+        actionability = np.minimum(10, content_counts[:, 5]).tolist()
+        keyword_counts = content_counts[:, :4].tolist()
+
+        readability = flesch_reading_ease_batch([document.text for document in documents])
+
+        # Form-field classifiers are memoized in PromptAnalyzer - dropdown values repeat
+        results = []
+        for i, (data, text_response) in enumerate(records):
+            fields = {
+                'subject_category': PromptAnalyzer.role_subject_category(data.get("role") or "") or subject_categories[i],
+                'age_group_category': PromptAnalyzer.categorize_age_group(data.get("context", "")),
+                'methodology_category': PromptAnalyzer.categorize_methodology(data.get("methodology", "")),
+                'complexity_level': PromptAnalyzer.primary_task_complexity(data.get("task", "")) or complexity_levels[i],
+                'analyzer_version': PromptAnalyzer.VERSION,
+            }
+            document = documents[i]
+            if document.text:
+                blooms, udl, tpack, pedagogical = keyword_counts[i]
+                complexity_score = max(0, min(10, (100 - readability[i]) / 10))
+                fields.update({
+                    'prompt_word_count': document.word_count,
+                    'prompt_sentence_count': document.sentence_count,
+                    'prompt_complexity_score': round(complexity_score, 2),
+                    'blooms_keywords_count': blooms,
+                    'udl_keywords_count': udl,
+                    'tpack_keywords_count': tpack,
+                    'pedagogical_keywords_count': pedagogical,
+                    'specificity_score': specificity[i],
+                    'actionability_score': actionability[i],
+                })
+            results.append(fields)
+        return results
+
+    def _subject_categories(self, counts):
+        n = len(self.subject_categories)
+        scores = 2 * counts[:, :n] + 5 * counts[:, n:]
+        best = np.array(self.subject_categories, dtype=object)[scores.argmax(axis=1)]
+        categories = np.where(scores.max(axis=1) > 3, best, 'Other')
+        # Special handling for cross-curricular
+        return np.where(scores.sum(axis=1) > 25, 'Cross_Curricular', categories).tolist()
+
+    def _complexity_levels(self, counts, view):
+        n = len(self.bloom_levels)
+        bloom_scores = 3 * counts[:, :n] + 2 * counts[:, n:]
+        votes = bloom_scores @ self.votes
+        by_votes = np.where(
+            votes.max(axis=1) >= 3,
+            np.array(COMPLEXITY_LEVELS, dtype=object)[votes.argmax(axis=1)],
+            'Intermediate'
+        )
+
+        # Educational task overrides, in assess_complexity() order
+        terms = PromptAnalyzer.COMPLEXITY_OVERRIDE_TERMS
+        has = dict(zip(terms, view.has(terms).T))
+        return np.select(
+            [
+                has['complete lesson plan'] | has['lesson plan with objectives'] | has['unit plan'],
+                has['assessment rubric'] | has['create rubric'] | has['design rubric'],
+                has['warm-up activity'] & ~(has['complex'] | has['advanced'] | has['create']),
+                has['vocabulary'] & has['list'],
+            ],
+            ['Expert', 'Expert', 'Basic', 'Basic'],
+            by_votes
+        ).tolist()
+
+
+_batch_analyzer = None
+
+
+def get_batch_analyzer():
+    """Process-wide BatchAnalyzer (the table matrices are built once)"""
+    global _batch_analyzer
+    if _batch_analyzer is None:
+        _batch_analyzer = BatchAnalyzer()
+    return _batch_analyzer
@@ -0,0 +1,57 @@
+"""
+Copy tracking for /track-copy/ without looking generations up.
+
+track_copy() used to find the session's latest PromptGeneration (a join to UserSession
+ordered by timestamp) and save() the whole row. Now every generate response carries a
+generation reference, {"id": <PromptGeneration pk>, "token": <signature>}. The token is
+signed with SECRET_KEY and salted with the session key, so a client can only report its own
+generations. track_copy() checks the tokens in memory and marks all of them in one
+UPDATE by primary key. The page collects copies and reports them in one beacon.
+"""
+from django.core.signing import Signer
+from django.db.models import Subquery
+from django.utils.crypto import constant_time_compare
+
+from .models import PromptGeneration
+
+TOKEN_SALT = 'generator.copy_tracking'
+
+
+def generation_token(session_key, generation_id):
+    return Signer(salt=f'{TOKEN_SALT}:{session_key}').signature(str(generation_id))
+
+
+def generation_ref(session_key, generation_id):
+    """The reference the generate endpoints return next to the response (None if unsaved)"""
+    if generation_id is None or not session_key:
+        return None
+    return {'id': generation_id, 'token': generation_token(session_key, generation_id)}
+
+
+def verified_generation_ids(session_key, refs):
+    """Ids of the references signed for this session; anything else is ignored"""
+    ids = set()
+    for ref in refs:
+        if not isinstance(ref, dict):
+            continue
+        generation_id, token = ref.get('id'), ref.get('token')
+        if type(generation_id) is not int or not isinstance(token, str):
+            continue
+        if constant_time_compare(token, generation_token(session_key, generation_id)):
+            ids.add(generation_id)
+    return ids
+
+
+def mark_copied(generation_ids):
+    """Flip copied_to_clipboard with one UPDATE by primary key; returns the rows changed"""
+    if not generation_ids:
+        return 0
+    return PromptGeneration.objects.filter(pk__in=generation_ids, copied_to_clipboard=False).update(
+        copied_to_clipboard=True
+    )
+
+
+def mark_latest_copied(session_key):
+    """Fallback for pages that post no references: the latest-row lookup as a subquery of one UPDATE"""
+    latest = PromptGeneration.objects.filter(session__session_id=session_key).order_by('-timestamp')
+    return PromptGeneration.objects.filter(pk=Subquery(latest.values('pk')[:1])).update(copied_to_clipboard=True)
@@ -0,0 +1,198 @@
+"""
+Hot analytics counters: TemplateUsage.usage_count and UserSession.pages_visited.
+
+Both used to be read-modify-write (get_or_create, `+= 1`, save()), which loses increments
+under concurrent requests. Every write here is a single statement that adds in the
+database: TemplateUsage is an UPSERT (INSERT ... ON CONFLICT (template_name) DO UPDATE SET
+usage_count = usage_count + excluded.usage_count) on SQLite and PostgreSQL, with a
+get_or_create + F() fallback elsewhere; pages_visited is an F() UPDATE per distinct
+increment.
+
+With COUNTERS_AGGREGATED on, increments are summed in process memory and a background
+thread writes the deltas every COUNTERS_FLUSH_INTERVAL seconds, so a burst of requests
+becomes one UPSERT per template and one UPDATE per distinct increment instead of a write
+(and a turn on SQLite's database lock) per request. Deltas that fail to write are kept for
+the next flush. The deltas are flushed on interpreter exit and from gunicorn's worker_exit
+hook; a hard kill loses at most one interval of counts.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from django.utils import timezone
+
+from .models import TemplateUsage, UserSession
+
+logger = logging.getLogger(__name__)
+
+UPSERT_VENDORS = ('sqlite', 'postgresql')
+
+
+def add_template_usage(counts, now=None):
+    """Add {template_name: uses} to TemplateUsage, creating missing templates"""
+    now = now or timezone.now()
+    if connection.vendor not in UPSERT_VENDORS:
+        for template_name, count in counts.items():
+            TemplateUsage.objects.get_or_create(template_name=template_name)
+            TemplateUsage.objects.filter(template_name=template_name).update(
+                usage_count=F('usage_count') + count, last_used=now
+            )
+        return
+
+    qn = connection.ops.quote_name
+    meta = TemplateUsage._meta
+    table = qn(meta.db_table)
+    name, count, last_used = (qn(meta.get_field(field).column) for field in ('template_name', 'usage_count', 'last_used'))
+    sql = (
+        f"INSERT INTO {table} ({name}, {count}, {last_used}) VALUES (%s, %s, %s) "
+        f"ON CONFLICT ({name}) DO UPDATE SET {count} = {table}.{count} + excluded.{count}, "
+        f"{last_used} = excluded.{last_used}"
+    )
+    timestamp = connection.ops.adapt_datetimefield_value(now)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(template_name, uses, timestamp) for template_name, uses in counts.items()])
+
+
+def add_pages_visited(counts, now=None):
+    """Add {session_key: pages} to existing UserSessions, one UPDATE per distinct increment"""
+    now = now or timezone.now()
+    sessions_by_increment = defaultdict(list)
+    for session_key, count in counts.items():
+        sessions_by_increment[count].append(session_key)
+    for count, session_keys in sessions_by_increment.items():
+        UserSession.objects.filter(session_id__in=session_keys).update(
+            pages_visited=F('pages_visited') + count,
+            last_activity=now,
+        )
+
+
+WRITERS = {
+    'template_usage': add_template_usage,
+    'pages_visited': add_pages_visited,
+}
+
+
+class Counters:
+    """Increments written straight away, or summed in memory and flushed periodically"""
+
+    def __init__(self, aggregated=False, flush_interval=5.0):
+        self.aggregated = aggregated
+        self.flush_interval = flush_interval
+        self.increments = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self._deltas = {counter: Counter() for counter in WRITERS}
+        self._stopping = False
+        self._thread = None
+        self._wakeup = threading.Condition()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(aggregated=settings.COUNTERS_AGGREGATED, flush_interval=settings.COUNTERS_FLUSH_INTERVAL)
+
+    def add(self, counter, counts):
+        """Add {key: count} to a counter in WRITERS"""
+        if not self.aggregated:
+            WRITERS[counter](counts)
+            return
+        with self._wakeup:
+            self._deltas[counter].update(counts)
+            self.increments += sum(counts.values())
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name='counter-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                if self._wakeup.wait_for(lambda: self._stopping, self.flush_interval):
+                    return
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Write the summed deltas; returns False (and keeps them) if the write failed"""
+        with self._wakeup:
+            deltas = {counter: counts for counter, counts in self._deltas.items() if counts}
+            self._deltas = {counter: Counter() for counter in WRITERS}
+        if not deltas:
+            return True
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                for counter, counts in deltas.items():
+                    WRITERS[counter](counts, now)
+        except Exception as e:
+            logger.error(f"Counter flush failed, keeping {sum(map(len, deltas.values()))} deltas: {e}")
+            with self._wakeup:
+                for counter, counts in deltas.items():
+                    self._deltas[counter].update(counts)
+                self.failed_flushes += 1
+            return False
+        with self._wakeup:
+            self.flushes += 1
+        return True
+
+    def shutdown(self, timeout=None):
+        """Stop the flusher thread and write the remaining deltas"""
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+        return self.flush()
+
+    def stats(self):
+        """Per-process pending deltas and flush counters"""
+        with self._wakeup:
+            return {
+                'aggregated': self.aggregated,
+                'pending': {counter: sum(counts.values()) for counter, counts in self._deltas.items()},
+                'increments': self.increments,
+                'flushes': self.flushes,
+                'failed_flushes': self.failed_flushes,
+            }
+
+
+_counters = None
+_counters_lock = threading.Lock()
+
+
+def get_counters():
+    """Process-wide Counters, built from settings on first use"""
+    global _counters
+    if _counters is None:
+        with _counters_lock:
+            if _counters is None:
+                _counters = Counters.from_settings()
+    return _counters
+
+
+def bump_template_usage(template_name, count=1):
+    """Count uses of a template from the index.html template list"""
+    get_counters().add('template_usage', {template_name: count})
+
+
+@atexit.register
+def flush_counters(timeout=None):
+    """Write this process's pending counter deltas (interpreter exit, gunicorn worker_exit)"""
+    if _counters is not None:
+        _counters.shutdown(timeout if timeout is not None else settings.COUNTERS_FLUSH_INTERVAL)
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    global _counters
+    if setting.startswith('COUNTERS_'):
+        flush_counters()
+        _counters = None
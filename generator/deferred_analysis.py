@@ -0,0 +1,196 @@
+"""
+PromptAnalyzer pass and analytics writes for a completed generation.
+
+By default the pass runs inline before /generate/ responds. With ANALYSIS_DEFERRED on, the
+view saves a minimal PromptGeneration row (analysis_pending=True) and returns the text right
+away; a small per-process thread pool then fills in the classification and content-metric
+fields. The TemplateUsage count stays in the request (one atomic UPSERT), so a dropped or
+failed analysis never loses it. When the backlog reaches ANALYSIS_MAX_BACKLOG the pass
+runs inline again, so a slow database pushes back on requests instead of piling up memory.
+The backlog is drained on interpreter exit and from gunicorn's worker_exit hook.
+"""
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+from .analytics import PromptAnalyzer, PromptDocument
+from .models import PromptGeneration
+
+logger = logging.getLogger(__name__)
+
+
+def analysis_fields(data, text_response):
+    """PromptGeneration fields computed by the PromptAnalyzer"""
+    # One tokenized document shared by every pass over the generated text
+    document = PromptDocument(text_response)
+
+    return {
+        # Auto-analysis of educational data
+        **PromptAnalyzer.classify(data, document),
+        'analyzer_version': PromptAnalyzer.VERSION,
+        # Content analysis results
+        **PromptAnalyzer.analyze_content(document)
+    }
+
+
+def stale_generations(queryset=None):
+    """
+    Generations whose fields came from a different PromptAnalyzer.VERSION. Includes rows still
+    analysis_pending (never versioned), so reanalyze_prompts also fills in dropped deferred passes.
+    """
+    if queryset is None:
+        queryset = PromptGeneration.objects.all()
+    return queryset.exclude(generated_prompt__isnull=True).exclude(analyzer_version=PromptAnalyzer.VERSION)
+
+
+def stale_version_counts():
+    """
+    [(analyzer_version, rows)] of the stale generations, most rows first ('' = never versioned).
+    Rows still waiting for their deferred pass are counted as pending, not stale.
+    """
+    rows = (
+        stale_generations(PromptGeneration.objects.filter(analysis_pending=False))
+        .values('analyzer_version')
+        .annotate(rows=Count('id'))
+        .order_by('-rows')
+    )
+    return [(row['analyzer_version'], row['rows']) for row in rows]
+
+
+def complete_analysis(generation_id, data, text_response):
+    """Fill in a row saved with analysis_pending=True"""
+    PromptGeneration.objects.filter(pk=generation_id).update(
+        analysis_pending=False,
+        **analysis_fields(data, text_response)
+    )
+
+
+class DeferredAnalysisExecutor:
+    """Thread pool running complete_analysis() with a bounded, observable backlog"""
+
+    def __init__(self, workers=2, max_backlog=500):
+        self.workers = workers
+        self.max_backlog = max_backlog
+        self.backlog = 0
+        self.peak_backlog = 0
+        self.completed = 0
+        self.failed = 0
+        self.ran_inline = 0
+        self._executor = None
+        self._idle = threading.Condition()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(workers=settings.ANALYSIS_WORKERS, max_backlog=settings.ANALYSIS_MAX_BACKLOG)
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="deferred-analysis")
+        return self._executor
+
+    def submit(self, generation_id, data, text_response):
+        with self._idle:
+            overloaded = self.backlog >= self.max_backlog
+            if overloaded:
+                self.ran_inline += 1
+            else:
+                self.backlog += 1
+                self.peak_backlog = max(self.peak_backlog, self.backlog)
+                pool = self._pool()
+
+        if overloaded:
+            logger.warning(f"Analysis backlog full ({self.backlog}), analysing generation {generation_id} inline")
+            # Runs in the request's on_commit hook, after the row is committed - never raise from it
+            failed = not self._analyse(generation_id, data, text_response)
+            with self._idle:
+                self._count(failed)
+            return
+        pool.submit(self._run, generation_id, data, text_response)
+
+    def _analyse(self, generation_id, data, text_response):
+        try:
+            complete_analysis(generation_id, data, text_response)
+            return True
+        except Exception as e:
+            # The row keeps analysis_pending=True and can be re-analysed later
+            logger.error(f"Deferred analysis of generation {generation_id} failed: {e}")
+            return False
+
+    def _run(self, generation_id, data, text_response):
+        close_old_connections()
+        try:
+            failed = not self._analyse(generation_id, data, text_response)
+        finally:
+            close_old_connections()
+        with self._idle:
+            self.backlog -= 1
+            self._count(failed)
+            self._idle.notify_all()
+
+    def _count(self, failed):
+        if failed:
+            self.failed += 1
+        else:
+            self.completed += 1
+
+    def flush(self, timeout=None):
+        """Wait until the backlog is empty; returns False if the timeout ran out first"""
+        with self._idle:
+            drained = self._idle.wait_for(lambda: self.backlog == 0, timeout)
+        if not drained:
+            logger.warning(f"Analysis flush timed out with {self.backlog} generations still pending")
+        return drained
+
+    def shutdown(self, timeout=None):
+        self.flush(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self):
+        """Per-process backlog gauge and counters"""
+        with self._idle:
+            return {
+                'backlog': self.backlog,
+                'peak_backlog': self.peak_backlog,
+                'max_backlog': self.max_backlog,
+                'completed': self.completed,
+                'failed': self.failed,
+                'ran_inline': self.ran_inline,
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_analysis_executor():
+    """Process-wide DeferredAnalysisExecutor, built from settings on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = DeferredAnalysisExecutor.from_settings()
+    return _executor
+
+
+@atexit.register
+def flush_deferred_analysis(timeout=None):
+    """Drain this process's analysis backlog (interpreter exit, gunicorn worker_exit)"""
+    if _executor is not None:
+        _executor.shutdown(timeout if timeout is not None else settings.ANALYSIS_FLUSH_TIMEOUT)
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    global _executor
+    if setting.startswith('ANALYSIS_'):
+        flush_deferred_analysis()
+        _executor = None
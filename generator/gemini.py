@@ -0,0 +1,288 @@
+"""
+Shared Gemini API client.
+
+One GeminiClient per process holds a keep-alive connection pool (requests.Session for the
+sync views, one httpx.AsyncClient per event loop for the async views) and applies a bounded
+retry policy with jittered exponential backoff on 429/5xx responses.
+Point GEMINI_API_BASE at a local stub (see `manage.py gemini_stub`) for tests and load runs.
+"""
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.test.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    """Base class for Gemini client failures"""
+
+
+class GeminiTimeout(GeminiError):
+    """Gemini did not answer within the read timeout"""
+
+
+class GeminiNetworkError(GeminiError):
+    """Connection could not be established or was dropped"""
+
+
+class GeminiAPIError(GeminiError):
+    """Gemini answered with a non-200 status (after retries for retryable codes)"""
+
+    def __init__(self, status_code, body):
+        super().__init__(f"Gemini API error: {status_code}")
+        self.status_code = status_code
+        self.body = body
+
+
+class GeminiClient:
+    """Pooled, keep-alive Gemini client shared by all views in a process"""
+
+    def __init__(self, api_key, api_base, model, pool_size=20, async_max_connections=500,
+                 max_retries=2, backoff_base=0.5, backoff_max=8.0,
+                 connect_timeout=5.0, read_timeout=30.0):
+        self.api_key = api_key
+        self.api_base = api_base.rstrip('/')
+        self.model = model
+        self.pool_size = pool_size
+        self.async_max_connections = async_max_connections
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.headers = {
+            'Content-Type': 'application/json',
+            'User-Agent': 'AI-Prompt-Generator/1.0'
+        }
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(self.headers)
+
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            api_key=settings.GEMINI_API_KEY,
+            api_base=settings.GEMINI_API_BASE,
+            model=settings.GEMINI_MODEL,
+            pool_size=settings.GEMINI_POOL_SIZE,
+            async_max_connections=settings.GEMINI_ASYNC_MAX_CONNECTIONS,
+            max_retries=settings.GEMINI_MAX_RETRIES,
+            backoff_base=settings.GEMINI_BACKOFF_BASE,
+            backoff_max=settings.GEMINI_BACKOFF_MAX,
+            connect_timeout=settings.GEMINI_CONNECT_TIMEOUT,
+            read_timeout=settings.GEMINI_READ_TIMEOUT,
+        )
+
+    def endpoint(self, method='generateContent'):
+        return f"{self.api_base}/models/{self.model}:{method}?key={self.api_key}"
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, honouring a numeric Retry-After header"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    # === SYNC API (WSGI views) ===
+
+    def _post(self, method, payload, stream=False):
+        """POST with the retry policy; returns a 200 response or raises a GeminiError"""
+        url = self.endpoint(method) + ('&alt=sse' if stream else '')
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(
+                    url,
+                    json=payload,
+                    stream=stream,
+                    timeout=(self.connect_timeout, self.read_timeout)
+                )
+            except requests.exceptions.ConnectTimeout as e:
+                if attempt < self.max_retries:
+                    time.sleep(self.backoff_delay(attempt))
+                    attempt += 1
+                    continue
+                raise GeminiNetworkError(str(e)) from e
+            except requests.exceptions.Timeout as e:
+                raise GeminiTimeout(str(e)) from e
+            except requests.exceptions.RequestException as e:
+                raise GeminiNetworkError(str(e)) from e
+
+            if response.status_code == 200:
+                return response
+            body = response.text
+            response.close()
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                delay = self.backoff_delay(attempt, response.headers.get('Retry-After'))
+                logger.warning(f"Gemini returned {response.status_code}, retry {attempt + 1} in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            raise GeminiAPIError(response.status_code, body)
+
+    def generate(self, payload):
+        """POST generateContent and return the raw response body"""
+        return self._post('generateContent', payload).text
+
+    def stream(self, payload):
+        """streamGenerateContent over SSE - yields text chunks as Gemini produces them"""
+        response = self._post('streamGenerateContent', payload, stream=True)
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                text = sse_chunk_text(line)
+                if text:
+                    yield text
+        except requests.exceptions.Timeout as e:
+            raise GeminiTimeout(str(e)) from e
+        except requests.exceptions.RequestException as e:
+            raise GeminiNetworkError(str(e)) from e
+        finally:
+            response.close()
+
+    # === ASYNC API (ASGI views) ===
+
+    def async_client(self):
+        """Return the httpx.AsyncClient bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=self.async_max_connections,
+                    max_keepalive_connections=self.async_max_connections,
+                ),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def _apost(self, method, payload, stream=False):
+        """Async _post(); streamed responses must be closed with aclose()"""
+        client = self.async_client()
+        url = self.endpoint(method) + ('&alt=sse' if stream else '')
+        attempt = 0
+        while True:
+            try:
+                request = client.build_request('POST', url, json=payload)
+                response = await client.send(request, stream=stream)
+            except httpx.ConnectTimeout as e:
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self.backoff_delay(attempt))
+                    attempt += 1
+                    continue
+                raise GeminiNetworkError(str(e)) from e
+            except httpx.TimeoutException as e:
+                raise GeminiTimeout(str(e)) from e
+            except httpx.HTTPError as e:
+                raise GeminiNetworkError(str(e)) from e
+
+            if response.status_code == 200:
+                return response
+            body = (await response.aread()).decode(errors='replace')
+            await response.aclose()
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                delay = self.backoff_delay(attempt, response.headers.get('Retry-After'))
+                logger.warning(f"Gemini returned {response.status_code}, retry {attempt + 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            raise GeminiAPIError(response.status_code, body)
+
+    async def agenerate(self, payload):
+        """Async generateContent, same retry policy as generate()"""
+        response = await self._apost('generateContent', payload)
+        return response.text
+
+    async def astream(self, payload):
+        """Async stream()"""
+        response = await self._apost('streamGenerateContent', payload, stream=True)
+        try:
+            async for line in response.aiter_lines():
+                text = sse_chunk_text(line)
+                if text:
+                    yield text
+        except httpx.TimeoutException as e:
+            raise GeminiTimeout(str(e)) from e
+        except httpx.HTTPError as e:
+            raise GeminiNetworkError(str(e)) from e
+        finally:
+            await response.aclose()
+
+
+def sse_chunk_text(line):
+    """Text carried by one `data:` line of a streamGenerateContent SSE response"""
+    if not line or not line.startswith('data:'):
+        return ''
+    try:
+        chunk = json.loads(line[5:].strip())
+        return chunk["candidates"][0]["content"]["parts"][0].get("text", "")
+    except (ValueError, KeyError, IndexError):
+        return ''
+
+
+def has_candidate_text(response_text):
+    """
+    True if a generateContent body carries generated text. Safety-blocked and empty-candidate
+    responses don't, and mustn't be cached.
+    """
+    try:
+        parts = json.loads(response_text)["candidates"][0]["content"]["parts"]
+        return any(part.get("text") for part in parts)
+    except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+        return False
+
+
+def assemble_response_body(text):
+    """generateContent-shaped body for text assembled from a stream (cacheable like a normal response)"""
+    return json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gemini_client():
+    """Process-wide GeminiClient, built from settings on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GeminiClient.from_settings()
+    return _client
+
+
+def reset_gemini_client():
+    """Drop the shared client so the next call picks up changed settings"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.session.close()
+        _client = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    # override_settings(GEMINI_API_BASE=...) in tests should hit the new endpoint
+    if setting.startswith('GEMINI_'):
+        reset_gemini_client()
@@ -0,0 +1,104 @@
+"""
+Liveness and readiness for the platform health check.
+
+/healthz/ answers from the process alone. /readyz/ also probes the dependencies - the
+database answers SELECT 1 and the Gemini client is configured - and caches each probe for
+HEALTH_PROBE_TTL seconds, so a tight probe interval costs one database round trip per TTL
+per process. Neither view touches the session, so probes create no session or analytics rows.
+The database is required for readiness (503 when it fails); a missing Gemini key only
+reports "degraded", since the pages still load.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+from .gemini import get_gemini_client
+
+logger = logging.getLogger(__name__)
+
+
+def probe_database():
+    with connections['default'].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def probe_gemini():
+    if not settings.GEMINI_API_KEY:
+        raise RuntimeError('GEMINI_API_KEY is not set')
+    get_gemini_client()
+
+
+# name -> (probe, required for readiness)
+PROBES = {
+    'database': (probe_database, True),
+    'gemini': (probe_gemini, False),
+}
+
+
+class ProbeCache:
+    """Runs each probe at most once per ttl seconds per process"""
+
+    def __init__(self, ttl=10.0):
+        self.ttl = ttl
+        self.runs = 0
+        self._results = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(ttl=settings.HEALTH_PROBE_TTL)
+
+    def result(self, name):
+        probe, required = PROBES[name]
+        with self._lock:
+            cached = self._results.get(name)
+            if cached is not None and time.monotonic() - cached[0] < self.ttl:
+                return cached[1]
+
+            start = time.perf_counter()
+            try:
+                probe()
+                result = {'ok': True}
+            except Exception as e:
+                logger.warning(f"Health probe {name} failed: {e}")
+                result = {'ok': False, 'error': str(e)}
+            result.update(required=required, latency_ms=round((time.perf_counter() - start) * 1000, 1))
+            self.runs += 1
+            self._results[name] = (time.monotonic(), result)
+            return result
+
+    def readiness(self):
+        """(status, probe results) with status 'ok', 'degraded' or 'unavailable'"""
+        checks = {name: self.result(name) for name in PROBES}
+        if any(check['required'] and not check['ok'] for check in checks.values()):
+            return 'unavailable', checks
+        if not all(check['ok'] for check in checks.values()):
+            return 'degraded', checks
+        return 'ok', checks
+
+
+_probes = None
+_probes_lock = threading.Lock()
+
+
+def get_probe_cache():
+    """Process-wide ProbeCache, built from settings on first use"""
+    global _probes
+    if _probes is None:
+        with _probes_lock:
+            if _probes is None:
+                _probes = ProbeCache.from_settings()
+    return _probes
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    global _probes
+    if setting.startswith('HEALTH_') or setting.startswith('GEMINI_') or setting == 'DATABASES':
+        _probes = None
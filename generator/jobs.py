@@ -0,0 +1,197 @@
+"""
+Database-backed job queue for /generate/ (queue mode).
+
+The web process only validates and enqueues; worker threads started by
+`manage.py run_generation_workers` claim jobs, run the Gemini call plus the PromptAnalyzer
+pass, and store the result for /generate/jobs/<id>/. No external broker: jobs live in the
+GenerationJob table and are claimed with a lease, so a job held by a worker that died or
+restarted is claimed again once its lease expires. The workers also delete finished jobs after
+GENERATION_QUEUE_RETENTION_HOURS.
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .copy_tracking import generation_ref
+from .models import GenerationJob
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_generation_job(session_id, data, prompt, meta):
+    return GenerationJob.objects.create(
+        session_id=session_id,
+        request_data=data,
+        prompt=prompt,
+        meta=meta,
+    )
+
+
+def claimable_jobs(now):
+    """Queued jobs, plus running jobs whose worker lease has expired"""
+    return Q(status='queued') | Q(status='running', lease_expires_at__lt=now)
+
+
+def claim_next_job(worker_id, lease_seconds):
+    """Atomically claim the oldest claimable job, or return None"""
+    now = timezone.now()
+    candidates = list(
+        GenerationJob.objects.filter(claimable_jobs(now))
+        .order_by('created_at')
+        .values_list('pk', flat=True)[:10]
+    )
+    for pk in candidates:
+        # Conditional UPDATE - only one worker can win the row
+        claimed = GenerationJob.objects.filter(claimable_jobs(now), pk=pk).update(
+            status='running',
+            worker_id=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return GenerationJob.objects.get(pk=pk)
+    return None
+
+
+def holds_job_lease(job):
+    """
+    True while `job` is still running under this worker. Inside a transaction the row stays
+    locked until commit, so no other worker can re-claim it in between.
+    """
+    return GenerationJob.objects.select_for_update().filter(
+        pk=job.pk, worker_id=job.worker_id, status='running'
+    ).exists()
+
+
+def finish_job(job, response=None, prompt_generation=None):
+    GenerationJob.objects.filter(pk=job.pk, worker_id=job.worker_id).update(
+        status='done',
+        response=response,
+        prompt_generation=prompt_generation,
+        lease_expires_at=None,
+        finished_at=timezone.now(),
+    )
+
+
+def fail_job(job, error, error_status):
+    GenerationJob.objects.filter(pk=job.pk, worker_id=job.worker_id).update(
+        status='failed',
+        error=error,
+        error_status=error_status,
+        lease_expires_at=None,
+        finished_at=timezone.now(),
+    )
+
+
+def purge_finished_jobs(retention_hours=None):
+    """Delete done and failed jobs that finished more than retention_hours ago; returns the count"""
+    if retention_hours is None:
+        retention_hours = settings.GENERATION_QUEUE_RETENTION_HOURS
+    cutoff = timezone.now() - timedelta(hours=retention_hours)
+    deleted, _ = GenerationJob.objects.filter(status__in=('done', 'failed'), finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def job_status_payload(job):
+    """JSON body for /generate/jobs/<id>/"""
+    payload = {'job_id': str(job.pk), 'status': job.status}
+    if job.status == 'done':
+        payload['response'] = job.response
+        payload['generation'] = generation_ref(job.session_id, job.prompt_generation_id)
+    elif job.status == 'failed':
+        payload.update(job.error or {})
+    return payload
+
+
+class JobWorkerPool:
+    """
+    Threads that claim and run GenerationJobs until stopped.
+    `handler(job)` runs one job and must call finish_job() or fail_job().
+    A sweeper thread deletes finished jobs past their retention every sweep_interval seconds.
+    """
+
+    def __init__(self, handler, threads=4, poll_interval=None, lease_seconds=None, max_attempts=None,
+                 sweep_interval=600):
+        self.handler = handler
+        self.threads = threads
+        self.poll_interval = poll_interval or settings.GENERATION_QUEUE_POLL_INTERVAL
+        self.lease_seconds = lease_seconds or settings.GENERATION_QUEUE_LEASE_SECONDS
+        self.max_attempts = max_attempts or settings.GENERATION_QUEUE_MAX_ATTEMPTS
+        self.sweep_interval = sweep_interval
+        self.stop_event = threading.Event()
+        self.processed = 0
+        self.failed = 0
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        base_id = f"{socket.gethostname()}:{os.getpid()}"
+        for i in range(self.threads):
+            worker = threading.Thread(
+                target=self._run, args=(f"{base_id}:{i}",), name=f"generation-worker-{i}", daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        sweeper = threading.Thread(target=self._sweep, name="generation-job-sweeper", daemon=True)
+        sweeper.start()
+        self._workers.append(sweeper)
+
+    def stop(self, timeout=None):
+        """Stop claiming new jobs and wait for the running ones to finish"""
+        self.stop_event.set()
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def _run(self, worker_id):
+        while not self.stop_event.is_set():
+            close_old_connections()
+            try:
+                job = claim_next_job(worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                self.stop_event.wait(self.poll_interval)
+                continue
+
+            if job.attempts > self.max_attempts:
+                # Keeps killing workers - don't let it poison the queue
+                fail_job(job, {'error': 'Job failed', 'response': 'Sorry, an unexpected error occurred.'}, 500)
+                self._count(failed=True)
+                continue
+
+            try:
+                self.handler(job)
+                self._count()
+            except Exception as e:
+                logger.error(f"Generation job {job.pk} crashed: {e}")
+                fail_job(job, {'error': 'Job failed', 'response': 'Sorry, an unexpected error occurred.'}, 500)
+                self._count(failed=True)
+        close_old_connections()
+
+    def _sweep(self):
+        while True:
+            close_old_connections()
+            try:
+                deleted = purge_finished_jobs()
+                if deleted:
+                    logger.info(f"🧹 Deleted {deleted} finished generation jobs")
+            except Exception as e:
+                logger.error(f"Job sweep failed: {e}")
+            if self.stop_event.wait(self.sweep_interval):
+                break
+        close_old_connections()
+
+    def _count(self, failed=False):
+        with self._lock:
+            self.processed += 1
+            if failed:
+                self.failed += 1
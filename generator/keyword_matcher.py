@@ -0,0 +1,172 @@
+"""
+Aho–Corasick multi-pattern matcher for the PromptAnalyzer keyword tables.
+
+Every table is compiled once into a single automaton (pyahocorasick), so one linear pass over
+a text finds every pattern of every table instead of one `pattern in text` scan per pattern.
+Two match semantics are supported:
+
+- substring:     `pattern in text`
+- word boundary: the pattern is not preceded or followed by a word character (regex \w),
+                 so "math." and "(algebra)" and a keyword at the end of a line all count.
+                 The classifiers used to pad with spaces (`f' {pattern} ' in f' {text} '`),
+                 which allocated a copy of the text per keyword and missed all of those.
+
+Word boundaries are checked on the automaton's hits by looking at the two neighbouring
+characters - nothing is copied or sliced. Without pyahocorasick the matcher falls back to a
+lazy check per pattern actually asked about: `in` for substrings, and a compiled
+`(?<!\w)pattern(?!\w)` regex per word pattern.
+"""
+import re
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+def is_word_character(char):
+    """Same test as the regex \w class"""
+    return char.isalnum() or char == '_'
+
+
+class KeywordMatches:
+    """
+    Result of one KeywordMatcher.scan(). Without an automaton (found is None) each pattern
+    is checked with `in` the first time it is asked about.
+    """
+
+    def __init__(self, matcher, text, found=None, words=None):
+        self.matcher = matcher
+        self._text = text     # str, or a callable building it (only needed for uncompiled patterns)
+        self.found = found    # patterns occurring anywhere in the text
+        self.words = words    # word-boundary patterns occurring as whole words
+
+    @property
+    def text(self):
+        if callable(self._text):
+            self._text = self._text()
+        return self._text
+
+    def union(self, other, text):
+        """Matches of two scans that together cover `text`"""
+        return KeywordMatches(self.matcher, text, self.found | other.found, self.words | other.words)
+
+    def has(self, pattern):
+        """`pattern in text`"""
+        if self.found is not None and pattern in self.matcher.patterns:
+            return pattern in self.found
+        return pattern in self.text
+
+    def has_word(self, pattern):
+        """`pattern` occurs in the text as a whole word"""
+        if self.words is not None and pattern in self.matcher.word_patterns:
+            return pattern in self.words
+        return self.matcher.word_regex(pattern).search(self.text) is not None
+
+    def hits(self, table):
+        """Patterns of `table` present in the text, in table order (duplicates kept)"""
+        patterns, word_boundary = self.matcher.tables[table]
+        if self.found is None:
+            check = self.has_word if word_boundary else self.has
+            return [pattern for pattern in patterns if check(pattern)]
+        present = self.words if word_boundary else self.found
+        return [pattern for pattern in patterns if pattern in present]
+
+    def count(self, table):
+        """Number of `table` entries present - sum(1 for p in table if <match>)"""
+        return len(self.hits(table))
+
+    def counts(self):
+        """Hit count of every table"""
+        return {table: self.count(table) for table in self.matcher.tables}
+
+
+class KeywordMatcher:
+    """
+    Named keyword tables compiled into one Aho–Corasick automaton.
+
+        matcher = KeywordMatcher()
+        matcher.add_table('udl', UDL_KEYWORDS)
+        matcher.add_table('stem_topics', topics, word_boundary=True)
+        matcher.compile()
+        matches = matcher.scan(text.lower())
+        matches.count('udl')
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.patterns = set()
+        self.word_patterns = set()
+        self._automaton = None
+        self._compiled = False
+        self._word_regexes = {}
+        self.max_length = 0
+
+    @property
+    def has_automaton(self):
+        if not self._compiled:
+            self.compile()
+        return self._automaton is not None
+
+    def add_table(self, name, patterns, word_boundary=False):
+        patterns = tuple(patterns)
+        if '' in patterns:
+            raise ValueError(f"Empty pattern in {name!r}")
+        if word_boundary and any(p != p.strip(' ') for p in patterns):
+            raise ValueError(f"Word-boundary patterns in {name!r} must not start or end with a space")
+        self.tables[name] = (patterns, word_boundary)
+        self.patterns.update(patterns)
+        if word_boundary:
+            self.word_patterns.update(patterns)
+        self._compiled = False
+        return self
+
+    def add_terms(self, patterns):
+        """Register loose terms for has()/has_word() without a table"""
+        self.patterns.update(p for p in patterns if p)
+        self._compiled = False
+        return self
+
+    def word_regex(self, pattern):
+        """Compiled whole-word regex for the fallback path, built once per pattern"""
+        regex = self._word_regexes.get(pattern)
+        if regex is None:
+            regex = self._word_regexes[pattern] = re.compile(rf'(?<!\w){re.escape(pattern)}(?!\w)')
+        return regex
+
+    def compile(self):
+        if ahocorasick is None or not self.patterns:
+            self._automaton = None
+        else:
+            automaton = ahocorasick.Automaton()
+            for pattern in self.patterns:
+                automaton.add_word(pattern, (pattern, len(pattern), pattern in self.word_patterns))
+            automaton.make_automaton()
+            self._automaton = automaton
+        self.max_length = max(map(len, self.patterns), default=0)
+        self._compiled = True
+        return self
+
+    def scan(self, text, starts_before=None):
+        """
+        Find every compiled pattern in one pass over text. With starts_before, only
+        occurrences starting before that index count (scanning the head of a longer text).
+        """
+        if not self._compiled:
+            self.compile()
+        if self._automaton is None:
+            return KeywordMatches(self, text)
+
+        found = set()
+        words = set()
+        last = len(text) - 1
+        for end, (pattern, length, word_boundary) in self._automaton.iter(text):
+            start = end - length + 1
+            if starts_before is not None and start >= starts_before:
+                continue
+            found.add(pattern)
+            if word_boundary and pattern not in words:
+                if ((start == 0 or not is_word_character(text[start - 1])) and
+                        (end == last or not is_word_character(text[end + 1]))):
+                    words.add(pattern)
+        return KeywordMatches(self, text, found, words)
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from generator.analytics import PromptAnalyzer
+from generator.batch_analysis import BatchAnalyzer, generation_record
+from generator.deferred_analysis import analysis_fields
+from generator.models import PromptGeneration
+
+
+class Command(BaseCommand):
+    help = 'Compare row-by-row and batch PromptAnalyzer throughput (prompts/second) on stored generations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=2000, help='Number of most recent generations to analyse')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        generations = (
+            PromptGeneration.objects
+            .exclude(generated_prompt__isnull=True)
+            .only('subject', 'task', 'role', 'context', 'methodology', 'generated_prompt')
+            .order_by('-timestamp')[:options['limit']]
+        )
+        records = [generation_record(generation) for generation in generations]
+        if not records:
+            self.stdout.write(self.style.WARNING('No generations to analyse.'))
+            return
+
+        PromptAnalyzer.clear_form_cache()
+        start = time.perf_counter()
+        per_row = [analysis_fields(data, text_response) for data, text_response in records]
+        row_seconds = time.perf_counter() - start
+        form_cache = PromptAnalyzer.form_cache_stats()['total']
+
+        analyzer = BatchAnalyzer()
+        batch_size = options['batch_size']
+        batch = []
+        for i in range(0, len(records), batch_size):
+            batch.extend(analyzer.analyze(records[i:i + batch_size]))
+        stats = analyzer.stats()
+
+        mismatches = sum(1 for a, b in zip(per_row, batch) if a != b)
+        self.stdout.write(f"Row by row: {len(records) / row_seconds:,.1f} prompts/s ({row_seconds:.2f}s)")
+        self.stdout.write(
+            f"Batch:      {stats['prompts_per_second']:,.1f} prompts/s ({stats['seconds']:.2f}s, "
+            f"{'vectorized' if analyzer.available else 'numpy/scipy unavailable - row fallback'})"
+        )
+        self.stdout.write(
+            f"Form-field memo: {form_cache['hits']:,} hits, {form_cache['misses']:,} misses "
+            f"({form_cache['hit_rate']:.1%} hit rate)"
+        )
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f'{mismatches} of {len(records)} results differ!'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'All {len(records)} results identical'))
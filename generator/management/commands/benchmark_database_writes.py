@@ -0,0 +1,114 @@
+import statistics
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, connections
+from django.test.utils import override_settings
+
+from generator.models import UserSession
+from generator.views import build_prompt_generation
+from promptbuilder.database import SQLITE_DEFAULT_PRAGMAS
+
+REQUEST_DATA = {
+    'role': 'teacher', 'subject': 'Biology', 'task': 'lesson plan', 'context': 'high school',
+    'methodology': 'inquiry-based learning', 'tone': 'encouraging',
+}
+META = {
+    'enhancement_type': 'enhanced', 'is_theory_request': False, 'is_improvement_request': False,
+    'applied_theory': 'blooms', 'selected_theory': '',
+}
+GENERATED_PROMPT = 'Design a 45-minute inquiry-based lesson on cell respiration. ' * 20
+
+
+def generate_request(session_id):
+    """The /generate/ writes with deferred analysis, between request_started and request_finished"""
+    close_old_connections()
+    session, created = UserSession.objects.get_or_create(session_id=session_id)
+    build_prompt_generation(session, REQUEST_DATA, META, GENERATED_PROMPT, 1.0, analyze=False).save()
+    close_old_connections()
+
+
+class Command(BaseCommand):
+    help = ('Write throughput of the /generate/ insert pattern (session get_or_create + PromptGeneration '
+            'insert, one request per connection cycle) under each database profile. Run it against an '
+            'idle database: it commits its rows (deleted afterwards) and switches the SQLite journal mode')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help='Requests per thread and profile')
+        parser.add_argument('--threads', type=int, default=4, help='Concurrent request threads')
+
+    def profiles(self):
+        """(name, settings overrides, CONN_MAX_AGE) for the configured database"""
+        conn_max_age = connection.settings_dict['CONN_MAX_AGE'] or 600
+        if connection.vendor == 'sqlite':
+            pragmas = settings.SQLITE_PRAGMAS
+            defaults = {**pragmas, **SQLITE_DEFAULT_PRAGMAS}
+            return [
+                ('sqlite defaults (rollback journal)', {'SQLITE_PRAGMAS': defaults}, 0),
+                ('sqlite tuned pragmas', {'SQLITE_PRAGMAS': pragmas}, 0),
+                (f'sqlite tuned, CONN_MAX_AGE={conn_max_age}', {'SQLITE_PRAGMAS': pragmas}, conn_max_age),
+            ]
+        if connection.settings_dict.get('OPTIONS', {}).get('pool'):
+            return [(f'{connection.vendor} pooled', {}, 0)]
+        return [
+            (f'{connection.vendor} connection per request', {}, 0),
+            (f'{connection.vendor} CONN_MAX_AGE={conn_max_age}', {}, conn_max_age),
+        ]
+
+    def run_profile(self, threads, requests):
+        start = threading.Barrier(threads)
+        latencies = []
+        errors = []
+        run_id = uuid.uuid4().hex[:8]
+
+        def worker(number):
+            start.wait()
+            try:
+                for i in range(requests):
+                    began = time.perf_counter()
+                    # Every fourth request comes from a new visitor, the rest reuse the thread's session
+                    generate_request(f'benchmark-db-{run_id}-{number}-{i // 4}')
+                    latencies.append(time.perf_counter() - began)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        began = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return time.perf_counter() - began, sorted(latencies), errors
+
+    def handle(self, *args, **options):
+        database = connection.settings_dict
+        original_max_age = database['CONN_MAX_AGE']
+        self.stdout.write(f"{connection.vendor} database {database['NAME']}, {options['threads']} threads")
+        try:
+            for name, overrides, conn_max_age in self.profiles():
+                connections.close_all()
+                database['CONN_MAX_AGE'] = conn_max_age
+                with override_settings(**overrides):
+                    # Apply the profile once up front: switching the journal mode needs the
+                    # database to itself, so the threads mustn't race to do it
+                    connection.ensure_connection()
+                    connections.close_all()
+                    seconds, latencies, errors = self.run_profile(options['threads'], options['requests'])
+                if errors:
+                    self.stdout.write(f"{name:>40}: {len(errors)} threads failed, first error: {errors[0]}")
+                    continue
+                p95 = latencies[int(len(latencies) * 0.95) - 1]
+                self.stdout.write(
+                    f"{name:>40}: {len(latencies) / seconds:8.1f} writes/s, "
+                    f"median {statistics.median(latencies) * 1000:.2f}ms, p95 {p95 * 1000:.2f}ms"
+                )
+        finally:
+            database['CONN_MAX_AGE'] = original_max_age
+            connections.close_all()
+            deleted, _ = UserSession.objects.filter(session_id__startswith='benchmark-db-').delete()
+            self.stdout.write(f"Removed {deleted} benchmark rows")
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from generator.models import PromptGeneration
+from generator.readability import flesch_reading_ease, flesch_reading_ease_batch, syllable_exceptions
+
+
+class Command(BaseCommand):
+    help = 'Compare the built-in Flesch reading ease with textstat (scores and texts/second) on stored generations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=2000, help='Number of most recent generations to score')
+        parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed score difference')
+
+    def handle(self, *args, **options):
+        try:
+            import textstat
+        except ImportError:
+            raise CommandError('textstat is not installed - it is only needed for this comparison')
+
+        texts = list(
+            PromptGeneration.objects
+            .exclude(generated_prompt__isnull=True).exclude(generated_prompt='')
+            .order_by('-timestamp')
+            .values_list('generated_prompt', flat=True)[:options['limit']]
+        )
+        if not texts:
+            self.stdout.write(self.style.WARNING('No generations to score.'))
+            return
+        syllable_exceptions()  # table load is a one-off, like textstat's cmudict import
+
+        reference, failed = [], 0
+        start = time.perf_counter()
+        for text in texts:
+            try:
+                reference.append(textstat.flesch_reading_ease(text))
+            except KeyError:  # textstat 0.7.5 raises on words cmudict doesn't know
+                reference.append(None)
+                failed += 1
+        textstat_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scores = [flesch_reading_ease(text) for text in texts]
+        seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        flesch_reading_ease_batch(texts)
+        batch_seconds = time.perf_counter() - start
+
+        differences = [abs(a - b) for a, b in zip(reference, scores) if a is not None]
+        outside = sum(1 for difference in differences if difference > options['tolerance'])
+        self.stdout.write(f"textstat: {len(texts) / textstat_seconds:,.0f} texts/s ({failed} of {len(texts)} raised)")
+        self.stdout.write(f"built-in: {len(texts) / seconds:,.0f} texts/s, batch {len(texts) / batch_seconds:,.0f} texts/s")
+        if differences:
+            self.stdout.write(f"max difference {max(differences):.2f} over {len(differences)} texts textstat could score")
+        if outside:
+            self.stdout.write(self.style.ERROR(f"{outside} scores differ by more than {options['tolerance']}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"All comparable scores within {options['tolerance']}"))
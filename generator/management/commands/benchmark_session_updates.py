@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from generator.models import UserSession
+
+
+def full_save(session):
+    """A UserSession save as the views used to do it: full_clean() then every column"""
+    session.full_clean()
+    models.Model.save(session)
+
+
+def legacy_onboarding(session):
+    session.ai_experience = 'intermediate'
+    session.teaching_years = '6-15'
+    session.onboarding_completed = True
+    session.onboarding_completion_time = timezone.now()
+    session.research_consent = True
+    full_save(session)
+
+
+def legacy_training_needs(session):
+    session.training_interests = ['assessment', 'differentiation']
+    session.training_priorities = {'assessment': 1, 'differentiation': 2}
+    session.training_other_needs = None
+    session.follow_up_email = 'teacher@example.com'
+    session.research_interview_interest = True
+    session.training_needs_completed = True
+    session.training_needs_completion_time = timezone.now()
+    full_save(session)
+
+
+def onboarding(session):
+    session.record_onboarding('intermediate', '6-15')
+
+
+def training_needs(session):
+    session.record_training_needs(
+        ['assessment', 'differentiation'], {'assessment': 1, 'differentiation': 2},
+        follow_up_email='teacher@example.com', interview_interest=True,
+    )
+
+
+class Command(BaseCommand):
+    help = ('Micro-benchmark UserSession writes per survey request: full_clean() + full-row save vs the '
+            'targeted record_*() updates (database time, queries and columns written)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=500, help='Scratch sessions per variant (rolled back)')
+
+    def handle(self, *args, **options):
+        variants = (
+            ('onboarding', 'full save', legacy_onboarding),
+            ('onboarding', 'record_onboarding', onboarding),
+            ('training needs', 'full save', legacy_training_needs),
+            ('training needs', 'record_training_needs', training_needs),
+        )
+        with transaction.atomic():
+            for request, name, update in variants:
+                sessions = UserSession.objects.bulk_create(
+                    [UserSession(session_id=f'benchmark-{request}-{name}-{i}') for i in range(options['sessions'])]
+                )
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for session in sessions:
+                        update(session)
+                    seconds = time.perf_counter() - start
+
+                updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+                columns = updates[0].split(' WHERE ')[0].count('=') if updates else 0
+                self.stdout.write(
+                    f"{request:>14} {name:>22}: {seconds / len(sessions) * 1000:.3f}ms per request, "
+                    f"{len(queries) / len(sessions):.1f} queries, {columns} columns written"
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from generator.models import PromptGeneration
+from generator.theory_rules import (
+    DEFAULT_THEORY, THEORY_ENHANCEMENTS, THEORY_SUGGESTIONS, _resolve, theory_cache_stats, theory_enhancement,
+)
+
+
+def eager_enhancement(form_data, selected_theory):
+    """
+    Theory and enhancement the way /generate/ used to resolve them: the suggestion chain,
+    then every theory's keyword chain built before the selected one is picked.
+    """
+    fields = {field: (form_data.get(field) or '').lower() for field in ('methodology', 'task', 'context')}
+
+    def first_match(rules):
+        for field, keywords, outcome in rules:
+            if field is None or any(keyword in fields[field] for keyword in keywords):
+                return outcome
+
+    theory = selected_theory or first_match(THEORY_SUGGESTIONS) or DEFAULT_THEORY
+    enhancements = {name: first_match(rules) for name, rules in THEORY_ENHANCEMENTS.items()}
+    return theory, enhancements.get(theory)
+
+
+class Command(BaseCommand):
+    help = ('Micro-benchmark theory selection per /generate/ request: eager keyword chains vs the compiled '
+            'rules (cold and memoized)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=2000, help='Number of most recent generations to replay')
+        parser.add_argument('--theory', default='', help='Selected theory to replay with (default: auto-suggest)')
+        parser.add_argument('--repeat', type=int, default=5, help='Passes over the generations per variant')
+
+    def handle(self, *args, **options):
+        requests = [
+            {'methodology': methodology, 'task': task, 'context': context}
+            for methodology, task, context in
+            PromptGeneration.objects.order_by('-timestamp').values_list('methodology', 'task', 'context')[:options['limit']]
+        ]
+        if not requests:
+            self.stdout.write(self.style.WARNING('No generations to replay.'))
+            return
+        theory = options['theory']
+
+        def run(resolve, clear=False):
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                for form_data in requests:
+                    if clear:
+                        _resolve.cache_clear()
+                    resolve(form_data, theory)
+            return (time.perf_counter() - start) / (len(requests) * options['repeat'])
+
+        eager = run(eager_enhancement)
+        cold = run(theory_enhancement, clear=True)
+        _resolve.cache_clear()
+        cached = run(theory_enhancement)
+        stats = theory_cache_stats()
+
+        mismatches = sum(1 for form_data in requests if eager_enhancement(form_data, theory) != theory_enhancement(form_data, theory))
+        distinct = len({tuple(form_data.values()) for form_data in requests})
+        self.stdout.write(f"  eager chains: {eager * 1e6:,.1f}us per request")
+        self.stdout.write(f"compiled rules: {cold * 1e6:,.1f}us per request (cache cleared every call)")
+        self.stdout.write(f"      memoized: {cached * 1e6:,.1f}us per request "
+                          f"({distinct:,} distinct inputs, {stats['hits']:,} hits / {stats['misses']:,} misses)")
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f"{mismatches} requests resolve differently"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"All {len(requests):,} requests resolve identically"))
@@ -0,0 +1,117 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from generator.analytics import PromptAnalyzer, PromptDocument
+from generator.batch_analysis import generation_record
+from generator.models import PromptGeneration
+
+
+def padded_word_counts(data, generated_prompt):
+    """
+    Subject and Bloom's verb word matching as the classifiers used to do it: one padded copy
+    of the combined text per keyword, spaces as the only word boundary.
+    """
+    subject_text = f"{data.get('subject', '')} {data.get('task', '')} {generated_prompt}".lower()
+    blooms_text = f"{data.get('task', '')} {data.get('methodology', '')} {generated_prompt}".lower()
+    counts = {}
+    for category, patterns in PromptAnalyzer.SUBJECT_PATTERNS.items():
+        counts[('subject_keywords', category)] = sum(
+            1 for keyword in patterns['keywords'] if f' {keyword} ' in f' {subject_text} '
+        )
+        counts[('subject_topics', category)] = sum(
+            1 for topic in patterns['topics'] if f' {topic} ' in f' {subject_text} '
+        )
+    for level, indicators in PromptAnalyzer.BLOOMS_COMPLEXITY_INDICATORS.items():
+        counts[('blooms_verbs', level)] = sum(
+            1 for verb in indicators['verbs'] if f' {verb} ' in f' {blooms_text} '
+        )
+    return counts
+
+
+def padded_bytes_copied(data, generated_prompt):
+    """Bytes of padded text padded_word_counts() builds - one copy of the text per keyword"""
+    subject_length = len(f"{data.get('subject', '')} {data.get('task', '')} {generated_prompt}") + 2
+    blooms_length = len(f"{data.get('task', '')} {data.get('methodology', '')} {generated_prompt}") + 2
+    keywords = sum(len(patterns['keywords']) + len(patterns['topics']) for patterns in PromptAnalyzer.SUBJECT_PATTERNS.values())
+    verbs = sum(len(indicators['verbs']) for indicators in PromptAnalyzer.BLOOMS_COMPLEXITY_INDICATORS.values())
+    return keywords * subject_length + verbs * blooms_length
+
+
+def compiled_bytes_copied(data, generated_prompt):
+    """Bytes of text compiled_word_counts() builds - the lowercase text and two head windows"""
+    window = PromptAnalyzer.KEYWORD_MATCHER.max_length
+    subject_prefix = len(f"{data.get('subject', '')} {data.get('task', '')} ")
+    blooms_prefix = len(f"{data.get('task', '')} {data.get('methodology', '')} ")
+    text_length = len(generated_prompt or '')
+    return text_length + subject_prefix + blooms_prefix + 2 * min(window, text_length)
+
+
+def compiled_word_counts(data, generated_prompt):
+    """The same tables through the compiled matcher, on a fresh PromptDocument"""
+    document = PromptDocument(generated_prompt)
+    subject = document.matches_with(data.get('subject', ''), data.get('task', ''))
+    blooms = document.matches_with(data.get('task', ''), data.get('methodology', ''))
+    counts = {}
+    for category in PromptAnalyzer.SUBJECT_PATTERNS:
+        counts[('subject_keywords', category)] = subject.count(('subject_keywords', category))
+        counts[('subject_topics', category)] = subject.count(('subject_topics', category))
+    for level in PromptAnalyzer.BLOOMS_COMPLEXITY_INDICATORS:
+        counts[('blooms_verbs', level)] = blooms.count(('blooms_verbs', level))
+    return counts
+
+
+class Command(BaseCommand):
+    help = ("Micro-benchmark subject/Bloom's verb word matching: padded-copy checks vs the compiled matcher "
+            "(time, text copied and peak memory per analysis)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500, help='Number of most recent generations to match')
+
+    def handle(self, *args, **options):
+        generations = (
+            PromptGeneration.objects
+            .exclude(generated_prompt__isnull=True)
+            .only('subject', 'task', 'role', 'context', 'methodology', 'generated_prompt')
+            .order_by('-timestamp')[:options['limit']]
+        )
+        records = [generation_record(generation) for generation in generations]
+        if not records:
+            self.stdout.write(self.style.WARNING('No generations to match.'))
+            return
+
+        results = {}
+        variants = (
+            ('padded copies', padded_word_counts, padded_bytes_copied),
+            ('compiled matcher', compiled_word_counts, compiled_bytes_copied),
+        )
+        for name, match, bytes_copied in variants:
+            start = time.perf_counter()
+            counts = [match(data, text) for data, text in records]
+            seconds = time.perf_counter() - start
+
+            # Peak memory held above the baseline during one analysis, averaged
+            tracemalloc.start()
+            peak = 0
+            for data, text in records:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                match(data, text)
+                peak += tracemalloc.get_traced_memory()[1] - baseline
+            tracemalloc.stop()
+
+            copied = sum(bytes_copied(data, text) for data, text in records)
+            results[name] = counts
+            self.stdout.write(
+                f"{name:>17}: {seconds / len(records) * 1e6:,.0f}us per analysis, "
+                f"{copied / len(records) / 1024:,.1f} KiB of text copied, "
+                f"peak {peak / len(records) / 1024:,.1f} KiB held"
+            )
+
+        before = sum(sum(counts.values()) for counts in results['padded copies'])
+        after = sum(sum(counts.values()) for counts in results['compiled matcher'])
+        self.stdout.write(
+            f"Word matches: {before:,} with space-only boundaries, {after:,} with true word boundaries "
+            f"({after - before:+,} next to punctuation or line breaks)"
+        )
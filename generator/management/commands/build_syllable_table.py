@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from generator.readability import PUNCTUATION, SYLLABLE_EXCEPTIONS_PATH, estimate_syllables
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the syllable exception table used by generator.readability from cmudict '
+            '(needs the cmudict package; run again after changing estimate_syllables)')
+
+    def handle(self, *args, **options):
+        try:
+            import cmudict
+        except ImportError:
+            raise CommandError('cmudict is not installed (pip install cmudict)')
+
+        exceptions = {}
+        checked = 0
+        for word, pronunciations in cmudict.dict().items():
+            # Lookups happen after punctuation is stripped, so entries like "don't" never match
+            if PUNCTUATION.search(word):
+                continue
+            checked += 1
+            # First pronunciation, stressed phones = syllables - as textstat counts
+            syllables = sum(1 for phone in pronunciations[0] if phone[-1].isdigit())
+            if syllables != estimate_syllables(word):
+                exceptions[word] = syllables
+
+        SYLLABLE_EXCEPTIONS_PATH.parent.mkdir(exist_ok=True)
+        with open(SYLLABLE_EXCEPTIONS_PATH, 'w', encoding='utf-8') as f:
+            f.write('# cmudict words whose syllable count differs from estimate_syllables()\n')
+            f.write('# generated by: python manage.py build_syllable_table\n')
+            for word in sorted(exceptions):
+                f.write(f'{word} {exceptions[word]}\n')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(exceptions):,} exceptions out of {checked:,} cmudict words '
+            f'({1 - len(exceptions) / checked:.1%} estimated correctly) -> {SYLLABLE_EXCEPTIONS_PATH}'
+        ))
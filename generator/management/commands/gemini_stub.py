@@ -0,0 +1,78 @@
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Run a local Gemini API stub (set GEMINI_API_BASE=http://127.0.0.1:<port>/v1)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8089)
+        parser.add_argument('--latency', type=float, default=0.5,
+                            help='Seconds to wait before answering each request')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of requests answered with 503 (exercises retries)')
+        parser.add_argument('--stream-delay', type=float, default=0.05,
+                            help='Seconds between streamed chunks')
+
+    def handle(self, *args, **options):
+        latency = options['latency']
+        error_rate = options['error_rate']
+        stream_delay = options['stream_delay']
+
+        class StubHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                prompt = payload.get('contents', [{}])[0].get('parts', [{}])[0].get('text', '')
+                time.sleep(latency)
+
+                if random.random() < error_rate:
+                    self.send_json(503, {'error': {'code': 503, 'message': 'stub overloaded'}})
+                    return
+
+                text = f"You are a stub teacher assistant. Prompt length was {len(prompt)} characters."
+                if ':streamGenerateContent' in self.path:
+                    self.send_stream(text)
+                else:
+                    self.send_json(200, {'candidates': [{'content': {'parts': [{'text': text}]}}]})
+
+            def send_stream(self, text):
+                # One SSE event per word, like streamGenerateContent?alt=sse
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for word in text.split(' '):
+                    chunk = {'candidates': [{'content': {'parts': [{'text': word + ' '}]}}]}
+                    event = f"data: {json.dumps(chunk)}\r\n\r\n".encode()
+                    self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+                    self.wfile.flush()
+                    time.sleep(stream_delay)
+                self.wfile.write(b"0\r\n\r\n")
+
+            def send_json(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), StubHandler)
+        self.stdout.write(self.style.SUCCESS(
+            f"Gemini stub listening on http://127.0.0.1:{options['port']}/v1 "
+            f"(latency {latency}s, error rate {error_rate})"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
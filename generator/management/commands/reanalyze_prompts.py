@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from generator.analytics import PromptAnalyzer
+from generator.deferred_analysis import stale_generations
+from generator.models import PromptGeneration
+from generator.reanalysis import (
+    ANALYSIS_FIELDS, INPUT_FIELDS, Checkpoint, Progress, analyze_chunk, apply_results, chunk_rows, init_worker
+)
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = ('Re-run the PromptAnalyzer over stored generations whose analyzer version is stale '
+            '(or every generation with --all) in parallel and write the results back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=parse_date, help='Only generations on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', type=parse_date, help='Only generations on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--analyzer-version', dest='analyzer_version',
+                            help='Only rows analysed by this analyzer version ("" for rows never versioned)')
+        parser.add_argument('--all', action='store_true',
+                            help='Re-analyse every matching row, not only rows with a stale analyzer version')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Analysis processes (1 analyses in this process)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Rows read per database round trip and analysed per task')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per executemany() UPDATE batch')
+        parser.add_argument('--checkpoint', help='Checkpoint file - resume from it if it exists, delete it when done')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+        parser.add_argument('--show', type=int, default=20, help='Changed fields to print in --dry-run mode')
+
+    def handle(self, *args, **options):
+        generations = PromptGeneration.objects.exclude(generated_prompt__isnull=True)
+        filters = {}
+        if options['since']:
+            filters['since'] = options['since'].isoformat()
+            generations = generations.filter(timestamp__gte=self.day_start(options['since']))
+        if options['until']:
+            filters['until'] = options['until'].isoformat()
+            generations = generations.filter(timestamp__lt=self.day_start(options['until'], next_day=True))
+        if options['analyzer_version'] is not None:
+            filters['analyzer_version'] = options['analyzer_version']
+            generations = generations.filter(analyzer_version=options['analyzer_version'])
+        if not options['all']:
+            # Rows already produced by the current rules would come out identical
+            filters['stale_for'] = PromptAnalyzer.VERSION
+            generations = stale_generations(generations)
+
+        dry_run = options['dry_run']
+        checkpoint = Checkpoint(None if dry_run else options['checkpoint'], filters)
+        try:
+            last_pk = checkpoint.load()
+        except ValueError as e:
+            raise CommandError(str(e))
+        if last_pk is not None:
+            self.stdout.write(f'Resuming after generation {last_pk}')
+            generations = generations.filter(pk__gt=last_pk)
+
+        progress = Progress(generations.count())
+        if not progress.total:
+            self.stdout.write(self.style.SUCCESS('Nothing to re-analyse.'))
+            checkpoint.clear()
+            return
+        self.stdout.write(
+            f"Re-analysing {progress.total:,} {'' if options['all'] else 'stale '}generations with {options['workers']} worker(s)"
+            f"{' (dry run)' if dry_run else ''}"
+        )
+
+        # Read columns only - the outputs are re-read per chunk right before they are written
+        rows = generations.order_by('pk').only(*INPUT_FIELDS).iterator(chunk_size=options['chunk_size'])
+        chunks = chunk_rows(rows, options['chunk_size'])
+
+        changed, field_changes, shown = 0, {}, 0
+        for results in self.analyzed_chunks(chunks, options['workers']):
+            with transaction.atomic():
+                chunk_changed, chunk_fields, diffs = apply_results(results, options['batch_size'], dry_run)
+            checkpoint.save(results[-1][0], progress.done + len(results))
+
+            changed += chunk_changed
+            for field, count in chunk_fields.items():
+                field_changes[field] = field_changes.get(field, 0) + count
+            if dry_run:
+                for pk, field, old, new in diffs[:max(0, options['show'] - shown)]:
+                    self.stdout.write(f'  #{pk} {field}: {old!r} -> {new!r}')
+                shown += min(len(diffs), max(0, options['show'] - shown))
+            progress.advance(len(results))
+            self.stdout.write(str(progress))
+
+        checkpoint.clear()
+        verb = 'would change' if dry_run else 'changed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {progress.done:,} generations analysed, {changed:,} {verb} ({progress.rate:,.0f} rows/s)'
+        ))
+        for field in ANALYSIS_FIELDS + ['analysis_pending']:
+            if field in field_changes:
+                self.stdout.write(f'  {field}: {field_changes[field]:,}')
+
+    @staticmethod
+    def day_start(day, next_day=False):
+        start = datetime.combine(day, time.min)
+        if next_day:
+            start += timedelta(days=1)
+        return timezone.make_aware(start) if settings.USE_TZ else start
+
+    @staticmethod
+    def analyzed_chunks(chunks, workers):
+        """analyze_chunk() of every chunk, yielded in input order"""
+        if workers <= 1:
+            for chunk in chunks:
+                yield analyze_chunk(chunk)
+            return
+
+        # spawn: workers must not inherit this process's database connections or threads
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker) as pool:
+            # Bounded look-ahead keeps memory flat however large the table is
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(analyze_chunk, chunk))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
@@ -0,0 +1,38 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from generator.jobs import JobWorkerPool
+from generator.views import run_generation_job
+
+
+class Command(BaseCommand):
+    help = 'Run queue-mode generation workers (GENERATION_QUEUE_MODE=true)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Worker threads - caps concurrent Gemini calls from this process')
+        parser.add_argument('--poll-interval', type=float, default=settings.GENERATION_QUEUE_POLL_INTERVAL)
+
+    def handle(self, *args, **options):
+        pool = JobWorkerPool(
+            run_generation_job,
+            threads=options['threads'],
+            poll_interval=options['poll_interval'],
+        )
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write('Stopping - finishing running jobs...')
+            stop.set()
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        pool.start()
+        self.stdout.write(self.style.SUCCESS(f"Generation workers running ({options['threads']} threads)"))
+        stop.wait()
+        pool.stop()
+        self.stdout.write(self.style.SUCCESS(f'Stopped after {pool.processed} jobs ({pool.failed} failed)'))
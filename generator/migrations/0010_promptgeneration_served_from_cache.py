@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0009_usersession_follow_up_email_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promptgeneration',
+            name='served_from_cache',
+            field=models.BooleanField(default=False, help_text='True if the Gemini response came from the response cache instead of a new API call'),
+        ),
+    ]
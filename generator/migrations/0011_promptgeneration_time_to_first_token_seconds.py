@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0010_promptgeneration_served_from_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promptgeneration',
+            name='time_to_first_token_seconds',
+            field=models.FloatField(blank=True, help_text='Seconds until the first streamed chunk reached the client (streaming endpoint only)', null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:42
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0011_promptgeneration_time_to_first_token_seconds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('session_id', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('request_data', models.JSONField(default=dict)),
+                ('prompt', models.TextField()),
+                ('meta', models.JSONField(default=dict)),
+                ('response', models.TextField(blank=True, null=True)),
+                ('error', models.JSONField(blank=True, null=True)),
+                ('error_status', models.IntegerField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('worker_id', models.CharField(blank=True, max_length=100)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('prompt_generation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='generator.promptgeneration')),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='genjob_status_created_idx')],
+            },
+        ),
+    ]
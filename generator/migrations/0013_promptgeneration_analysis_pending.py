@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0012_generationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promptgeneration',
+            name='analysis_pending',
+            field=models.BooleanField(default=False, help_text='True until the deferred PromptAnalyzer pass has filled in the classification and content fields'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0013_promptgeneration_analysis_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promptgeneration',
+            name='analyzer_version',
+            field=models.CharField(blank=True, db_index=True, help_text='PromptAnalyzer.VERSION that produced the classification and content fields', max_length=64),
+        ),
+    ]
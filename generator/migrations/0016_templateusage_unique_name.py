@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:33
+
+from django.db import migrations, models
+from django.db.models import Max, Sum
+
+
+def merge_duplicate_templates(apps, schema_editor):
+    """Concurrent get_or_create calls could insert a template twice - fold them into one row"""
+    TemplateUsage = apps.get_model('generator', 'TemplateUsage')
+    duplicates = (
+        TemplateUsage.objects.values('template_name')
+        .annotate(rows=models.Count('id'), total=Sum('usage_count'), latest=Max('last_used'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        rows = TemplateUsage.objects.filter(template_name=duplicate['template_name']).order_by('id')
+        keep = rows.first()
+        rows.exclude(pk=keep.pk).delete()
+        TemplateUsage.objects.filter(pk=keep.pk).update(usage_count=duplicate['total'], last_used=duplicate['latest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0015_pageview_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_templates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='templateusage',
+            name='template_name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+    ]
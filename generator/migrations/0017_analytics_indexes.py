@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0016_templateusage_unique_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='promptgeneration',
+            index=models.Index(fields=['session', '-timestamp'], name='promptgen_session_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promptgeneration',
+            index=models.Index(fields=['timestamp'], name='promptgen_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promptgeneration',
+            index=models.Index(fields=['subject_category'], name='promptgen_subject_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promptgeneration',
+            index=models.Index(condition=models.Q(('selected_theory__gt', '')), fields=['selected_theory', 'enhancement_mode', 'copied_to_clipboard', 'theory_auto_suggested'], name='promptgen_theory_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promptgeneration',
+            index=models.Index(condition=models.Q(('copied_to_clipboard', True)), fields=['timestamp'], name='promptgen_copied_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(fields=['start_time'], name='session_start_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(condition=models.Q(('onboarding_completed', True)), fields=['ai_experience', 'teaching_years'], name='session_onboarded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(condition=models.Q(('training_needs_completed', True)), fields=['start_time'], name='session_training_done_idx'),
+        ),
+    ]
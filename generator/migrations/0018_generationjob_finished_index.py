@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0017_analytics_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generationjob',
+            index=models.Index(fields=['status', 'finished_at'], name='genjob_status_finished_idx'),
+        ),
+    ]
@@ -86,6 +86,21 @@ class UserSession(models.Model):
         help_text="Interest in participating in research interview"
     )
     
+    class Meta:
+        # Shaped after the survey statistics (views.py, admin.py); the partial indexes only
+        # hold the sessions that completed a survey, so they stay small
+        indexes = [
+            models.Index(fields=['start_time'], name='session_start_time_idx'),
+            models.Index(
+                fields=['ai_experience', 'teaching_years'], name='session_onboarded_idx',
+                condition=models.Q(onboarding_completed=True),
+            ),
+            models.Index(
+                fields=['start_time'], name='session_training_done_idx',
+                condition=models.Q(training_needs_completed=True),
+            ),
+        ]
+    
     @property
     def duration_minutes(self):
         if self.completion_status in ['completed', 'abandoned']:
@@ -157,17 +172,58 @@ class UserSession(models.Model):
                 'Cannot mark onboarding as completed without both AI experience and teaching years data'
             )
 
+    def validate_fields(self, fields):
+        """Field validators for `fields` only, plus the clean() rules"""
+        self.clean_fields(exclude=[field.name for field in self._meta.concrete_fields if field.name not in fields])
+        self.clean()
+
     def save(self, *args, **kwargs):
-        """Override save to add automatic validations"""
-        self.full_clean()  # This calls clean() method
+        """
+        Override save to add automatic validations. With update_fields only those fields are
+        validated; the unique session_id is left to the database (an IntegrityError, which is
+        what get_or_create expects when two requests create the same session).
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.full_clean(validate_unique=False, validate_constraints=False)  # This calls clean() method
+        else:
+            self.validate_fields(update_fields)
         
         # Auto-set completion time
         if self.onboarding_completed and not self.onboarding_completion_time:
-            from django.utils import timezone
             self.onboarding_completion_time = timezone.now()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'onboarding_completion_time'}
         
         super().save(*args, **kwargs)
 
+    def touch(self, *fields):
+        """Save only `fields` (validated on their own) and last_activity"""
+        self.save(update_fields=[*fields, 'last_activity'])
+
+    def record_onboarding(self, ai_experience, teaching_years):
+        """Store the onboarding demographics; raises ValidationError for invalid values"""
+        self.ai_experience = ai_experience
+        self.teaching_years = teaching_years
+        self.onboarding_completed = True
+        self.onboarding_completion_time = timezone.now()
+        self.research_consent = True  # Implied by participation
+        self.touch('ai_experience', 'teaching_years', 'onboarding_completed', 'onboarding_completion_time',
+                   'research_consent')
+
+    def record_training_needs(self, interests, priorities, other_needs=None, follow_up_email=None,
+                              interview_interest=False):
+        """Store the training needs survey; raises ValidationError for invalid values"""
+        self.training_interests = interests
+        self.training_priorities = priorities
+        self.training_other_needs = other_needs
+        self.follow_up_email = follow_up_email
+        self.research_interview_interest = interview_interest
+        self.training_needs_completed = True
+        self.training_needs_completion_time = timezone.now()
+        self.touch('training_interests', 'training_priorities', 'training_other_needs', 'follow_up_email',
+                   'research_interview_interest', 'training_needs_completed', 'training_needs_completion_time')
+
     @property
     def training_profile_summary(self):
         """Summary of training needs for admin view"""
@@ -193,7 +249,8 @@ class UserSession(models.Model):
 
 class PageView(models.Model):
     session = models.ForeignKey(UserSession, on_delete=models.CASCADE)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the view happened - buffered views are written later (activity_tracker.py)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     path = models.CharField(max_length=200)
     method = models.CharField(max_length=10, default='GET')
     
@@ -223,6 +280,25 @@ class PromptGeneration(models.Model):
     success = models.BooleanField(default=False)
     error_message = models.TextField(blank=True, null=True)
     response_time_seconds = models.FloatField(null=True, blank=True)
+    time_to_first_token_seconds = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Seconds until the first streamed chunk reached the client (streaming endpoint only)"
+    )
+    served_from_cache = models.BooleanField(
+        default=False,
+        help_text="True if the Gemini response came from the response cache instead of a new API call"
+    )
+    analysis_pending = models.BooleanField(
+        default=False,
+        help_text="True until the deferred PromptAnalyzer pass has filled in the classification and content fields"
+    )
+    analyzer_version = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        help_text="PromptAnalyzer.VERSION that produced the classification and content fields"
+    )
     
     # User actions
     copied_to_clipboard = models.BooleanField(default=False)
@@ -431,12 +507,30 @@ class PromptGeneration(models.Model):
         help_text="User's apparent level of educational theory knowledge"
     )
     
+    class Meta:
+        # Shaped after track_copy() and AnalyticsSummary.get_summary(); tests.py checks their
+        # query plans so a changed query or a dropped index shows up as a table scan
+        indexes = [
+            models.Index(fields=['session', '-timestamp'], name='promptgen_session_recent_idx'),
+            models.Index(fields=['timestamp'], name='promptgen_timestamp_idx'),
+            models.Index(fields=['subject_category'], name='promptgen_subject_idx'),
+            models.Index(
+                fields=['selected_theory', 'enhancement_mode', 'copied_to_clipboard', 'theory_auto_suggested'],
+                name='promptgen_theory_idx',
+                condition=models.Q(selected_theory__gt=''),
+            ),
+            models.Index(
+                fields=['timestamp'], name='promptgen_copied_idx',
+                condition=models.Q(copied_to_clipboard=True),
+            ),
+        ]
+    
     def __str__(self):
         template_info = f"Template: {self.template_used}" if self.template_used else "No template"
         return f"{template_info} - {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
 
 class TemplateUsage(models.Model):
-    template_name = models.CharField(max_length=100)
+    template_name = models.CharField(max_length=100, unique=True)
     usage_count = models.IntegerField(default=0)
     last_used = models.DateTimeField(auto_now=True)
     
@@ -453,4 +547,55 @@ class ImprovementSuggestion(models.Model):
     applied = models.BooleanField(default=False)
     
     def __str__(self):
-        return f"Suggestion for {self.prompt_generation.id} - Applied: {self.applied}"
\ No newline at end of file
+        return f"Suggestion for {self.prompt_generation.id} - Applied: {self.applied}"
+
+
+class GenerationJob(models.Model):
+    """
+    Queued /generate/ request (queue mode). Worker threads from `manage.py run_generation_workers`
+    claim jobs with a lease, so jobs held by a crashed or restarted worker are picked up again.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    session_id = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    
+    # Validated request
+    request_data = models.JSONField(default=dict)
+    prompt = models.TextField()
+    meta = models.JSONField(default=dict)
+    
+    # Result
+    response = models.TextField(blank=True, null=True)
+    error = models.JSONField(blank=True, null=True)
+    error_status = models.IntegerField(null=True, blank=True)
+    prompt_generation = models.ForeignKey(PromptGeneration, null=True, blank=True, on_delete=models.SET_NULL)
+    
+    # Worker bookkeeping
+    attempts = models.IntegerField(default=0)
+    worker_id = models.CharField(max_length=100, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+    
+    def __str__(self):
+        return f"Job {str(self.id)[:8]} - {self.status}"
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='genjob_status_created_idx'),
+            # Retention sweep (purge_finished_jobs)
+            models.Index(fields=['status', 'finished_at'], name='genjob_status_finished_idx'),
+        ]
@@ -0,0 +1,132 @@
+"""
+Server-side assembly of the /generate/ instruction prompt.
+
+The browser used to render the whole instruction text and the server then searched it for
+"Instructions:" and the sixth instruction to splice the theory enhancement in - any drift
+in the client text silently dropped the enhancement. Now /generate/ takes the form fields
+and the prompt is rendered here from GENERATION_TEMPLATE: parsed once into literal segments
+and named {slots}, filled with a single join, and checked so that every slot is filled,
+no unknown slot is passed and values are strings. Field values are never re-parsed, so
+braces typed into the form are kept as they are.
+"""
+import string
+
+FORM_FIELDS = ('role', 'subject', 'task', 'context', 'methodology', 'tone')
+GUIDELINE_FIELDS = ('include', 'exclude')
+
+
+class PromptTemplateError(ValueError):
+    """A template or render call that doesn't match the template's slots"""
+
+
+class PromptFieldError(ValueError):
+    """A /generate/ form field that can't be used to render the prompt"""
+
+
+class PromptTemplate:
+    """
+    A text with named {slot} placeholders ({{ and }} for literal braces). Parsed once;
+    render(**values) fills every slot and joins the segments.
+    """
+
+    def __init__(self, source):
+        self.segments = []
+        self.positions = {}
+        for literal, slot, spec, conversion in string.Formatter().parse(source):
+            if literal:
+                self.segments.append(literal)
+            if slot is None:
+                continue
+            if not slot.isidentifier() or spec or conversion:
+                raise PromptTemplateError(f"Invalid template slot {{{slot}}} - slots are plain names")
+            self.positions.setdefault(slot, []).append(len(self.segments))
+            self.segments.append(None)
+        self.slots = frozenset(self.positions)
+
+    def render(self, **values):
+        missing = self.slots - values.keys()
+        unknown = values.keys() - self.slots
+        if missing or unknown:
+            raise PromptTemplateError(
+                f"Template slots don't match (missing: {sorted(missing)}, unknown: {sorted(unknown)})"
+            )
+        parts = self.segments.copy()
+        for slot, positions in self.positions.items():
+            value = values[slot]
+            if not isinstance(value, str):
+                raise PromptTemplateError(f"Slot {{{slot}}} needs a string, got {type(value).__name__}")
+            for position in positions:
+                parts[position] = value
+        return ''.join(parts)
+
+
+GENERATION_TEMPLATE = PromptTemplate("""Create a clear, professional AI prompt using EXACTLY these components. Do not add extra elements or creative flourishes.
+
+Components to connect:
+- Role: {role}
+- Subject: {subject}
+- Task: {task}
+- Context: {context}
+- Methodology: {methodology}
+- Tone: {tone}{guidelines}
+
+Instructions:
+1. Create a single, coherent prompt that combines these elements naturally
+2. Use proper English grammar and clear sentence structure
+3. Do NOT add elements not specified above
+4. Make it ready to copy-paste into any AI chatbot
+5. Start with "You are..." and include all the specified components
+6. Keep it professional and focused on the educational task
+{theory_instruction}""")
+
+GENERATION_SLOTS = frozenset({*FORM_FIELDS, 'guidelines', 'theory_instruction'})
+
+
+def check_slots(template, slots):
+    """Raise PromptTemplateError unless template has exactly these slots"""
+    if template.slots != slots:
+        raise PromptTemplateError(
+            f"Template has slots {sorted(template.slots)}, render_generation_prompt() fills {sorted(slots)}"
+        )
+
+
+# Fail on import, not on the first request, if the template and the renderer drift apart
+check_slots(GENERATION_TEMPLATE, GENERATION_SLOTS)
+
+
+def is_structured_request(data):
+    """Form fields rather than a pre-rendered "prompt" (theory explanations, improvements)"""
+    return "prompt" not in data
+
+
+def generation_fields(data):
+    """Form and guideline fields of a structured /generate/ payload; missing or null is empty"""
+    fields = {}
+    for name in FORM_FIELDS + GUIDELINE_FIELDS:
+        value = data.get(name)
+        if value is None:
+            value = ""
+        if not isinstance(value, str):
+            raise PromptFieldError(f"'{name}' must be a string")
+        fields[name] = value
+    return fields
+
+
+def guidelines_section(include, exclude):
+    if not (include or exclude):
+        return ""
+    section = "\n\nAdditional Guidelines:"
+    if include:
+        section += f"\n- Include: {include}"
+    if exclude:
+        section += f"\n- Avoid: {exclude}"
+    return section
+
+
+def render_generation_prompt(fields, enhancement=None):
+    """Instruction prompt for the form fields, with the theory enhancement as instruction 7"""
+    return GENERATION_TEMPLATE.render(
+        **{name: fields[name] for name in FORM_FIELDS},
+        guidelines=guidelines_section(fields["include"], fields["exclude"]),
+        theory_instruction=f"7. IMPORTANT: {enhancement}\n" if enhancement else "",
+    )
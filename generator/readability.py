@@ -0,0 +1,141 @@
+"""
+Flesch reading ease without textstat.
+
+textstat counts syllables with cmudict, a 3.6MB pronunciation dictionary parsed on import
+(~1s of worker startup), and re-runs its own punctuation and sentence regexes on every call.
+textstat 0.7.5 also raises KeyError for any word cmudict doesn't know - a number, a name, a
+new term - so nearly every real prompt fell through to the constant 5.0 complexity score.
+
+Here a vowel-group heuristic counts syllables, and a precomputed table holds the ~16k
+cmudict words where the heuristic is wrong (data/syllable_exceptions.txt, rebuilt with
+`manage.py build_syllable_table`). Words cmudict knows therefore count exactly as textstat
+counts them, and every text textstat can score gets the identical score; unknown words get
+the heuristic estimate instead of an exception. Tokenization, sentence rules and rounding
+follow textstat 0.7.
+
+    flesch_reading_ease(text)            -> float
+    flesch_reading_ease_batch(texts)     -> [float], the formula vectorized over the batch
+"""
+import math
+import re
+from functools import lru_cache
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SYLLABLE_EXCEPTIONS_PATH = Path(__file__).resolve().parent / 'data' / 'syllable_exceptions.txt'
+
+# Flesch reading ease (English)
+FRE_BASE = 206.835
+FRE_SENTENCE_LENGTH = 1.015
+FRE_SYLLABLES_PER_WORD = 84.6
+
+PUNCTUATION = re.compile(r'[^\w\s]')
+WORD_CHARACTER = re.compile(r'\w')
+SENTENCES = re.compile(r'\b[^.!?]+[.!?]*')
+VOWEL_GROUPS = re.compile(r'[aeiouy]+')
+# Vowel pairs usually spoken as two syllables (radiation, video, graduate, ...)
+HIATUS = re.compile(r'ia|io(?!u)|eo|ua|iu|uo|[^aeiou]ya')
+
+_exceptions = None
+
+
+def estimate_syllables(word):
+    """Vowel-group syllable estimate for a lowercase, punctuation-free word"""
+    count = len(VOWEL_GROUPS.findall(word))
+    if count > 1:
+        if word.endswith('e') and not word.endswith(('le', 'ee', 'ye')):
+            count -= 1  # silent e: make, compose
+        elif word.endswith('le') and len(word) > 2 and word[-3] in 'aeiouy':
+            count -= 1  # whole, style
+        elif word.endswith('ed') and len(word) > 3 and word[-3] not in 'td':
+            count -= 1  # planned, designed (but not graded)
+        elif word.endswith('es') and len(word) > 3 and word[-3] not in 'sxzhcg':
+            count -= 1  # makes, notes (but not classes, matches)
+    count += len(HIATUS.findall(word))
+    return max(1, count)
+
+
+def syllable_exceptions():
+    """{word: syllables} for the cmudict words estimate_syllables() gets wrong"""
+    global _exceptions
+    if _exceptions is None:
+        exceptions = {}
+        with open(SYLLABLE_EXCEPTIONS_PATH, encoding='utf-8') as f:
+            for line in f:
+                if line and not line.startswith('#'):
+                    word, count = line.split()
+                    exceptions[word] = int(count)
+        _exceptions = exceptions
+    return _exceptions
+
+
+@lru_cache(maxsize=65536)
+def word_syllables(word):
+    """Syllables in a lowercase, punctuation-free word"""
+    count = syllable_exceptions().get(word)
+    return count if count is not None else estimate_syllables(word)
+
+
+def _legacy_round(number, points=0):
+    """textstat's rounding (half away from zero)"""
+    p = 10 ** points
+    return float(math.floor((number * p) + math.copysign(0.5, number))) / p
+
+
+def _is_fragment(sentence):
+    """
+    Two words or fewer once punctuation is stripped (headings, list bullets). A token
+    survives stripping iff it holds a word character, so most sentences are decided after
+    their first three tokens instead of a punctuation pass over the whole sentence.
+    """
+    words = 0
+    for token in sentence.split():
+        if WORD_CHARACTER.search(token):
+            words += 1
+            if words > 2:
+                return False
+    return True
+
+
+def text_counts(text):
+    """(words, sentences, syllables) of a text, counted the way textstat counts them"""
+    words = PUNCTUATION.sub('', text.lower()).split()
+    sentences = SENTENCES.findall(text)
+    fragments = sum(map(_is_fragment, sentences))
+    return len(words), max(1, len(sentences) - fragments), sum(map(word_syllables, words))
+
+
+def flesch_reading_ease(text):
+    return _flesch(*text_counts(text))
+
+
+def _flesch(words, sentences, syllables):
+    sentence_length = _legacy_round(words / sentences, 1)
+    syllables_per_word = _legacy_round(syllables / words, 1) if words else 0.0
+    return _legacy_round(
+        FRE_BASE - FRE_SENTENCE_LENGTH * sentence_length - FRE_SYLLABLES_PER_WORD * syllables_per_word, 2
+    )
+
+
+def flesch_reading_ease_batch(texts):
+    """flesch_reading_ease() of every text; the scoring arithmetic runs as array operations"""
+    counts = [text_counts(text) for text in texts]
+    if np is None or not counts:
+        return [_flesch(*text_counts) for text_counts in counts]
+
+    words, sentences, syllables = np.array(counts, dtype=np.float64).T
+
+    def legacy_round(number, points):
+        p = 10 ** points
+        return np.floor(number * p + np.copysign(0.5, number)) / p
+
+    sentence_length = legacy_round(words / sentences, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        syllables_per_word = np.where(words > 0, legacy_round(syllables / words, 1), 0.0)
+    return legacy_round(
+        FRE_BASE - FRE_SENTENCE_LENGTH * sentence_length - FRE_SYLLABLES_PER_WORD * syllables_per_word, 2
+    ).tolist()
@@ -0,0 +1,172 @@
+"""
+Response cache in front of the Gemini call.
+
+Keys are a hash of the normalized final prompt plus the generationConfig, so identical
+dropdown selections across sessions share one upstream generation. Lookups go through a
+small in-process LRU+TTL tier first, then the shared Django cache alias configured in
+settings.CACHES (GEMINI_CACHE_ALIAS) so every gunicorn worker sees the same entries.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so formatting-only differences hit the same entry"""
+    return _WHITESPACE_RE.sub(' ', prompt).strip()
+
+
+def generation_cache_key(prompt, generation_config, model=''):
+    digest = hashlib.sha256()
+    digest.update(model.encode())
+    digest.update(b'\0')
+    digest.update(json.dumps(generation_config, sort_keys=True).encode())
+    digest.update(b'\0')
+    digest.update(normalize_prompt(prompt).encode())
+    return f"gemini:{digest.hexdigest()}"
+
+
+class LRUTTLCache:
+    """Thread-safe bounded LRU with per-entry expiry"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class GeminiResponseCache:
+    """Two-tier (local LRU+TTL, shared Django cache) store of raw Gemini responses"""
+
+    def __init__(self, alias, ttl, local_entries, enabled=True):
+        self.alias = alias
+        self.ttl = ttl
+        self.enabled = enabled
+        self.local = LRUTTLCache(local_entries, ttl)
+        self.hits = 0
+        self.local_hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            alias=settings.GEMINI_CACHE_ALIAS,
+            ttl=settings.GEMINI_CACHE_TTL,
+            local_entries=settings.GEMINI_CACHE_LOCAL_ENTRIES,
+            enabled=settings.GEMINI_CACHE_ENABLED,
+        )
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def key_for(self, payload, model=''):
+        prompt = payload['contents'][0]['parts'][0]['text']
+        return generation_cache_key(prompt, payload.get('generationConfig', {}), model)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        value = self.local.get(key)
+        if value is not None:
+            self._count(hit=True, local=True)
+            return value
+        value = self.shared.get(key)
+        if value is not None:
+            self.local.set(key, value)
+            self._count(hit=True)
+            return value
+        self._count(hit=False)
+        return None
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        self.local.set(key, value)
+        self.shared.set(key, value, timeout=self.ttl)
+
+    async def aget(self, key):
+        return await sync_to_async(self.get)(key)
+
+    async def aset(self, key, value):
+        await sync_to_async(self.set)(key, value)
+
+    def _count(self, hit, local=False):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+                if local:
+                    self.local_hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """Per-process lookup counters"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'local_hits': self.local_hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups * 100, 1) if lookups else 0,
+            'local_entries': len(self.local),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide GeminiResponseCache, built from settings on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = GeminiResponseCache.from_settings()
+    return _cache
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    global _cache
+    if setting.startswith('GEMINI_CACHE') or setting == 'CACHES':
+        _cache = None
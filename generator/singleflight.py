@@ -0,0 +1,312 @@
+"""
+Single-flight coalescing of identical in-flight Gemini requests.
+
+When a whole class submits the same template at once, only the first request (the leader)
+for a prompt hash calls Gemini; later arrivals wait on the leader's result. Works across
+threads (sync views) and within an event loop (async views). The optional cross-process
+mode takes a short lock in the shared 'gemini_responses' cache (database-backed by
+default) and hands the result to the requests in other workers that waited on that lock,
+through the same cache. It isn't a response cache: a request that finds no lock held makes
+its own call, whatever GEMINI_CACHE_ENABLED says.
+
+Streams (/generate/stream/) coalesce through join()/finish() instead of do(): the leader
+streams to its own client while followers wait for the assembled text. They are coalesced
+within a process only - a follower in another worker can't replay a stream still in flight.
+"""
+import asyncio
+import threading
+import time
+import uuid
+import weakref
+
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+
+class _Call:
+    """One in-flight upstream call that followers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+
+
+class SingleFlight:
+
+    def __init__(self, enabled=True, cross_process=False, alias='default',
+                 lock_timeout=35.0, result_ttl=10, poll_interval=0.1):
+        self.enabled = enabled
+        self.cross_process = cross_process
+        self.alias = alias
+        self.lock_timeout = lock_timeout
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+
+        self._calls = {}
+        self._async_calls = weakref.WeakKeyDictionary()  # event loop -> {key: Future}
+        self._lock = threading.Lock()
+
+        self.leaders = 0
+        self.coalesced = 0
+        self.cross_process_coalesced = 0
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            enabled=settings.GEMINI_SINGLE_FLIGHT,
+            cross_process=settings.GEMINI_SINGLE_FLIGHT_CROSS_PROCESS,
+            alias=settings.GEMINI_CACHE_ALIAS,
+            lock_timeout=settings.GEMINI_READ_TIMEOUT + settings.GEMINI_CONNECT_TIMEOUT,
+        )
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _lock_key(self, key):
+        return f"singleflight:lock:{key}"
+
+    def _result_key(self, key, holder):
+        # Results are filed under the lock holder's token: only requests that waited on that
+        # holder know it, so a finished result never answers a later request
+        return f"singleflight:result:{key}:{holder}"
+
+    # === THREADS (WSGI views) ===
+
+    def join(self, key):
+        """
+        (call, leader) for key. The leader makes the upstream call and must end it with
+        finish(); followers get its outcome from wait(). Lets a leader that streams share its
+        call, which do() can't.
+        """
+        if not self.enabled:
+            return _Call(), True
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                return call, True
+            self.coalesced += 1
+            return call, False
+
+    def finish(self, key, call, result=None, error=None, abandoned=False):
+        """End a leader's call: its result, its error, or abandoned so the followers retry"""
+        call.result, call.error, call.abandoned = result, error, abandoned
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.done.set()
+
+    def wait(self, call):
+        """(result, abandoned) of a call this follower joined; raises the leader's error"""
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result, call.abandoned
+
+    def do(self, key, fn):
+        """Run fn() once per key at a time; returns (result, coalesced)"""
+        if not self.enabled:
+            return fn(), False
+
+        while True:
+            call, leader = self.join(key)
+            if leader:
+                break
+            result, abandoned = self.wait(call)
+            if not abandoned:
+                return result, True
+            # The leader gave up: try again, as the new leader if nobody beat us to it
+
+        try:
+            if self.cross_process:
+                result, shared = self._do_cross_process(key, fn)
+            else:
+                result, shared = fn(), False
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result, shared
+
+    def _do_cross_process(self, key, fn):
+        cache = caches[self.alias]
+        lock_key = self._lock_key(key)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+
+        acquired = cache.add(lock_key, token, timeout=self.lock_timeout)
+        holder = None if acquired else cache.get(lock_key)
+        while not acquired:
+            if holder is not None:
+                result = cache.get(self._result_key(key, holder))
+                if result is not None:
+                    self._count('cross_process_coalesced')
+                    return result, True
+            if time.monotonic() >= deadline:
+                break  # the holder died or hung - go upstream ourselves
+            time.sleep(self.poll_interval)
+            acquired = cache.add(lock_key, token, timeout=self.lock_timeout)
+            if not acquired:
+                holder = cache.get(lock_key) or holder
+
+        try:
+            # The holder we waited on may have published just before we took the lock
+            if holder is not None:
+                result = cache.get(self._result_key(key, holder))
+                if result is not None:
+                    self._count('cross_process_coalesced')
+                    return result, True
+            result = fn()
+            cache.set(self._result_key(key, token), result, timeout=self.result_ttl)
+            return result, False
+        finally:
+            if acquired and cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    # === EVENT LOOP (ASGI views) ===
+
+    def ajoin(self, key):
+        """
+        Event-loop join(): (future, leader). The leader settles the future with afinish();
+        followers await it with await_leader().
+        """
+        loop = asyncio.get_running_loop()
+        future = None
+        if self.enabled:
+            calls = self._async_calls.setdefault(loop, {})
+            future = calls.get(key)
+        if future is not None:
+            self._count('coalesced')
+            return future, False
+
+        future = loop.create_future()
+        # Don't warn about an unretrieved exception when nobody was waiting
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if self.enabled:
+            calls[key] = future
+            self._count('leaders')
+        return future, True
+
+    def afinish(self, key, future, result=None, error=None, abandoned=False):
+        """Settle a leader's future. Abandoned cancels it, so the followers retry"""
+        calls = self._async_calls.get(asyncio.get_running_loop(), {})
+        if calls.get(key) is future:
+            del calls[key]
+        if abandoned:
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def await_leader(self, future):
+        """(result, abandoned) of a future this follower joined; raises the leader's error"""
+        try:
+            return await asyncio.shield(future), False
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise  # this request was cancelled, not the call it waited on
+            return None, True
+
+    async def ado(self, key, coro_fn):
+        """Async do(): coro_fn() is awaited once per key per event loop"""
+        if not self.enabled:
+            return await coro_fn(), False
+
+        while True:
+            future, leader = self.ajoin(key)
+            if leader:
+                break
+            result, abandoned = await self.await_leader(future)
+            if not abandoned:
+                return result, True
+            # The leader's client went away: try again, as the new leader if nobody beat us to it
+
+        try:
+            if self.cross_process:
+                result, shared = await self._ado_cross_process(key, coro_fn)
+            else:
+                result, shared = await coro_fn(), False
+        except asyncio.CancelledError:
+            # Only the leader's request is gone - cancel the shared future so the followers
+            # retry instead of failing with it
+            self.afinish(key, future, abandoned=True)
+            raise
+        except BaseException as e:
+            self.afinish(key, future, error=e)
+            raise
+        self.afinish(key, future, result=result)
+        return result, shared
+
+    async def _ado_cross_process(self, key, coro_fn):
+        cache = caches[self.alias]
+        lock_key = self._lock_key(key)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+
+        acquired = await cache.aadd(lock_key, token, timeout=self.lock_timeout)
+        holder = None if acquired else await cache.aget(lock_key)
+        while not acquired:
+            if holder is not None:
+                result = await cache.aget(self._result_key(key, holder))
+                if result is not None:
+                    self._count('cross_process_coalesced')
+                    return result, True
+            if time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(self.poll_interval)
+            acquired = await cache.aadd(lock_key, token, timeout=self.lock_timeout)
+            if not acquired:
+                holder = await cache.aget(lock_key) or holder
+
+        try:
+            if holder is not None:
+                result = await cache.aget(self._result_key(key, holder))
+                if result is not None:
+                    self._count('cross_process_coalesced')
+                    return result, True
+            result = await coro_fn()
+            await cache.aset(self._result_key(key, token), result, timeout=self.result_ttl)
+            return result, False
+        finally:
+            if acquired and await cache.aget(lock_key) == token:
+                await cache.adelete(lock_key)
+
+    def stats(self):
+        """Per-process coalescing counters"""
+        with self._lock:
+            in_flight = len(self._calls)
+        return {
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'cross_process_coalesced': self.cross_process_coalesced,
+            'in_flight': in_flight,
+            'cross_process': self.cross_process,
+        }
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Process-wide SingleFlight, built from settings on first use"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight.from_settings()
+    return _single_flight
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    global _single_flight
+    if setting.startswith('GEMINI_'):
+        _single_flight = None
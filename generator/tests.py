@@ -1,3 +1,1206 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import Count, Q
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .activity_tracker import PageViewRecord, write_page_views
+from .analytics import PromptAnalyzer, build_keyword_matcher
+from .batch_analysis import BatchAnalyzer
+from .copy_tracking import generation_ref
+from .counters import bump_template_usage, flush_counters, get_counters
+from .deferred_analysis import DeferredAnalysisExecutor, analysis_fields, get_analysis_executor, stale_version_counts
+from .gemini import GeminiAPIError, GeminiTimeout
+from .jobs import JobWorkerPool, claim_next_job, enqueue_generation_job, finish_job, purge_finished_jobs
+from .keyword_matcher import KeywordMatcher, ahocorasick
+from .models import GenerationJob, PageView, PromptGeneration, TemplateUsage, UserSession
+from .prompt_template import (
+    GENERATION_SLOTS, GENERATION_TEMPLATE, PromptTemplate, PromptTemplateError, check_slots, render_generation_prompt,
+)
+from .readability import flesch_reading_ease, flesch_reading_ease_batch
+from .reanalysis import UPDATE_FIELDS, Checkpoint, bulk_update_generations
+from .singleflight import SingleFlight
+from .theory_rules import suggest_theory, theory_enhancement
+from .views import (
+    astream_gemini_text, generate_prompt_batch_async, generation_job_status_async, run_generation_job,
+    stream_gemini_text,
+)
+
+
+def run_concurrently(target, threads=8, repeat=25):
+    """Call target() `repeat` times from each of `threads` threads started together"""
+    start = threading.Barrier(threads)
+    errors = []
+
+    def worker():
+        start.wait()
+        try:
+            for _ in range(repeat):
+                target()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # Not close_old_connections(): with CONN_MAX_AGE the thread's connection would stay open
+            connections.close_all()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return errors
+
+
+class ConcurrentCounterTests(TransactionTestCase):
+    threads = 8
+    repeat = 25
+
+    def test_template_usage_increments_are_not_lost(self):
+        errors = run_concurrently(lambda: bump_template_usage('lesson-plan'), self.threads, self.repeat)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(TemplateUsage.objects.filter(template_name='lesson-plan').count(), 1)
+        self.assertEqual(TemplateUsage.objects.get(template_name='lesson-plan').usage_count, self.threads * self.repeat)
+
+    def test_pages_visited_increments_are_not_lost(self):
+        def visit():
+            write_page_views([PageViewRecord('session-1', '/', 'GET', timezone.now(), '')])
+
+        errors = run_concurrently(visit, self.threads, self.repeat)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(UserSession.objects.get(session_id='session-1').pages_visited, self.threads * self.repeat)
+
+    @override_settings(COUNTERS_AGGREGATED=True, COUNTERS_FLUSH_INTERVAL=60)
+    def test_aggregated_increments_are_written_on_flush(self):
+        errors = run_concurrently(lambda: bump_template_usage('quiz'), self.threads, self.repeat)
+
+        self.assertEqual(errors, [])
+        self.assertFalse(TemplateUsage.objects.filter(template_name='quiz').exists())
+        self.assertEqual(get_counters().stats()['pending']['template_usage'], self.threads * self.repeat)
+
+        flush_counters()
+        self.assertEqual(TemplateUsage.objects.get(template_name='quiz').usage_count, self.threads * self.repeat)
+
+
+ANALYSIS_RECORDS = [
+    ({'role': 'High school teacher', 'subject': 'Biology', 'task': 'Create a lesson plan',
+      'context': 'Grade 10 students', 'methodology': 'Inquiry-based learning'},
+     "Create a detailed lesson plan on photosynthesis for grade 10 students. Students will analyze data "
+     "from a lab experiment, evaluate their hypotheses and design a follow-up investigation. Include a "
+     "rubric for assessment and differentiation strategies for English language learners."),
+    ({'role': 'Primary teacher', 'subject': 'Mathematics', 'task': 'Design a quiz', 'context': 'Year 3',
+      'methodology': 'Gamification'},
+     "Design a 10-question quiz on fractions with visual models. Use a game format with points, and "
+     "provide hints for struggling learners."),
+    ({'role': 'University lecturer', 'subject': 'History', 'task': 'Write discussion questions',
+      'context': 'Undergraduate seminar', 'methodology': 'Socratic seminar'},
+     "Write five open-ended discussion questions that ask students to compare primary sources about the "
+     "French Revolution and justify their interpretations with evidence."),
+    ({'role': 'Teacher', 'subject': 'Art', 'task': 'Plan a project', 'context': 'Middle school',
+      'methodology': 'Project-based learning'},
+     "Plan a collaborative project where students create a mural using digital tools; integrate "
+     "technology, offer multiple means of engagement and representation (UDL), and connect to local "
+     "community history."),
+    ({'role': '', 'subject': '', 'task': '', 'context': '', 'methodology': ''}, "Hello."),
+]
+
+
+class AnalysisParityTests(SimpleTestCase):
+    def test_batch_analyzer_matches_analysis_fields(self):
+        expected = [analysis_fields(data, text_response) for data, text_response in ANALYSIS_RECORDS]
+
+        self.assertEqual(BatchAnalyzer().analyze(ANALYSIS_RECORDS), expected)
+
+    @skipUnless(BatchAnalyzer().available, 'needs numpy/scipy and the compiled keyword matcher')
+    def test_vectorized_path_is_used(self):
+        analyzer = BatchAnalyzer()
+        with mock.patch('generator.batch_analysis.analysis_fields') as per_row:
+            analyzer.analyze(ANALYSIS_RECORDS)
+        per_row.assert_not_called()
+
+
+# Scored by textstat 0.7 (every word is in cmudict)
+FLESCH_REFERENCE = [
+    ("The cat sat on the mat.", 116.15),
+    ("Create a lesson plan that helps students understand photosynthesis. Include a short quiz at the end.",
+     63.36),
+    ("Students will analyze primary sources and evaluate the reliability of historical evidence!", -25.31),
+    ("Design an engaging activity. Keep it simple. Make it fun?", 59.67),
+    ("Differentiated instruction accommodates individual learning preferences through collaborative "
+     "investigation.", -132.25),
+]
+
+
+class FleschParityTests(SimpleTestCase):
+    def test_matches_textstat_reference_scores(self):
+        for text, score in FLESCH_REFERENCE:
+            with self.subTest(text):
+                self.assertEqual(flesch_reading_ease(text), score)
+
+    def test_batch_matches_single_text_scores(self):
+        texts = [text for text, score in FLESCH_REFERENCE]
+
+        self.assertEqual(flesch_reading_ease_batch(texts), [score for text, score in FLESCH_REFERENCE])
+
+
+def hot_queries():
+    """The analytics and track_copy() query shapes the Meta.indexes are designed for"""
+    week_ago = timezone.now() - timedelta(days=7)
+    theories = PromptGeneration.objects.filter(selected_theory__gt='')
+    onboarded = UserSession.objects.filter(onboarding_completed=True)
+    return {
+        'track_copy fallback (latest generation)': PromptGeneration.objects.filter(
+            session__session_id='session-1'
+        ).order_by('-timestamp')[:1],
+        'weekly prompts': PromptGeneration.objects.filter(timestamp__gte=week_ago),
+        'copied prompts': PromptGeneration.objects.filter(copied_to_clipboard=True),
+        'subject distribution': PromptGeneration.objects.exclude(
+            subject_category__isnull=True
+        ).values('subject_category').annotate(count=Count('id')),
+        'theory distribution': theories.values('selected_theory').annotate(count=Count('id')),
+        'theory effectiveness': theories.values('selected_theory').annotate(
+            total_usage=Count('id'), copied_count=Count('id', filter=Q(copied_to_clipboard=True))
+        ),
+        'enhancement theory cross': theories.values('enhancement_mode', 'selected_theory').annotate(count=Count('id')),
+        'theory selection method': theories.filter(theory_auto_suggested=True),
+        'weekly sessions': UserSession.objects.filter(start_time__gte=week_ago),
+        'completed onboarding': onboarded,
+        'ai experience': onboarded.values('ai_experience').annotate(count=Count('ai_experience')),
+        'teaching years': onboarded.values('teaching_years').annotate(count=Count('teaching_years')),
+        'completed training needs': UserSession.objects.filter(training_needs_completed=True),
+    }
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'query plans are only checked on SQLite and PostgreSQL')
+class QueryPlanTests(TestCase):
+    """EXPLAIN every hot query and fail if the planner falls back to a full table scan"""
+
+    tables = (PromptGeneration._meta.db_table, UserSession._meta.db_table)
+
+    def full_scans(self, queryset):
+        if connection.vendor == 'postgresql':
+            # On small test tables a sequential scan is always cheapest; with it disabled
+            # the planner still picks one if no index fits the query
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                plan = queryset.explain()
+            pattern = rf"Seq Scan on ({'|'.join(self.tables)})\b"
+        else:
+            plan = queryset.explain()
+            pattern = rf"\bSCAN (?:TABLE )?({'|'.join(self.tables)})\b(?! USING)"
+        return [line.strip() for line in plan.splitlines() if re.search(pattern, line)]
+
+    def test_hot_queries_use_an_index(self):
+        for name, queryset in hot_queries().items():
+            with self.subTest(name):
+                self.assertEqual(self.full_scans(queryset), [])
+
+    def test_full_scan_is_detected(self):
+        self.assertNotEqual(self.full_scans(PromptGeneration.objects.filter(task='lesson plan')), [])
+
+
+class TrackCopyTests(TestCase):
+    def setUp(self):
+        self.client.defaults.update(HTTP_HOST='localhost', HTTP_USER_AGENT='Mozilla/5.0')
+        session = self.client.session
+        session.save()
+        self.session_key = session.session_key
+        user_session = UserSession.objects.create(session_id=self.session_key)
+        self.first = PromptGeneration.objects.create(session=user_session, success=True)
+        self.latest = PromptGeneration.objects.create(session=user_session, success=True)
+        PromptGeneration.objects.filter(pk=self.first.pk).update(timestamp=timezone.now() - timedelta(minutes=5))
+
+    def track_copy(self, body):
+        return self.client.post('/track-copy/', json.dumps(body), content_type='application/json')
+
+    def copied(self):
+        return set(PromptGeneration.objects.filter(copied_to_clipboard=True).values_list('pk', flat=True))
+
+    def test_signed_ref_is_marked(self):
+        response = self.track_copy({'generations': [generation_ref(self.session_key, self.first.pk)]})
+
+        self.assertEqual(response.json()['marked'], 1)
+        self.assertEqual(self.copied(), {self.first.pk})
+
+    def test_ref_signed_for_another_session_is_ignored(self):
+        response = self.track_copy({'generations': [generation_ref('another-session', self.first.pk)]})
+
+        self.assertEqual(response.json()['marked'], 0)
+        self.assertEqual(self.copied(), set())
+
+    def test_non_int_id_is_ignored(self):
+        token = generation_ref(self.session_key, self.first.pk)['token']
+        response = self.track_copy({'generations': [{'id': str(self.first.pk), 'token': token}]})
+
+        self.assertEqual(response.json()['marked'], 0)
+        self.assertEqual(self.copied(), set())
+
+    def test_body_without_refs_marks_only_the_latest_generation(self):
+        response = self.track_copy({})
+
+        self.assertEqual(response.json()['marked'], 1)
+        self.assertEqual(self.copied(), {self.latest.pk})
+
+    def test_json_array_body_is_rejected(self):
+        response = self.track_copy([generation_ref(self.session_key, self.first.pk)])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Body must be a JSON object')
+        self.assertEqual(self.copied(), set())
+
+
+GENERATE_REQUEST = {
+    'role': 'teacher', 'subject': 'Biology', 'task': 'lesson plan', 'context': 'high school',
+    'methodology': 'inquiry-based learning', 'tone': 'encouraging',
+}
+
+
+class BlockingStreamClient:
+    """Fake Gemini client whose stream() sends its first chunk, then waits for `release`"""
+
+    def __init__(self, chunks=('Plan ', 'a lesson.')):
+        self.chunks = chunks
+        self.streams = 0
+        self.first_chunk_sent = threading.Event()
+        self.release = threading.Event()
+
+    def stream(self, payload):
+        self.streams += 1
+        yield self.chunks[0]
+        self.first_chunk_sent.set()
+        self.release.wait(5)
+        yield from self.chunks[1:]
+
+    async def astream(self, payload):
+        self.streams += 1
+        yield self.chunks[0]
+        self.first_chunk_sent.set()
+        while not self.release.is_set():
+            await asyncio.sleep(0.01)
+        for chunk in self.chunks[1:]:
+            yield chunk
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out waiting')
+        time.sleep(0.01)
+
+
+class StreamCoalescingTests(SimpleTestCase):
+    def setUp(self):
+        self.client_stub = BlockingStreamClient()
+        self.single_flight = SingleFlight()
+        for target, stub in (('get_gemini_client', self.client_stub), ('get_single_flight', self.single_flight)):
+            patcher = mock.patch(f'generator.views.{target}', return_value=stub)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_follower_replays_the_leaders_stream_as_one_chunk(self):
+        leader = stream_gemini_text({}, 'key')
+        self.assertEqual(next(leader), ('Plan ', False))
+        follower_chunks = []
+        follower = threading.Thread(target=lambda: follower_chunks.extend(stream_gemini_text({}, 'key')))
+        follower.start()
+        wait_for(lambda: self.single_flight.stats()['coalesced'] == 1)
+
+        self.client_stub.release.set()
+        self.assertEqual(list(leader), [('a lesson.', False)])
+        follower.join(5)
+
+        self.assertEqual(follower_chunks, [('Plan a lesson.', True)])
+        self.assertEqual(self.client_stub.streams, 1)
+
+    def test_follower_streams_itself_when_the_leader_disconnects(self):
+        leader = stream_gemini_text({}, 'key')
+        next(leader)
+        follower_chunks = []
+        follower = threading.Thread(target=lambda: follower_chunks.extend(stream_gemini_text({}, 'key')))
+        follower.start()
+        wait_for(lambda: self.single_flight.stats()['coalesced'] == 1)
+
+        leader.close()
+        self.client_stub.release.set()
+        follower.join(5)
+
+        self.assertEqual(follower_chunks, [('Plan ', False), ('a lesson.', False)])
+        self.assertEqual(self.client_stub.streams, 2)
+
+    def test_async_streams_are_coalesced(self):
+        async def collect():
+            return [chunk async for chunk in astream_gemini_text({}, 'key')]
+
+        async def run():
+            leader = asyncio.create_task(collect())
+            await asyncio.to_thread(self.client_stub.first_chunk_sent.wait, 5)
+            follower = asyncio.create_task(collect())
+            await asyncio.sleep(0.05)
+            self.client_stub.release.set()
+            return await leader, await follower
+
+        leader_chunks, follower_chunks = asyncio.run(run())
+
+        self.assertEqual(leader_chunks, [('Plan ', False), ('a lesson.', False)])
+        self.assertEqual(follower_chunks, [('Plan a lesson.', True)])
+        self.assertEqual(self.client_stub.streams, 1)
+
+
+class StreamViewTests(TestCase):
+    def setUp(self):
+        self.client.defaults.update(HTTP_HOST='localhost', HTTP_USER_AGENT='Mozilla/5.0')
+
+    def post_stream(self):
+        return self.client.post('/generate/stream/', json.dumps(GENERATE_REQUEST), content_type='application/json')
+
+    @override_settings(GENERATION_QUEUE_MODE=True)
+    def test_queue_mode_enqueues_instead_of_streaming(self):
+        with mock.patch('generator.views.get_gemini_client') as get_client:
+            response = self.post_stream()
+
+        self.assertEqual(response.status_code, 202)
+        job = GenerationJob.objects.get()
+        self.assertEqual(response.json()['job_id'], str(job.pk))
+        self.assertEqual(job.session_id, self.client.session.session_key)
+        get_client.assert_not_called()
+
+    @override_settings(GENERATION_QUEUE_MODE=False, GEMINI_CACHE_ENABLED=False)
+    def test_stream_is_recorded_once_done(self):
+        client_stub = BlockingStreamClient()
+        client_stub.release.set()
+        with mock.patch('generator.views.get_gemini_client', return_value=client_stub):
+            events = b''.join(self.post_stream().streaming_content).decode()
+
+        self.assertIn('event: done', events)
+        self.assertEqual(PromptGeneration.objects.get().generated_prompt, 'Plan a lesson.')
+
+
+GEMINI_BODY = json.dumps({'candidates': [{'content': {'parts': [{'text': 'Plan a lesson.'}]}}]})
+GENERATE_META = {
+    'enhancement_type': 'enhanced', 'is_theory_request': False, 'is_improvement_request': False,
+    'applied_theory': 'blooms', 'selected_theory': '',
+}
+
+
+def queue_job(**fields):
+    job = enqueue_generation_job('session-1', GENERATE_REQUEST, 'Plan a lesson', GENERATE_META)
+    if fields:
+        GenerationJob.objects.filter(pk=job.pk).update(**fields)
+    return job
+
+
+def expire_lease(job):
+    GenerationJob.objects.filter(pk=job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+
+class GenerationJobTests(TestCase):
+    def test_expired_lease_is_claimed_again(self):
+        job = queue_job()
+        first = claim_next_job('worker-a', lease_seconds=60)
+        self.assertIsNone(claim_next_job('worker-b', lease_seconds=60))
+
+        expire_lease(job)
+        second = claim_next_job('worker-b', lease_seconds=60)
+
+        self.assertEqual((first.pk, first.attempts), (job.pk, 1))
+        self.assertEqual((second.pk, second.worker_id, second.attempts), (job.pk, 'worker-b', 2))
+
+    def test_result_is_dropped_once_the_lease_is_lost(self):
+        job = queue_job()
+        stale = claim_next_job('worker-a', lease_seconds=60)
+        expire_lease(job)
+        claim_next_job('worker-b', lease_seconds=60)
+
+        with mock.patch('generator.views.fetch_gemini_response', return_value=(GEMINI_BODY, False)):
+            run_generation_job(stale)
+        finish_job(stale, 'late response')
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id, job.response), ('running', 'worker-b', None))
+        self.assertFalse(PromptGeneration.objects.exists())
+
+    def test_job_is_recorded_and_finished_together(self):
+        queue_job()
+        job = claim_next_job('worker-a', lease_seconds=60)
+
+        with mock.patch('generator.views.fetch_gemini_response', return_value=(GEMINI_BODY, False)):
+            run_generation_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.response), ('done', 'Plan a lesson.'))
+        self.assertEqual(job.prompt_generation.generated_prompt, 'Plan a lesson.')
+
+    def test_gemini_error_fails_the_job(self):
+        queue_job()
+        job = claim_next_job('worker-a', lease_seconds=60)
+
+        with mock.patch('generator.views.fetch_gemini_response', side_effect=GeminiTimeout('slow')):
+            run_generation_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error_status, job.error['error']), ('failed', 408, 'Request timeout'))
+
+    def test_finished_jobs_past_retention_are_purged(self):
+        old = timezone.now() - timedelta(hours=25)
+        expired = [queue_job(status=status, finished_at=old) for status in ('done', 'failed')]
+        recent = queue_job(status='done', finished_at=timezone.now())
+        running = queue_job(status='running', started_at=old)
+
+        self.assertEqual(purge_finished_jobs(retention_hours=24), 2)
+        self.assertEqual(set(GenerationJob.objects.values_list('pk', flat=True)), {recent.pk, running.pk})
+        self.assertFalse(GenerationJob.objects.filter(pk__in=[job.pk for job in expired]).exists())
+
+    @override_settings(GENERATION_QUEUE_POLL_INTERVAL=0.01, GENERATION_QUEUE_MAX_WAIT=5)
+    async def test_async_status_long_polls_until_the_job_finishes(self):
+        job = await GenerationJob.objects.acreate(session_id='session-1', prompt='Plan a lesson')
+        request = AsyncRequestFactory().get('/generate/jobs/', {'wait': 5})
+        request.session = mock.Mock(session_key='session-1')
+
+        async def finish_soon():
+            await asyncio.sleep(0.1)
+            await GenerationJob.objects.filter(pk=job.pk).aupdate(
+                status='done', response='Plan a lesson.', finished_at=timezone.now()
+            )
+
+        started = time.monotonic()
+        response, _ = await asyncio.gather(generation_job_status_async(request, job.pk), finish_soon())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['response'], 'Plan a lesson.')
+        self.assertLess(time.monotonic() - started, 5)
+
+
+class JobWorkerPoolTests(TransactionTestCase):
+    def run_pool(self, handler, max_attempts=3):
+        pool = JobWorkerPool(handler, threads=1, poll_interval=0.01, lease_seconds=60, max_attempts=max_attempts)
+        pool.start()
+        try:
+            wait_for(lambda: pool.processed)
+        finally:
+            pool.stop(5)
+        return pool
+
+    def test_concurrent_claims_hand_a_job_to_one_worker(self):
+        queue_job()
+        claims = []
+        errors = run_concurrently(
+            lambda: claims.append(claim_next_job(threading.current_thread().name, lease_seconds=60)), repeat=1
+        )
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len([job for job in claims if job is not None]), 1)
+        self.assertEqual(GenerationJob.objects.get().attempts, 1)
+
+    def test_crashing_handler_fails_the_job(self):
+        job = queue_job()
+        pool = self.run_pool(mock.Mock(side_effect=RuntimeError('boom')))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error_status), ('failed', 500))
+        self.assertEqual(pool.failed, 1)
+
+    def test_job_over_max_attempts_fails_without_running(self):
+        job = queue_job(status='running', attempts=3, lease_expires_at=timezone.now() - timedelta(seconds=1))
+        handler = mock.Mock()
+        self.run_pool(handler, max_attempts=3)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error_status), ('failed', 4, 500))
+        handler.assert_not_called()
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        self.single_flight = SingleFlight(poll_interval=0.01)
+        self.release = threading.Event()
+        self.calls = 0
+
+    def blocking_call(self):
+        self.calls += 1
+        self.release.wait(5)
+        return f'response {self.calls}'
+
+    def test_threads_share_one_call(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.single_flight.do('key', self.blocking_call)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        wait_for(lambda: self.single_flight.stats()['coalesced'] == 3)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(sorted(results), [('response 1', False)] + [('response 1', True)] * 3)
+
+    def test_event_loop_shares_one_call(self):
+        async def call():
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            return 'response'
+
+        async def run():
+            return await asyncio.gather(*(self.single_flight.ado('key', call) for _ in range(4)))
+
+        results = asyncio.run(run())
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [('response', False)] + [('response', True)] * 3)
+
+    def test_followers_retry_when_the_async_leader_is_cancelled(self):
+        async def call():
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            return f'response {self.calls}'
+
+        async def run():
+            leader = asyncio.create_task(self.single_flight.ado('key', call))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(self.single_flight.ado('key', call))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await follower
+
+        self.assertEqual(asyncio.run(run()), ('response 2', False))
+        self.assertEqual(self.calls, 2)
+
+    def test_leader_error_reaches_the_followers(self):
+        async def call():
+            await asyncio.sleep(0.01)
+            raise GeminiTimeout('slow')
+
+        async def run():
+            return await asyncio.gather(*(self.single_flight.ado('key', call) for _ in range(2)),
+                                        return_exceptions=True)
+
+        self.assertEqual([type(result) for result in asyncio.run(run())], [GeminiTimeout, GeminiTimeout])
+
+
+class CrossProcessSingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.single_flight = SingleFlight(cross_process=True, alias='default', lock_timeout=1, poll_interval=0.01)
+
+    def test_finished_result_is_not_served_to_later_requests(self):
+        responses = iter(['first', 'second'])
+
+        self.assertEqual(self.single_flight.do('key', lambda: next(responses)), ('first', False))
+        self.assertEqual(self.single_flight.do('key', lambda: next(responses)), ('second', False))
+
+    def test_waiter_gets_the_lock_holders_result(self):
+        # Another worker holds the lock and publishes its result while we wait
+        cache = caches['default']
+        cache.add(self.single_flight._lock_key('key'), 'other-worker')
+        publish = threading.Timer(0.05, lambda: (
+            cache.set(self.single_flight._result_key('key', 'other-worker'), 'shared'),
+            cache.delete(self.single_flight._lock_key('key')),
+        ))
+        publish.start()
+
+        result = self.single_flight.do('key', lambda: 'own call')
+        publish.join()
+
+        self.assertEqual(result, ('shared', True))
+        self.assertEqual(self.single_flight.stats()['cross_process_coalesced'], 1)
+
+
+def post_generate(client, path='/generate/', body=GENERATE_REQUEST):
+    with mock.patch('generator.views.fetch_gemini_response', return_value=(GEMINI_BODY, False)):
+        return client.post(path, json.dumps(body), content_type='application/json')
+
+
+class DeferredAnalysisTests(TestCase):
+    def setUp(self):
+        self.client.defaults.update(HTTP_HOST='localhost', HTTP_USER_AGENT='Mozilla/5.0')
+        session = UserSession.objects.create(session_id='session-1')
+        self.generation = PromptGeneration.objects.create(
+            session=session, success=True, generated_prompt='Plan a lesson.', analysis_pending=True
+        )
+        self.expected = analysis_fields(GENERATE_REQUEST, 'Plan a lesson.')
+
+    def analysed_fields(self):
+        return PromptGeneration.objects.filter(pk=self.generation.pk).values(*self.expected).get()
+
+    @override_settings(ANALYSIS_DEFERRED=True)
+    def test_analysis_is_submitted_after_commit(self):
+        with mock.patch.object(DeferredAnalysisExecutor, 'submit') as submit:
+            with self.captureOnCommitCallbacks() as callbacks:
+                post_generate(self.client)
+            submit.assert_not_called()
+            generation = PromptGeneration.objects.latest('pk')
+            self.assertTrue(generation.analysis_pending)
+
+            for callback in callbacks:
+                callback()
+        submit.assert_called_once_with(generation.pk, GENERATE_REQUEST, 'Plan a lesson.')
+
+    def test_overloaded_executor_analyses_inline(self):
+        executor = DeferredAnalysisExecutor(workers=1, max_backlog=0)
+        executor.submit(self.generation.pk, GENERATE_REQUEST, 'Plan a lesson.')
+
+        self.assertEqual(self.analysed_fields(), self.expected)
+        self.assertFalse(PromptGeneration.objects.get(pk=self.generation.pk).analysis_pending)
+        self.assertEqual((executor.stats()['ran_inline'], executor.stats()['completed']), (1, 1))
+
+    def test_inline_failure_is_logged_not_raised(self):
+        executor = DeferredAnalysisExecutor(workers=1, max_backlog=0)
+        with mock.patch('generator.deferred_analysis.complete_analysis', side_effect=DatabaseError('locked')):
+            executor.submit(self.generation.pk, GENERATE_REQUEST, 'Plan a lesson.')
+
+        self.assertTrue(PromptGeneration.objects.get(pk=self.generation.pk).analysis_pending)
+        self.assertEqual(executor.stats()['failed'], 1)
+
+
+@override_settings(ANALYSIS_DEFERRED=True, ANALYSIS_WORKERS=1, ANALYSIS_MAX_BACKLOG=10)
+class DeferredAnalysisCommitTests(TransactionTestCase):
+    def test_worker_fills_in_the_analysis_after_commit(self):
+        self.client.defaults.update(HTTP_HOST='localhost', HTTP_USER_AGENT='Mozilla/5.0')
+        response = post_generate(self.client)
+        self.assertTrue(get_analysis_executor().flush(5))
+
+        generation = PromptGeneration.objects.get()
+        expected = analysis_fields(GENERATE_REQUEST, 'Plan a lesson.')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(generation.analysis_pending)
+        self.assertEqual({field: getattr(generation, field) for field in expected}, expected)
+
+
+class ReanalysisTests(TestCase):
+    def setUp(self):
+        session = UserSession.objects.create(session_id='session-1')
+        self.generations = [
+            PromptGeneration.objects.create(
+                session=session, success=True, analyzer_version='old', analysis_pending=True,
+                generated_prompt=text_response, **data
+            )
+            for data, text_response in ANALYSIS_RECORDS
+        ]
+        self.pks = [generation.pk for generation in self.generations]
+
+    def stored(self):
+        return list(PromptGeneration.objects.filter(pk__in=self.pks).order_by('pk').values_list(*UPDATE_FIELDS))
+
+    def reanalyze(self, *args):
+        stdout = StringIO()
+        call_command('reanalyze_prompts', '--workers', '1', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_fast_bulk_update_matches_bulk_update(self):
+        originals = self.stored()
+        for generation, (data, text_response) in zip(self.generations, ANALYSIS_RECORDS):
+            for field, value in {**analysis_fields(data, text_response), 'analysis_pending': False}.items():
+                setattr(generation, field, value)
+
+        bulk_update_generations(self.generations, UPDATE_FIELDS, batch_size=2)
+        fast = self.stored()
+        PromptGeneration.objects.filter(pk__in=self.pks).delete()
+        PromptGeneration.objects.bulk_create(self.generations)
+        PromptGeneration.objects.bulk_update(self.generations, UPDATE_FIELDS, batch_size=2)
+
+        self.assertNotEqual(fast, originals)
+        self.assertEqual(fast, self.stored())
+
+    def test_dry_run_reports_changes_without_writing(self):
+        before = self.stored()
+        output = self.reanalyze('--dry-run', '--show', '100')
+
+        self.assertEqual(self.stored(), before)
+        self.assertIn(f"  #{self.pks[0]} analyzer_version: 'old' -> ", output)
+        self.assertIn(f'{len(self.pks)} would change', output)
+
+    def test_resumes_after_the_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'reanalysis.json')
+            Checkpoint(path, {'stale_for': PromptAnalyzer.VERSION}).save(self.pks[1], 2)
+            output = self.reanalyze('--checkpoint', path)
+            self.assertFalse(os.path.exists(path))
+
+        versions = dict(PromptGeneration.objects.filter(pk__in=self.pks).values_list('pk', 'analyzer_version'))
+        self.assertIn(f'Resuming after generation {self.pks[1]}', output)
+        self.assertEqual([versions[pk] for pk in self.pks[:2]], ['old', 'old'])
+        self.assertEqual({versions[pk] for pk in self.pks[2:]}, {PromptAnalyzer.VERSION})
+
+    def test_checkpoint_for_other_filters_is_refused(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'reanalysis.json')
+            Checkpoint(path, {'since': '2026-01-01'}).save(self.pks[1], 2)
+            with self.assertRaises(CommandError):
+                self.reanalyze('--checkpoint', path)
+
+
+class StaleAnalysisTests(TestCase):
+    def setUp(self):
+        session = UserSession.objects.create(session_id='session-1')
+        for version, pending in (('1.0', False), ('1.0', False), ('', False), ('', True)):
+            PromptGeneration.objects.create(
+                session=session, success=True, generated_prompt='Plan a lesson.',
+                analyzer_version=version, analysis_pending=pending,
+            )
+
+    def test_pending_rows_are_not_stale(self):
+        self.assertEqual(stale_version_counts(), [('1.0', 2), ('', 1)])
+
+    def test_change_list_shows_stale_rows_per_version(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get('/admin/generator/promptgeneration/', HTTP_HOST='localhost')
+
+        self.assertContains(response, '<tr><td>1.0</td><td>2</td></tr>', html=True)
+        self.assertContains(response, '<tr><td>unversioned</td><td>1</td></tr>', html=True)
+
+
+@override_settings(TRAFFIC_SKIP_AUTOMATED=True, PAGE_VIEW_BUFFERED=False)
+class TrafficTests(TestCase):
+    def get_index(self, **headers):
+        return self.client.get('/', HTTP_HOST='localhost', **headers)
+
+    def test_automated_requests_are_not_tracked(self):
+        requests = {
+            'bot': {'HTTP_USER_AGENT': 'Mozilla/5.0 (compatible; Googlebot/2.1)'},
+            'probe': {'HTTP_USER_AGENT': 'kube-probe/1.29'},
+            'prefetch': {'HTTP_USER_AGENT': 'Mozilla/5.0', 'HTTP_SEC_PURPOSE': 'prefetch'},
+            'no user agent': {},
+        }
+        for name, headers in requests.items():
+            with self.subTest(name):
+                response = self.get_index(**headers)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('sessionid', response.cookies)
+                self.assertFalse(UserSession.objects.exists())
+                self.assertFalse(PageView.objects.exists())
+
+    def test_browser_request_is_tracked(self):
+        self.get_index(HTTP_USER_AGENT='Mozilla/5.0 (Windows NT 10.0; Win64; x64) Firefox/128.0')
+
+        self.assertEqual(UserSession.objects.get().pages_visited, 1)
+        self.assertEqual(PageView.objects.get().path, '/')
+
+    def test_readiness_returns_only_status_and_checks(self):
+        response = self.client.get('/readyz/', HTTP_HOST='localhost')
+
+        self.assertEqual(set(response.json()), {'status', 'checks'})
+
+
+WORD_BOUNDARY_CASES = [
+    # Punctuation, hyphens and line ends are boundaries; letters, digits and _ are not
+    ("review the math.", ['math']),
+    ("(math) homework", ['math']),
+    ("grade 5 math\nnext line", ['math']),
+    ("math-based games", ['math']),
+    ("mathematics", []),
+    ("math_club", []),
+    ("k-12.", ['k-12']),
+    ("pre-k-12 students", ['k-12']),
+    ("k-123", []),
+    ("build problem-solving!", ['problem-solving']),
+    ("problemsolving", []),
+    ("e-learning, blended", ['e-learning']),
+]
+
+
+def keyword_matcher(automaton=True):
+    with mock.patch('generator.keyword_matcher.ahocorasick', ahocorasick if automaton else None):
+        return (
+            KeywordMatcher()
+            .add_table('words', ['math', 'k-12', 'problem-solving', 'e-learning'], word_boundary=True)
+            .add_table('substrings', ['math'])
+            .compile()
+        )
+
+
+class KeywordMatcherTests(SimpleTestCase):
+    def assert_boundaries(self, matcher):
+        for text, words in WORD_BOUNDARY_CASES:
+            with self.subTest(text):
+                matches = matcher.scan(text)
+                self.assertEqual(matches.hits('words'), words)
+                self.assertEqual(matches.hits('substrings'), ['math'] if 'math' in text else [])
+
+    @skipUnless(ahocorasick, 'needs pyahocorasick')
+    def test_automaton_word_boundaries(self):
+        matcher = keyword_matcher()
+        self.assertTrue(matcher.has_automaton)
+        self.assert_boundaries(matcher)
+
+    def test_regex_fallback_word_boundaries(self):
+        matcher = keyword_matcher(automaton=False)
+        self.assertFalse(matcher.has_automaton)
+        self.assert_boundaries(matcher)
+
+    @skipUnless(ahocorasick, 'needs pyahocorasick')
+    def test_analyzer_tables_match_the_regex_fallback(self):
+        with mock.patch('generator.keyword_matcher.ahocorasick', None):
+            fallback = build_keyword_matcher()
+        texts = [text_response.lower() for data, text_response in ANALYSIS_RECORDS] + [
+            text for text, words in WORD_BOUNDARY_CASES
+        ] + ["analyze, evaluate; create (design) - re-create the k-12 stem/steam unit."]
+
+        for text in texts:
+            with self.subTest(text):
+                self.assertEqual(PromptAnalyzer.KEYWORD_MATCHER.scan(text).counts(), fallback.scan(text).counts())
+
+
+# The suggestion chain and generate_*_enhancement() chains /generate/ used before theory_rules.py:
+# (field, keywords, outcome) in chain order - enhancements by the start of their text
+LEGACY_SUGGESTIONS = [
+    ('methodology', ['inquiry', 'explore', 'discovery', 'problem'], 'constructivist'),
+    ('methodology', ['collaborative', 'group', 'peer'], 'social_learning'),
+    ('methodology', ['technology', 'ai', 'digital'], 'tpack'),
+    ('methodology', ['differentiated', 'adaptive', 'personalized'], 'udl'),
+    ('methodology', ['scaffolding', 'support', 'guidance'], 'scaffolding'),
+    ('task', ['critical thinking', 'questions', 'analysis'], 'blooms'),
+    ('task', ['assessment', 'quiz', 'rubric'], 'blooms'),
+    ('task', ['lesson plan', 'curriculum'], 'blooms'),
+    ('task', ['differentiated', 'multiple intelligences'], 'differentiation'),
+    ('context', ['mixed-ability', 'special needs', 'learning difficulties'], 'udl'),
+    (None, [], 'blooms'),
+]
+LEGACY_ENHANCEMENTS = {
+    'blooms': [
+        ('task', ['critical thinking', 'questions', 'analysis'], "Structure questions to progress from analysis"),
+        ('task', ['practice', 'exercises', 'activities'], "Design activities that span remember"),
+        ('task', ['assessment', 'quiz', 'rubric'], "Include assessment items covering multiple cognitive levels"),
+        ('task', ['lesson plan', 'introduction'], "Structure the lesson to progress through cognitive levels"),
+        (None, [], "Incorporate cognitive progression from basic recall"),
+    ],
+    'udl': [
+        ('context', ['mixed-ability', 'learning difficulties', 'special needs'], "Provide multiple means of representation"),
+        ('context', ['esl', 'efl'], "Include visual supports, simplified language options"),
+        (None, [], "Design with flexibility in content presentation"),
+    ],
+    'tpack': [
+        ('task', ['lesson plan', 'curriculum', 'complete plan'], "Explicitly specify: (1) which AI tools"),
+        ('task', ['assessment', 'quiz', 'rubric'], "Detail how AI-enhanced assessment tools"),
+        ('task', ['practice', 'exercises', 'activities'], "Describe specific AI-powered practice tools"),
+        ('methodology', ['ai', 'technology', 'digital'], "Clearly define the AI's pedagogical role"),
+        (None, [], "Include specific details about: how technology supports"),
+    ],
+    'constructivist': [
+        ('methodology', ['inquiry', 'discovery', 'explore'], "Support active knowledge construction through guided discovery"),
+        ('methodology', ['problem', 'real-world'], "Facilitate learning through authentic problem-solving"),
+        (None, [], "Encourage active knowledge construction through hands-on experiences"),
+    ],
+    'social_learning': [
+        ('methodology', ['collaborative', 'group', 'peer'], "Leverage peer interaction and collaborative learning"),
+        ('methodology', ['discussion', 'teamwork'], "Create structured opportunities for social learning"),
+        (None, [], "Incorporate peer interaction and social learning opportunities"),
+    ],
+    'scaffolding': [
+        ('context', ['ages 3-5', 'preschool'], "Provide extensive scaffolding with concrete examples"),
+        ('context', ['ages 6-11', 'primary'], "Include scaffolding supports such as graphic organizers"),
+        ('task', ['complex', 'advanced'], "Break down complex tasks into manageable steps"),
+        (None, [], "Provide appropriate scaffolding supports that can be gradually removed"),
+    ],
+    'differentiation': [
+        ('task', ['differentiated', 'multiple intelligences'], "Address diverse learning preferences"),
+        ('task', ['adaptive', 'personalized'], "Provide flexible learning options"),
+        (None, [], "Include differentiation strategies"),
+    ],
+}
+
+
+def legacy_cases(rules):
+    """(form_data, outcome) for every keyword of every rule, the keyword alone in a sentence"""
+    for field, keywords, outcome in rules:
+        for keyword in keywords or [None]:
+            form_data = {'methodology': '', 'task': '', 'context': ''}
+            if field is not None:
+                form_data[field] = f"A {keyword.upper()} unit"
+            yield form_data, outcome
+
+
+class TheoryRulesTests(SimpleTestCase):
+    def test_suggestions_match_the_legacy_chain(self):
+        for form_data, theory in legacy_cases(LEGACY_SUGGESTIONS):
+            with self.subTest(**form_data):
+                self.assertEqual(suggest_theory(**form_data), theory)
+
+    def test_enhancements_match_the_legacy_chains(self):
+        for selected_theory, rules in LEGACY_ENHANCEMENTS.items():
+            for form_data, text in legacy_cases(rules):
+                with self.subTest(selected_theory, **form_data):
+                    theory, enhancement = theory_enhancement(form_data, selected_theory)
+                    self.assertEqual(theory, selected_theory)
+                    self.assertTrue(enhancement.startswith(text), enhancement)
+
+    def test_earlier_rules_win(self):
+        self.assertEqual(suggest_theory('Group inquiry', 'quiz', 'special needs'), 'constructivist')
+        self.assertEqual(suggest_theory('', 'Differentiated quiz', ''), 'blooms')
+        theory, enhancement = theory_enhancement({'task': 'Quiz questions for practice'}, 'blooms')
+        self.assertTrue(enhancement.startswith("Structure questions to progress from analysis"))
+
+    def test_suggested_theory_gets_its_enhancement(self):
+        theory, enhancement = theory_enhancement({'methodology': 'Peer tutoring', 'task': 'Revision', 'context': None})
+        self.assertEqual(theory, 'social_learning')
+        self.assertTrue(enhancement.startswith("Leverage peer interaction"))
+
+    def test_unknown_theory_has_no_enhancement(self):
+        self.assertEqual(theory_enhancement({'task': 'quiz'}, 'montessori'), ('montessori', None))
+
+
+PROMPT_FIELDS = {
+    'role': 'High school teacher', 'subject': 'Biology', 'task': 'Create a lesson plan on {enzymes}',
+    'context': 'Grade 10, mixed-ability', 'methodology': 'Inquiry-based learning', 'tone': 'Encouraging',
+    'include': 'a lab activity', 'exclude': 'homework',
+}
+
+
+def legacy_prompt(fields, enhancement=None):
+    """
+    The instruction prompt as the form's JS template literal built it (doubled line breaks,
+    trailing indentation), with the old view splicing the enhancement in after instruction 6
+    """
+    examples = ''
+    if fields['include'] or fields['exclude']:
+        examples = '\n\nAdditional Guidelines:'
+        if fields['include']:
+            examples += f"\n- Include: {fields['include']}"
+        if fields['exclude']:
+            examples += f"\n- Avoid: {fields['exclude']}"
+    prompt = f"""
+
+Create a clear, professional AI prompt using EXACTLY these components. Do not add extra elements or creative flourishes.
+
+
+
+Components to connect:
+
+- Role: {fields['role']}
+
+- Subject: {fields['subject']}
+
+- Task: {fields['task']}
+
+- Context: {fields['context']}
+
+- Methodology: {fields['methodology']}
+
+- Tone: {fields['tone']}{examples}
+
+
+
+Instructions:
+
+1. Create a single, coherent prompt that combines these elements naturally
+
+2. Use proper English grammar and clear sentence structure
+
+3. Do NOT add elements not specified above
+
+4. Make it ready to copy-paste into any AI chatbot
+
+5. Start with "You are..." and include all the specified components
+
+6. Keep it professional and focused on the educational task
+
+      """
+    if enhancement:
+        instruction_6_end = prompt.find("\n", prompt.find("6. Keep it professional")) + 1
+        prompt = prompt[:instruction_6_end] + f"7. IMPORTANT: {enhancement}\n" + prompt[instruction_6_end:]
+    return prompt
+
+
+def prompt_lines(prompt):
+    """Non-blank lines without trailing whitespace - the server template drops the doubled blank lines"""
+    return [line.rstrip() for line in prompt.splitlines() if line.strip()]
+
+
+class PromptTemplateTests(SimpleTestCase):
+    def test_matches_the_legacy_prompt(self):
+        cases = {
+            'guidelines and enhancement': (PROMPT_FIELDS, 'Support active knowledge construction.'),
+            'plain': ({**PROMPT_FIELDS, 'include': '', 'exclude': ''}, None),
+            'exclude only': ({**PROMPT_FIELDS, 'include': ''}, None),
+        }
+        for name, (fields, enhancement) in cases.items():
+            with self.subTest(name):
+                self.assertEqual(
+                    prompt_lines(render_generation_prompt(fields, enhancement)),
+                    prompt_lines(legacy_prompt(fields, enhancement)),
+                )
+
+    def test_values_are_not_parsed(self):
+        template = PromptTemplate('{{literal}} {a} and {b}, {a} again')
+
+        self.assertEqual(template.slots, {'a', 'b'})
+        self.assertEqual(template.render(a='{b}', b='x'), '{literal} {b} and x, {b} again')
+
+    def test_render_rejects_mismatched_slots(self):
+        template = PromptTemplate('{a} {b}')
+        for values in ({'a': 'x'}, {'a': 'x', 'b': 'y', 'c': 'z'}, {'a': 'x', 'b': 1}):
+            with self.subTest(values):
+                with self.assertRaises(PromptTemplateError):
+                    template.render(**values)
+
+    def test_only_plain_slot_names_are_allowed(self):
+        for source in ('{0}', '{a.b}', '{a!r}', '{a:>10}', '{}'):
+            with self.subTest(source):
+                with self.assertRaises(PromptTemplateError):
+                    PromptTemplate(source)
+
+    def test_slot_check_catches_drift(self):
+        check_slots(GENERATION_TEMPLATE, GENERATION_SLOTS)
+        with self.assertRaises(PromptTemplateError):
+            check_slots(PromptTemplate('{role} {task}'), GENERATION_SLOTS)
+        with self.assertRaises(PromptTemplateError):
+            check_slots(GENERATION_TEMPLATE, GENERATION_SLOTS - {'theory_instruction'})
+
+
+class UserSessionValidationTests(TestCase):
+    def setUp(self):
+        self.session = UserSession.objects.create(session_id='session-1')
+
+    def stored(self):
+        return UserSession.objects.get(pk=self.session.pk)
+
+    def test_record_onboarding_stores_valid_demographics(self):
+        self.session.record_onboarding('basic', '6-15')
+
+        stored = self.stored()
+        self.assertEqual((stored.ai_experience, stored.teaching_years), ('basic', '6-15'))
+        self.assertTrue(stored.onboarding_completed)
+        self.assertIsNotNone(stored.onboarding_completion_time)
+
+    def test_record_onboarding_rejects_invalid_values(self):
+        for ai_experience, teaching_years in (('expert', '6-15'), ('basic', '100'), ('', '')):
+            with self.subTest(ai_experience=ai_experience, teaching_years=teaching_years):
+                with self.assertRaises(ValidationError):
+                    UserSession.objects.get(pk=self.session.pk).record_onboarding(ai_experience, teaching_years)
+                self.assertFalse(self.stored().onboarding_completed)
+
+    def test_record_training_needs_rejects_an_invalid_email(self):
+        with self.assertRaises(ValidationError) as raised:
+            self.session.record_training_needs(['assessment'], {'assessment': 1}, follow_up_email='not-an-email')
+
+        self.assertIn('follow_up_email', raised.exception.message_dict)
+        self.assertFalse(self.stored().training_needs_completed)
+
+    def test_update_fields_validates_only_the_listed_fields(self):
+        self.session.contact_email = 'not-an-email'
+        self.session.pages_visited = 3
+        self.session.save(update_fields=['pages_visited'])
+
+        stored = self.stored()
+        self.assertEqual((stored.pages_visited, stored.contact_email), (3, None))
+        with self.assertRaises(ValidationError):
+            self.session.save(update_fields=['contact_email'])
+        with self.assertRaises(ValidationError):
+            self.session.save()
+
+    def test_clean_rules_apply_to_update_fields(self):
+        self.session.onboarding_completed = True
+        with self.assertRaises(ValidationError):
+            self.session.touch('onboarding_completed')
+
+        self.assertFalse(self.stored().onboarding_completed)
+
+    def test_touch_saves_the_completion_time_it_sets(self):
+        UserSession.objects.filter(pk=self.session.pk).update(ai_experience='none', teaching_years='0-5')
+        session = self.stored()
+        session.onboarding_completed = True
+        session.touch('onboarding_completed')
+
+        self.assertIsNotNone(self.stored().onboarding_completion_time)
+
+
+def fake_gemini(payload, start_time):
+    """fetch_gemini_response() stub: tasks mentioning "fail" get an API error"""
+    if 'fail' in payload['contents'][0]['parts'][0]['text']:
+        raise GeminiAPIError(500, 'upstream error')
+    return GEMINI_BODY, False
+
+
+async def afake_gemini(payload, start_time):
+    return fake_gemini(payload, start_time)
+
+
+BATCH_ITEMS = [
+    {**GENERATE_REQUEST, 'template': 'quiz'},
+    {**GENERATE_REQUEST, 'task': 'fail this one'},
+    {**GENERATE_REQUEST, 'role': 7},
+]
+
+
+class BatchGenerationTests(TestCase):
+    def setUp(self):
+        self.client.defaults.update(HTTP_HOST='localhost', HTTP_USER_AGENT='Mozilla/5.0')
+
+    def post_batch(self, items):
+        with mock.patch('generator.views.fetch_gemini_response', side_effect=fake_gemini) as fetch:
+            response = self.client.post('/generate/batch/', json.dumps({'items': items}), content_type='application/json')
+        return response, fetch
+
+    def test_items_fail_independently(self):
+        response, fetch = self.post_batch(BATCH_ITEMS)
+
+        body = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in body['results']], [200, 500, 400])
+        self.assertEqual((body['succeeded'], body['failed']), (1, 2))
+        self.assertEqual(body['results'][2]['error'], "'role' must be a string")
+        self.assertEqual(fetch.call_count, 2)
+        generation = PromptGeneration.objects.get()
+        self.assertEqual(body['results'][0]['generation']['id'], generation.pk)
+        self.assertEqual(TemplateUsage.objects.get(template_name='quiz').usage_count, 1)
+
+    @override_settings(GENERATION_BATCH_MAX_ITEMS=2)
+    def test_item_count_is_limited(self):
+        for items in (BATCH_ITEMS, [], {'task': 'not a list'}):
+            with self.subTest(items=items):
+                response, fetch = self.post_batch(items)
+
+                self.assertEqual(response.status_code, 400)
+                fetch.assert_not_called()
+        self.assertFalse(PromptGeneration.objects.exists())
+
+    @override_settings(ANALYSIS_DEFERRED=True)
+    def test_deferred_analysis_is_submitted_after_commit(self):
+        items = [{**GENERATE_REQUEST, 'template': 'quiz'}, {**GENERATE_REQUEST, 'template': 'quiz', 'tone': 'formal'}]
+        with mock.patch.object(DeferredAnalysisExecutor, 'submit') as submit:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.post_batch(items)
+            submit.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        generations = list(PromptGeneration.objects.order_by('pk'))
+        self.assertEqual([generation.analysis_pending for generation in generations], [True, True])
+        self.assertEqual(
+            submit.call_args_list,
+            [mock.call(generation.pk, item, 'Plan a lesson.') for generation, item in zip(generations, items)],
+        )
+        self.assertEqual(TemplateUsage.objects.get(template_name='quiz').usage_count, 2)
+
+    async def test_async_batch_items_fail_independently(self):
+        request = AsyncRequestFactory().post(
+            '/generate/batch/', json.dumps({'items': BATCH_ITEMS}), content_type='application/json'
+        )
+        request.session = SessionStore()
+        with mock.patch('generator.views.afetch_gemini_response', side_effect=afake_gemini):
+            response = await generate_prompt_batch_async(request)
+
+        body = json.loads(response.content)
+        self.assertEqual([result['status'] for result in body['results']], [200, 500, 400])
+        self.assertEqual(await PromptGeneration.objects.acount(), 1)
@@ -0,0 +1,157 @@
+"""
+Theory selection and enhancement rules for /generate/.
+
+Every rule is data: a form field, the keywords that trigger it (substring match on the
+lowercased field) and an outcome. THEORY_SUGGESTIONS picks a theory when the user didn't
+select one; THEORY_ENHANCEMENTS maps each theory to its ordered conditions, the first
+matching one giving the instruction added to the prompt (a condition with no field is the
+default). The tables are compiled once into one regex per condition, only the selected
+theory's conditions are evaluated, and the outcome is memoized per (theory, methodology,
+task, context) - the only fields any rule reads.
+"""
+import re
+from functools import lru_cache
+
+THEORY_CACHE_SIZE = 4096
+
+# (field, keywords, theory) - checked in order, methodology first, then task, then context
+THEORY_SUGGESTIONS = [
+    ('methodology', ['inquiry', 'explore', 'discovery', 'problem'], 'constructivist'),
+    ('methodology', ['collaborative', 'group', 'peer'], 'social_learning'),
+    ('methodology', ['technology', 'ai', 'digital'], 'tpack'),
+    ('methodology', ['differentiated', 'adaptive', 'personalized'], 'udl'),
+    ('methodology', ['scaffolding', 'support', 'guidance'], 'scaffolding'),
+    ('task', ['critical thinking', 'questions', 'analysis'], 'blooms'),
+    ('task', ['assessment', 'quiz', 'rubric'], 'blooms'),
+    ('task', ['lesson plan', 'curriculum'], 'blooms'),
+    ('task', ['differentiated', 'multiple intelligences'], 'differentiation'),
+    ('context', ['mixed-ability', 'special needs', 'learning difficulties'], 'udl'),
+]
+DEFAULT_THEORY = 'blooms'
+
+# theory -> [(field, keywords, enhancement)], first match wins; (None, [], text) is the default
+THEORY_ENHANCEMENTS = {
+    'blooms': [
+        ('task', ['critical thinking', 'questions', 'analysis'],
+         "Structure questions to progress from analysis (break down concepts) to evaluation (judge quality/value) to creation (generate new ideas), following Bloom's cognitive taxonomy levels"),
+        ('task', ['practice', 'exercises', 'activities'],
+         "Design activities that span remember (recall facts) → understand (explain concepts) → apply (use knowledge) → analyze (examine relationships), progressing through Bloom's taxonomy"),
+        ('task', ['assessment', 'quiz', 'rubric'],
+         "Include assessment items covering multiple cognitive levels: remembering key facts, understanding main concepts, applying knowledge to new situations, and analyzing complex scenarios (Bloom's taxonomy)"),
+        ('task', ['lesson plan', 'introduction'],
+         "Structure the lesson to progress through cognitive levels from foundational knowledge (remember/understand) to application and higher-order thinking (analyze/evaluate/create), following Bloom's taxonomy"),
+        (None, [],
+         "Incorporate cognitive progression from basic recall to higher-order thinking skills, following Bloom's taxonomy levels"),
+    ],
+    'udl': [
+        ('context', ['mixed-ability', 'learning difficulties', 'special needs'],
+         "Provide multiple means of representation (visual, auditory, tactile), multiple means of engagement (choice, relevance, challenge levels), and multiple means of expression (verbal, written, demonstration) to support diverse learners (UDL principles)"),
+        ('context', ['esl', 'efl'],
+         "Include visual supports, simplified language options, and multiple ways to demonstrate understanding to accommodate language learners (UDL principles)"),
+        (None, [],
+         "Design with flexibility in content presentation, student engagement methods, and expression formats to accommodate diverse learning needs (UDL principles)"),
+    ],
+    'tpack': [
+        ('task', ['lesson plan', 'curriculum', 'complete plan'],
+         "Explicitly specify: (1) which AI tools/features will be used, (2) how they support specific learning objectives, (3) what pedagogical role technology plays in fraction instruction, and (4) how digital tools enhance content understanding rather than replace teaching (TPACK framework)"),
+        ('task', ['assessment', 'quiz', 'rubric'],
+         "Detail how AI-enhanced assessment tools will measure fraction understanding, specify the pedagogical rationale for using technology in evaluation, and explain how digital assessment connects to fraction learning goals (TPACK framework)"),
+        ('task', ['practice', 'exercises', 'activities'],
+         "Describe specific AI-powered practice tools, explain how technology personalizes fraction practice, detail the pedagogical benefits of digital exercises, and specify how AI feedback supports fraction skill development (TPACK framework)"),
+        ('methodology', ['ai', 'technology', 'digital'],
+         "Clearly define the AI's pedagogical role, specify how technology enhances fraction instruction methods, explain the connection between digital tools and mathematical content mastery, and justify technology choices with educational theory (TPACK framework)"),
+        (None, [],
+         "Include specific details about: how technology supports fraction learning goals, what pedagogical purpose AI serves, and how digital tools enhance rather than replace effective math teaching practices (TPACK framework)"),
+    ],
+    'constructivist': [
+        ('methodology', ['inquiry', 'discovery', 'explore'],
+         "Support active knowledge construction through guided discovery, encouraging learners to build understanding through hands-on exploration and meaningful connections to prior knowledge"),
+        ('methodology', ['problem', 'real-world'],
+         "Facilitate learning through authentic problem-solving experiences where students construct knowledge by connecting new information to existing understanding and real-world contexts"),
+        (None, [],
+         "Encourage active knowledge construction through hands-on experiences, reflection, and connection-making rather than passive information reception"),
+    ],
+    'social_learning': [
+        ('methodology', ['collaborative', 'group', 'peer'],
+         "Leverage peer interaction and collaborative learning opportunities where students learn through observation, discussion, and shared knowledge construction in social contexts"),
+        ('methodology', ['discussion', 'teamwork'],
+         "Create structured opportunities for social learning through peer modeling, collaborative problem-solving, and shared reflection on learning processes"),
+        (None, [],
+         "Incorporate peer interaction and social learning opportunities to enhance understanding through shared knowledge construction"),
+    ],
+    'scaffolding': [
+        ('context', ['ages 3-5', 'preschool'],
+         "Provide extensive scaffolding with concrete examples, hands-on materials, and step-by-step guidance, gradually reducing support as children develop independence"),
+        ('context', ['ages 6-11', 'primary'],
+         "Include scaffolding supports such as graphic organizers, worked examples, and guided practice, with clear steps toward independent application"),
+        ('task', ['complex', 'advanced'],
+         "Break down complex tasks into manageable steps with temporary supports, modeling, and guided practice before expecting independent performance"),
+        (None, [],
+         "Provide appropriate scaffolding supports that can be gradually removed as learners develop competence and confidence"),
+    ],
+    'differentiation': [
+        ('task', ['differentiated', 'multiple intelligences'],
+         "Address diverse learning preferences through varied content presentation, process options, and product choices, allowing multiple pathways to demonstrate understanding"),
+        ('task', ['adaptive', 'personalized'],
+         "Provide flexible learning options that adapt to individual student needs, interests, and readiness levels through varied instructional approaches"),
+        (None, [],
+         "Include differentiation strategies that address diverse learning styles, abilities, and interests through multiple instructional approaches"),
+    ],
+}
+
+RULE_FIELDS = ('methodology', 'task', 'context')
+
+
+def compile_conditions(rules):
+    """[(field, keywords, outcome)] -> [(field, regex or None, outcome)]"""
+    compiled = []
+    for field, keywords, outcome in rules:
+        if field is not None and field not in RULE_FIELDS:
+            raise ValueError(f"Theory rule reads unknown field {field!r}")
+        if field is not None and not keywords:
+            raise ValueError(f"Theory rule on {field!r} has no keywords")
+        # One alternation per condition - search() is `any(keyword in text)` in one pass
+        regex = re.compile('|'.join(map(re.escape, keywords))) if field is not None else None
+        compiled.append((field, regex, outcome))
+    return compiled
+
+
+def first_match(conditions, fields):
+    for field, regex, outcome in conditions:
+        if regex is None or regex.search(fields[field]):
+            return outcome
+    return None
+
+
+SUGGESTION_CONDITIONS = compile_conditions(THEORY_SUGGESTIONS)
+ENHANCEMENT_CONDITIONS = {theory: compile_conditions(rules) for theory, rules in THEORY_ENHANCEMENTS.items()}
+
+
+def suggest_theory(methodology, task, context):
+    """Theory to apply when the user didn't select one"""
+    return _resolve('', methodology.lower(), task.lower(), context.lower())[0]
+
+
+def theory_enhancement(form_data, selected_theory=""):
+    """
+    (theory, enhancement text) for a generation; auto-suggests the theory when none is
+    selected. The enhancement is None for a theory without rules.
+    """
+    return _resolve(
+        selected_theory or '',
+        (form_data.get("methodology") or "").lower(),
+        (form_data.get("task") or "").lower(),
+        (form_data.get("context") or "").lower(),
+    )
+
+
+@lru_cache(maxsize=THEORY_CACHE_SIZE)
+def _resolve(selected_theory, methodology, task, context):
+    fields = {'methodology': methodology, 'task': task, 'context': context}
+    theory = selected_theory or first_match(SUGGESTION_CONDITIONS, fields) or DEFAULT_THEORY
+    conditions = ENHANCEMENT_CONDITIONS.get(theory)
+    return theory, first_match(conditions, fields) if conditions else None
+
+
+def theory_cache_stats():
+    return _resolve.cache_info()._asdict()
@@ -0,0 +1,112 @@
+"""
+Keeps automated traffic out of the analytics tables.
+
+Health probes, uptime monitors, crawlers, link-preview fetchers and browser prefetches all
+load index(); each one used to create a Django session, a UserSession row and a PageView
+row. classify() names the kind of automated request from its user agent and headers
+(None for a person), index() skips session and page view writes for those and the skips
+are counted per reason for the PromptGeneration admin change list.
+
+TRAFFIC_EXTRA_BOT_PATTERNS adds case-insensitive user agent regexes (comma-separated) on
+top of the built-in lists.
+"""
+import re
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+# Platform health checks and uptime monitors
+PROBE_AGENTS = [
+    r'kube-probe', r'elb-healthchecker', r'googlehc', r'railway', r'health.?check', r'uptimerobot',
+    r'pingdom', r'statuscake', r'better ?uptime', r'site24x7', r'newrelicpinger', r'datadog',
+]
+# Crawlers, link previews and scripted clients
+BOT_AGENTS = [
+    r'bot\b', r'crawl', r'spider', r'slurp', r'facebookexternalhit', r'embedly', r'preview',
+    r'headlesschrome', r'phantomjs', r'python-requests', r'python-urllib', r'aiohttp', r'httpx',
+    r'curl/', r'wget/', r'go-http-client', r'okhttp', r'java/', r'libwww-perl', r'scrapy',
+]
+PREFETCH_HEADERS = ('HTTP_PURPOSE', 'HTTP_SEC_PURPOSE', 'HTTP_X_PURPOSE', 'HTTP_X_MOZ')
+
+
+def is_prefetch(purpose):
+    # A prerendered page is shown without another request once the user navigates to it
+    purpose = purpose.lower()
+    return 'prefetch' in purpose and 'prerender' not in purpose
+
+
+def compile_agents(patterns):
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns), re.IGNORECASE)
+
+
+class TrafficClassifier:
+    """Names automated requests and counts the analytics writes skipped for them"""
+
+    def __init__(self, enabled=True, extra_bot_patterns=()):
+        self.enabled = enabled
+        self.probe_agents = compile_agents(PROBE_AGENTS)
+        self.bot_agents = compile_agents([*BOT_AGENTS, *extra_bot_patterns])
+        self._skipped = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            enabled=settings.TRAFFIC_SKIP_AUTOMATED,
+            extra_bot_patterns=[pattern.strip() for pattern in settings.TRAFFIC_EXTRA_BOT_PATTERNS if pattern.strip()],
+        )
+
+    def classify(self, request):
+        """'probe', 'bot', 'prefetch', 'no_user_agent' or 'head' for automated requests, else None"""
+        user_agent = request.META.get('HTTP_USER_AGENT', '')
+        if not user_agent.strip():
+            return 'no_user_agent'
+        if self.probe_agents.search(user_agent):
+            return 'probe'
+        if self.bot_agents.search(user_agent):
+            return 'bot'
+        if any(is_prefetch(request.META.get(header, '')) for header in PREFETCH_HEADERS):
+            return 'prefetch'
+        if request.method == 'HEAD':
+            return 'head'
+        return None
+
+    def should_skip(self, request):
+        """True (and counted) if analytics writes should be skipped for this request"""
+        if not self.enabled:
+            return False
+        reason = self.classify(request)
+        if reason is None:
+            return False
+        with self._lock:
+            self._skipped[reason] += 1
+        return True
+
+    def stats(self):
+        """Per-process skipped request counts by reason"""
+        with self._lock:
+            return {'skipped': dict(self._skipped), 'total_skipped': sum(self._skipped.values())}
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_traffic_classifier():
+    """Process-wide TrafficClassifier, built from settings on first use"""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = TrafficClassifier.from_settings()
+    return _classifier
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    global _classifier
+    if setting.startswith('TRAFFIC_'):
+        _classifier = None
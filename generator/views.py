@@ -2,40 +2,56 @@
 
 from django.shortcuts import render
 import os
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.db.models import Count, Avg, Q  # Προσθέστε το Avg αν δεν υπάρχει
-import requests
 import json
 import time
+import asyncio
 import logging
-from .models import UserSession, PromptGeneration, PageView, TemplateUsage
-from .analytics import PromptAnalyzer
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from .models import UserSession, PromptGeneration, PageView, TemplateUsage, GenerationJob
+from .gemini import (
+    get_gemini_client, assemble_response_body, has_candidate_text, GeminiError, GeminiAPIError, GeminiTimeout
+)
+from .response_cache import get_response_cache
+from .singleflight import get_single_flight
+from .jobs import enqueue_generation_job, finish_job, fail_job, holds_job_lease, job_status_payload
+from .deferred_analysis import analysis_fields, get_analysis_executor
+from .counters import bump_template_usage
+from .activity_tracker import get_page_view_tracker
+from .traffic import get_traffic_classifier
+from .health import get_probe_cache
+from .copy_tracking import generation_ref, verified_generation_ids, mark_copied, mark_latest_copied
+from .theory_rules import suggest_theory, theory_enhancement
+from .prompt_template import (
+    PromptFieldError, generation_fields, is_structured_request, render_generation_prompt,
+)
 from datetime import datetime, timedelta
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
+from django.urls import reverse
+from django.core.exceptions import ValidationError
+from django.db import connections, transaction
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
 def index(request):
-    # Ensure session exists
-    if not request.session.session_key:
-        request.session.create()
-   
-    session_id = request.session.session_key
-    session, created = UserSession.objects.get_or_create(
-        session_id=session_id,
-        defaults={'referrer': request.META.get('HTTP_REFERER', '')}
-    )
-   
-    if not created:
-        session.pages_visited += 1
-        session.save()
-   
-    PageView.objects.create(session=session, path=request.path)
+    # Bots, probes and prefetches get the page without a session or analytics rows
+    if not get_traffic_classifier().should_skip(request):
+        # Ensure session exists
+        if not request.session.session_key:
+            request.session.create()
+       
+        # Session row, pages_visited and PageView are written by the tracker (buffered if enabled)
+        get_page_view_tracker().record(
+            request.session.session_key, request.path, request.method, request.META.get('HTTP_REFERER', '')
+        )
    
     # Pass ENABLE_SURVEYS to template
     context = {
@@ -44,193 +60,368 @@ def index(request):
    
     return render(request, "generator/index.html", context)  
 
+@require_http_methods(["GET", "HEAD"])
+def liveness(request):
+    """Process is up - no database, no session"""
+    return JsonResponse({"status": "ok"})
+
+@require_http_methods(["GET", "HEAD"])
+def readiness(request):
+    """Cached dependency probes; 503 when a required one fails. Public, so status and checks only"""
+    status, checks = get_probe_cache().readiness()
+    return JsonResponse({
+        "status": status,
+        "checks": checks,
+    }, status=503 if status == 'unavailable' else 200)
+
 # NEW ENHANCED THEORY SELECTION SYSTEM
 
 def suggest_optimal_theory(methodology, task, context):
     """
-    Intelligent theory suggestion based on pedagogical context
-    """
-    methodology_lower = methodology.lower()
-    task_lower = task.lower()
-    context_lower = context.lower()
-    
-    # Methodology-based suggestions (highest priority)
-    if any(keyword in methodology_lower for keyword in ['inquiry', 'explore', 'discovery', 'problem']):
-        return 'constructivist'
-    elif any(keyword in methodology_lower for keyword in ['collaborative', 'group', 'peer']):
-        return 'social_learning'
-    elif any(keyword in methodology_lower for keyword in ['technology', 'ai', 'digital']):
-        return 'tpack'
-    elif any(keyword in methodology_lower for keyword in ['differentiated', 'adaptive', 'personalized']):
-        return 'udl'
-    elif any(keyword in methodology_lower for keyword in ['scaffolding', 'support', 'guidance']):
-        return 'scaffolding'
-    
-    # Task-based suggestions (medium priority)
-    elif any(keyword in task_lower for keyword in ['critical thinking', 'questions', 'analysis']):
-        return 'blooms'
-    elif any(keyword in task_lower for keyword in ['assessment', 'quiz', 'rubric']):
-        return 'blooms'
-    elif any(keyword in task_lower for keyword in ['lesson plan', 'curriculum']):
-        return 'blooms'
-    elif any(keyword in task_lower for keyword in ['differentiated', 'multiple intelligences']):
-        return 'differentiation'
-    
-    # Context-based suggestions (lower priority)
-    elif any(keyword in context_lower for keyword in ['mixed-ability', 'special needs', 'learning difficulties']):
-        return 'udl'
-    
-    # Default fallback
-    return 'blooms'
-
-def generate_blooms_enhancement(form_data):
-    """Generate Bloom's Taxonomy specific enhancement"""
-    task = form_data.get("task", "").lower()
-    
-    if any(keyword in task for keyword in ["critical thinking", "questions", "analysis"]):
-        return "Structure questions to progress from analysis (break down concepts) to evaluation (judge quality/value) to creation (generate new ideas), following Bloom's cognitive taxonomy levels"
-    elif any(keyword in task for keyword in ["practice", "exercises", "activities"]):
-        return "Design activities that span remember (recall facts) → understand (explain concepts) → apply (use knowledge) → analyze (examine relationships), progressing through Bloom's taxonomy"
-    elif any(keyword in task for keyword in ["assessment", "quiz", "rubric"]):
-        return "Include assessment items covering multiple cognitive levels: remembering key facts, understanding main concepts, applying knowledge to new situations, and analyzing complex scenarios (Bloom's taxonomy)"
-    elif any(keyword in task for keyword in ["lesson plan", "introduction"]):
-        return "Structure the lesson to progress through cognitive levels from foundational knowledge (remember/understand) to application and higher-order thinking (analyze/evaluate/create), following Bloom's taxonomy"
-    else:
-        return "Incorporate cognitive progression from basic recall to higher-order thinking skills, following Bloom's taxonomy levels"
+    Intelligent theory suggestion based on pedagogical context (rules in theory_rules.py)
+    """
+    return suggest_theory(methodology, task, context)
 
-def generate_udl_enhancement(form_data):
-    """Generate UDL specific enhancement"""
-    context = form_data.get("context", "").lower()
-    
-    if any(keyword in context for keyword in ["mixed-ability", "learning difficulties", "special needs"]):
-        return "Provide multiple means of representation (visual, auditory, tactile), multiple means of engagement (choice, relevance, challenge levels), and multiple means of expression (verbal, written, demonstration) to support diverse learners (UDL principles)"
-    elif any(keyword in context for keyword in ["esl", "efl"]):
-        return "Include visual supports, simplified language options, and multiple ways to demonstrate understanding to accommodate language learners (UDL principles)"
-    else:
-        return "Design with flexibility in content presentation, student engagement methods, and expression formats to accommodate diverse learning needs (UDL principles)"
+def add_selected_theory_enhancement(prompt, form_data, selected_theory):
+    """
+    Applies only the selected (or auto-suggested) theory to a free-form prompt, as its own
+    section. Structured requests get it as instruction 7 of the rendered template instead.
+    """
+    selected_theory, enhancement = theory_enhancement(form_data, selected_theory)
+    if enhancement:
+        prompt += f"\n\nEducational Enhancement: {enhancement}"
+    return prompt, selected_theory
 
-# Replace the generate_tpack_enhancement function in views.py
+# UPDATED MAIN GENERATE FUNCTION
 
-def generate_tpack_enhancement(form_data):
-    """Generate TPACK specific enhancement - more specific and actionable"""
-    task = form_data.get("task", "").lower()
-    methodology = form_data.get("methodology", "").lower()
-    subject = form_data.get("subject", "").lower()
+def build_generation_prompt(data):
+    """
+    Build the final prompt sent to Gemini from the request payload.
+    Returns the prompt and the request metadata needed for analytics.
     
-    if any(keyword in task for keyword in ["lesson plan", "curriculum", "complete plan"]):
-        return "Explicitly specify: (1) which AI tools/features will be used, (2) how they support specific learning objectives, (3) what pedagogical role technology plays in fraction instruction, and (4) how digital tools enhance content understanding rather than replace teaching (TPACK framework)"
+    The generator form sends its fields and the instruction prompt is rendered from
+    GENERATION_TEMPLATE; theory explanations and improvements send a free-form "prompt".
+    Raises PromptFieldError for form fields that can't be rendered.
+    """
+    # Get enhancement preference and selected theory
+    enhancement_type = data.get("enhancement", "enhanced")
+    selected_theory = data.get("theory_enhancement", "")  # NEW: Get selected theory
+    applied_theory = None
     
-    elif any(keyword in task for keyword in ["assessment", "quiz", "rubric"]):
-        return "Detail how AI-enhanced assessment tools will measure fraction understanding, specify the pedagogical rationale for using technology in evaluation, and explain how digital assessment connects to fraction learning goals (TPACK framework)"
+    if is_structured_request(data):
+        fields = generation_fields(data)
+        enhancement = None
+        if enhancement_type == "enhanced":
+            applied_theory, enhancement = theory_enhancement(fields, selected_theory)
+            
+            # Log which theory was applied for research purposes
+            logger.info(f"Applied theory: {applied_theory} (user selected: {selected_theory})")
+        
+        return render_generation_prompt(fields, enhancement), {
+            'enhancement_type': enhancement_type,
+            'selected_theory': selected_theory,
+            'applied_theory': applied_theory,
+            'is_theory_request': False,
+            'is_improvement_request': False,
+        }
     
-    elif any(keyword in task for keyword in ["practice", "exercises", "activities"]):
-        return "Describe specific AI-powered practice tools, explain how technology personalizes fraction practice, detail the pedagogical benefits of digital exercises, and specify how AI feedback supports fraction skill development (TPACK framework)"
+    prompt = data["prompt"]
     
-    elif any(keyword in methodology for keyword in ["ai", "technology", "digital"]):
-        return "Clearly define the AI's pedagogical role, specify how technology enhances fraction instruction methods, explain the connection between digital tools and mathematical content mastery, and justify technology choices with educational theory (TPACK framework)"
+    # Detect request type
+    is_theory_request = 'educational theory expert' in prompt.lower()
+    is_improvement_request = 'prompt engineering expert' in prompt.lower()
     
+    # Handle special requests
+    if is_theory_request or is_improvement_request:
+        if is_improvement_request:
+            prompt = """You are a prompt engineering expert. Respond with ONLY valid JSON in this exact format:
+{"prompt_improvements": "Your 3 numbered suggestions here..."}
+
+Please provide exactly 3 specific improvements the user could add to their prompt to make it more effective.
+
+Focus on the most impactful improvements like: duration/timing, output format, specificity, differentiation, assessment criteria, etc.
+
+Do not include ```json, markdown, or any other formatting. Just pure JSON.
+
+""" + prompt
+        else:
+            prompt = """You are an educational psychology expert. Respond with ONLY valid JSON in this exact format:
+{"theory_explanation": "Your explanation here", "teaching_tip": "Your tip here"}
+
+Do not include ```json, markdown, or any other formatting. Just pure JSON.
+
+""" + prompt
     else:
-        return "Include specific details about: how technology supports fraction learning goals, what pedagogical purpose AI serves, and how digital tools enhance rather than replace effective math teaching practices (TPACK framework)"
-def generate_constructivist_enhancement(form_data):
-    """Generate Constructivist Learning enhancement"""
-    methodology = form_data.get("methodology", "").lower()
-    
-    if any(keyword in methodology for keyword in ["inquiry", "discovery", "explore"]):
-        return "Support active knowledge construction through guided discovery, encouraging learners to build understanding through hands-on exploration and meaningful connections to prior knowledge"
-    elif any(keyword in methodology for keyword in ["problem", "real-world"]):
-        return "Facilitate learning through authentic problem-solving experiences where students construct knowledge by connecting new information to existing understanding and real-world contexts"
-    else:
-        return "Encourage active knowledge construction through hands-on experiences, reflection, and connection-making rather than passive information reception"
+        # Apply NEW ENHANCED theoretical enhancement for regular prompts
+        if enhancement_type == "enhanced":
+            # Extract form data for enhancement
+            form_data = {
+                "role": data.get("role", ""),
+                "task": data.get("task", ""),
+                "context": data.get("context", ""),
+                "methodology": data.get("methodology", ""),
+                "subject": data.get("subject", ""),
+                "tone": data.get("tone", "")
+            }
+            
+            # Use NEW enhancement system
+            prompt, applied_theory = add_selected_theory_enhancement(prompt, form_data, selected_theory)
+            
+            # Log which theory was applied for research purposes
+            logger.info(f"Applied theory: {applied_theory} (user selected: {selected_theory})")
+    
+    return prompt, {
+        'enhancement_type': enhancement_type,
+        'selected_theory': selected_theory,
+        'applied_theory': applied_theory,
+        'is_theory_request': is_theory_request,
+        'is_improvement_request': is_improvement_request,
+    }
 
-def generate_social_learning_enhancement(form_data):
-    """Generate Social Learning Theory enhancement"""
-    methodology = form_data.get("methodology", "").lower()
+def build_gemini_payload(prompt):
+    """Gemini generateContent request body"""
+    return {
+        "contents": [
+            {
+                "parts": [
+                    {"text": prompt}
+                ]
+            }
+        ],
+        "generationConfig": {
+            "temperature": 0.7,
+            "topK": 40,
+            "topP": 0.95,
+            "maxOutputTokens": 2000,
+            "stopSequences": []
+        }
+    }
+
+def extract_generated_text(response_text, meta):
+    """Pull the generated text out of a Gemini response body"""
+    try:
+        result = json.loads(response_text)
+        text_response = result["candidates"][0]["content"]["parts"][0]["text"]
+        
+        # Handle special requests - ensure JSON format
+        if meta['is_theory_request'] or meta['is_improvement_request']:
+            try:
+                json.loads(text_response)
+            except json.JSONDecodeError:
+                if meta['is_improvement_request']:
+                    fallback_response = {
+                        "prompt_improvements": text_response
+                    }
+                else:
+                    fallback_response = {
+                        "theory_explanation": text_response,
+                        "teaching_tip": "Remember to adapt this approach based on your students' individual needs."
+                    }
+                text_response = json.dumps(fallback_response)
+        
+    except (KeyError, IndexError) as e:
+        logger.error(f"Response parsing error: {e}")
+        logger.error(f"Full response: {response_text}")
+        text_response = "Sorry, no prompt was generated. Please try again."
+    except Exception as e:
+        logger.error(f"Unexpected parsing error: {e}")
+        text_response = "Sorry, an unexpected error occurred."
     
-    if any(keyword in methodology for keyword in ["collaborative", "group", "peer"]):
-        return "Leverage peer interaction and collaborative learning opportunities where students learn through observation, discussion, and shared knowledge construction in social contexts"
-    elif any(keyword in methodology for keyword in ["discussion", "teamwork"]):
-        return "Create structured opportunities for social learning through peer modeling, collaborative problem-solving, and shared reflection on learning processes"
-    else:
-        return "Incorporate peer interaction and social learning opportunities to enhance understanding through shared knowledge construction"
-
-def generate_scaffolding_enhancement(form_data):
-    """Generate Scaffolding enhancement"""
-    context = form_data.get("context", "").lower()
-    task = form_data.get("task", "").lower()
-    
-    if any(keyword in context for keyword in ["ages 3-5", "preschool"]):
-        return "Provide extensive scaffolding with concrete examples, hands-on materials, and step-by-step guidance, gradually reducing support as children develop independence"
-    elif any(keyword in context for keyword in ["ages 6-11", "primary"]):
-        return "Include scaffolding supports such as graphic organizers, worked examples, and guided practice, with clear steps toward independent application"
-    elif any(keyword in task for keyword in ["complex", "advanced"]):
-        return "Break down complex tasks into manageable steps with temporary supports, modeling, and guided practice before expecting independent performance"
-    else:
-        return "Provide appropriate scaffolding supports that can be gradually removed as learners develop competence and confidence"
+    return text_response
+
+def fetch_gemini_response(payload, start_time):
+    """
+    Raw Gemini response body for payload - from the response cache, or from a
+    (single-flight coalesced) API call. Returns (response_text, served_from_cache).
+    """
+    response_cache = get_response_cache()
+    cache_key = response_cache.key_for(payload, settings.GEMINI_MODEL)
+    response_text = response_cache.get(cache_key)
+    if response_text is not None:
+        logger.info(f"⚡ Served from response cache at {time.time() - start_time:.2f}s")
+        return response_text, True
 
-def generate_differentiation_enhancement(form_data):
-    """Generate Differentiated Instruction enhancement"""
-    task = form_data.get("task", "").lower()
+    logger.info(f"📤 Sending request to Gemini at {time.time() - start_time:.2f}s")
     
-    if any(keyword in task for keyword in ["differentiated", "multiple intelligences"]):
-        return "Address diverse learning preferences through varied content presentation, process options, and product choices, allowing multiple pathways to demonstrate understanding"
-    elif any(keyword in task for keyword in ["adaptive", "personalized"]):
-        return "Provide flexible learning options that adapt to individual student needs, interests, and readiness levels through varied instructional approaches"
-    else:
-        return "Include differentiation strategies that address diverse learning styles, abilities, and interests through multiple instructional approaches"
+    # Identical prompts already in flight wait on that call instead of a new one
+    response_text, coalesced = get_single_flight().do(
+        cache_key, lambda: get_gemini_client().generate(payload)
+    )
+    
+    logger.info(f"📨 Got response from Gemini in {time.time() - start_time:.2f}s"
+                f"{' (coalesced)' if coalesced else ''}")
+    logger.info(f"📏 Response length: {len(response_text)} chars")
+    if not coalesced and has_candidate_text(response_text):
+        response_cache.set(cache_key, response_text)
+    return response_text, False
 
-# Replace the add_selected_theory_enhancement function in views.py
+async def afetch_gemini_response(payload, start_time):
+    """Async fetch_gemini_response()"""
+    response_cache = get_response_cache()
+    cache_key = response_cache.key_for(payload, settings.GEMINI_MODEL)
+    response_text = await response_cache.aget(cache_key)
+    if response_text is not None:
+        logger.info(f"⚡ Served from response cache at {time.time() - start_time:.2f}s")
+        return response_text, True
 
-def add_selected_theory_enhancement(prompt, form_data, selected_theory):
+    logger.info(f"📤 Sending request to Gemini at {time.time() - start_time:.2f}s")
+    
+    response_text, coalesced = await get_single_flight().ado(
+        cache_key, lambda: get_gemini_client().agenerate(payload)
+    )
+    
+    logger.info(f"📨 Got response from Gemini in {time.time() - start_time:.2f}s"
+                f"{' (coalesced)' if coalesced else ''}")
+    if not coalesced and has_candidate_text(response_text):
+        await response_cache.aset(cache_key, response_text)
+    return response_text, False
+
+def stream_gemini_text(payload, cache_key):
     """
-    Enhanced theory selection system - applies only the selected theory
-    by modifying the Instructions section instead of appending at the end.
+    Yields (text, coalesced) chunks of the Gemini stream for payload. The first request for a
+    prompt streams it (the single-flight leader); identical requests arriving meanwhile wait
+    for the leader's full text and get it as one chunk instead of a second upstream stream.
     """
+    single_flight = get_single_flight()
+    key = f"stream:{cache_key}"
+    while True:
+        call, leader = single_flight.join(key)
+        if leader:
+            break
+        text, abandoned = single_flight.wait(call)
+        if not abandoned:
+            if text:
+                yield text, True
+            return
+        # The leader's client disconnected mid-stream - stream it ourselves (or follow a new leader)
     
-    # Extract form data
-    task = form_data.get("task", "")
-    context = form_data.get("context", "")
-    methodology = form_data.get("methodology", "")
+    chunks = []
+    try:
+        for text in get_gemini_client().stream(payload):
+            chunks.append(text)
+            yield text, False
+    except GeminiError as e:
+        single_flight.finish(key, call, error=e)
+        raise
+    except BaseException:
+        # GeneratorExit when our client disconnects
+        single_flight.finish(key, call, abandoned=True)
+        raise
+    single_flight.finish(key, call, result=''.join(chunks))
+
+async def astream_gemini_text(payload, cache_key):
+    """Async stream_gemini_text(), coalesced within the event loop"""
+    single_flight = get_single_flight()
+    key = f"stream:{cache_key}"
+    while True:
+        future, leader = single_flight.ajoin(key)
+        if leader:
+            break
+        text, abandoned = await single_flight.await_leader(future)
+        if not abandoned:
+            if text:
+                yield text, True
+            return
     
-    # If no theory selected, auto-suggest the most relevant one
-    if not selected_theory:
-        selected_theory = suggest_optimal_theory(methodology, task, context)
+    chunks = []
+    try:
+        async for text in get_gemini_client().astream(payload):
+            chunks.append(text)
+            yield text, False
+    except GeminiError as e:
+        single_flight.afinish(key, future, error=e)
+        raise
+    except BaseException:
+        single_flight.afinish(key, future, abandoned=True)
+        raise
+    single_flight.afinish(key, future, result=''.join(chunks))
+
+def gemini_failure(error):
+    """Log a GeminiError and map it to the client-facing error body and HTTP status"""
+    if isinstance(error, GeminiTimeout):
+        logger.error("Gemini API timeout")
+        return {
+            "error": "Request timeout", 
+            "response": "The request took too long. Please try again with a shorter prompt."
+        }, 408
+    if isinstance(error, GeminiAPIError):
+        logger.error(f"Gemini API error: {error.status_code} - {error.body}")
+        return {
+            "error": f"API Error: {error.status_code}",
+            "response": "Sorry, there was an error generating your prompt. Please try again."
+        }, 500
+    logger.error(f"Network error: {error}")
+    return {
+        "error": "Network error",
+        "response": "Network error occurred. Please check your connection and try again."
+    }, 500
+
+def sse_event(event, data):
+    """One Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def build_prompt_generation(session, data, meta, text_response, response_time, served_from_cache=False,
+                            time_to_first_token=None, analyze=True):
+    """
+    Unsaved PromptGeneration for a completed generation. With analyze=False the PromptAnalyzer
+    fields are left for the deferred analysis executor and the row is marked analysis_pending.
+    """
+    # Determine the final applied theory for analytics
+    enhancement_type = meta['enhancement_type']
+    if enhancement_type == "enhanced" and not (meta['is_theory_request'] or meta['is_improvement_request']):
+        final_applied_theory = meta['applied_theory']
+        theory_was_auto_suggested = not bool(meta['selected_theory'])
+    else:
+        final_applied_theory = None
+        theory_was_auto_suggested = False
     
-    # Theory enhancement mappings
-    theory_enhancements = {
-        'blooms': generate_blooms_enhancement(form_data),
-        'udl': generate_udl_enhancement(form_data),
-        'tpack': generate_tpack_enhancement(form_data),
-        'constructivist': generate_constructivist_enhancement(form_data),
-        'social_learning': generate_social_learning_enhancement(form_data),
-        'scaffolding': generate_scaffolding_enhancement(form_data),
-        'differentiation': generate_differentiation_enhancement(form_data)
-    }
+    # Comprehensive prompt generation record with NEW THEORY TRACKING
+    return PromptGeneration(
+        session=session,
+        template_used=data.get("template", ""),
+        role=data.get("role", ""),
+        subject=data.get("subject", ""),
+        task=data.get("task", ""),
+        context=data.get("context", ""),
+        methodology=data.get("methodology", ""),
+        tone=data.get("tone", ""),
+        enhancement_mode=enhancement_type,
+        success=True,
+        response_time_seconds=response_time,
+        time_to_first_token_seconds=time_to_first_token,
+        served_from_cache=served_from_cache,
+        generated_prompt=text_response,
+        
+        # NEW: Theory selection tracking (will need to add these fields to model)
+        selected_theory=final_applied_theory,
+        theory_auto_suggested=theory_was_auto_suggested,
+        
+        # Auto-analyzed categories and content analysis results
+        analysis_pending=not analyze,
+        **(analysis_fields(data, text_response) if analyze else {})
+    )
+
+def record_prompt_generation(session_id, data, meta, text_response, start_time, served_from_cache=False,
+                             time_to_first_token=None):
+    """Enhanced analytics tracking for a completed generation"""
+    session, created = UserSession.objects.get_or_create(session_id=session_id)
+    deferred = settings.ANALYSIS_DEFERRED
     
-    # Apply the selected theory enhancement by modifying the Instructions
-    if selected_theory in theory_enhancements:
-        enhancement = theory_enhancements[selected_theory]
-        if enhancement:
-            # Find the Instructions section and add enhancement as instruction #7
-            instructions_start = prompt.find("Instructions:")
-            if instructions_start != -1:
-                # Find the end of instruction 6
-                instruction_6_end = prompt.find("6. Keep it professional and focused on the educational task")
-                if instruction_6_end != -1:
-                    instruction_6_end = prompt.find("\n", instruction_6_end) + 1
-                    
-                    # Insert the enhancement as instruction #7
-                    enhancement_instruction = f"7. IMPORTANT: {enhancement}\n"
-                    
-                    prompt = (prompt[:instruction_6_end] + 
-                            enhancement_instruction + 
-                            prompt[instruction_6_end:])
-            else:
-                # Fallback: if no Instructions section found, append normally
-                prompt += f"\n\nEducational Enhancement: {enhancement}"
+    # Update template usage if template was used (in the request even when the analysis is deferred)
+    template_used = data.get("template", "")
+    if template_used:
+        bump_template_usage(template_used)
     
-    return prompt, selected_theory
-
-# UPDATED MAIN GENERATE FUNCTION
+    generation = build_prompt_generation(
+        session, data, meta, text_response, time.time() - start_time, served_from_cache, time_to_first_token,
+        analyze=not deferred
+    )
+    generation.save()
+    if deferred:
+        transaction.on_commit(
+            lambda: get_analysis_executor().submit(generation.pk, data, text_response)
+        )
+    return generation
 
 def generate_prompt(request):
     if request.method == "POST":
@@ -238,249 +429,499 @@ def generate_prompt(request):
         
         try:
             data = json.loads(request.body)
-            prompt = data.get("prompt", "default prompt")
-            
-            # Get enhancement preference and selected theory
-            enhancement_type = data.get("enhancement", "enhanced")
-            selected_theory = data.get("theory_enhancement", "")  # NEW: Get selected theory
-            
-            # Detect request type
-            is_theory_request = 'educational theory expert' in prompt.lower()
-            is_improvement_request = 'prompt engineering expert' in prompt.lower()
-            
+            prompt, meta = build_generation_prompt(data)
+        except PromptFieldError as e:
+            return JsonResponse({"error": str(e)}, status=400)
         except Exception as e:
             logger.error(f"JSON decode error: {e}")
             return JsonResponse({"error": "Invalid JSON"}, status=400)
 
-        api_key = settings.GEMINI_API_KEY
-        
-        # Model selection - use gemini-2.5-flash for all requests
-        url = "https://generativelanguage.googleapis.com/v1/models/gemini-2.5-flash:generateContent?key=" + api_key
+        if not request.session.session_key:
+            request.session.create()
+
+        if settings.GENERATION_QUEUE_MODE:
+            job = enqueue_generation_job(request.session.session_key, data, prompt, meta)
+            return queued_job_response(job)
+
+        payload = build_gemini_payload(prompt)
+
+        try:
+            response_text, served_from_cache = fetch_gemini_response(payload, start_time)
+        except GeminiError as e:
+            body, status = gemini_failure(e)
+            return JsonResponse(body, status=status)
+
+        text_response = extract_generated_text(response_text, meta)
+        logger.info(f"✅ Total processing time: {time.time() - start_time:.2f}s")
+
+        generation = record_prompt_generation(
+            request.session.session_key, data, meta, text_response, start_time, served_from_cache
+        )
         
-        # Handle special requests
-        if is_theory_request or is_improvement_request:
-            if is_improvement_request:
-                prompt = """You are a prompt engineering expert. Respond with ONLY valid JSON in this exact format:
-{"prompt_improvements": "Your 3 numbered suggestions here..."}
+        return JsonResponse({
+            "response": text_response,
+            "generation": generation_ref(request.session.session_key, generation.pk),
+        })
+    
+    else:
+        return JsonResponse({"error": "Only POST requests are allowed."}, status=400)
 
-Please provide exactly 3 specific improvements the user could add to their prompt to make it more effective.
+async def generate_prompt_async(request):
+    """
+    ASGI version of generate_prompt.
+    The Gemini call is awaited on the shared client's httpx pool so one worker can keep
+    hundreds of generations in flight; the analytics writes run through sync_to_async.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST requests are allowed."}, status=400)
+    
+    start_time = time.time()
+    
+    try:
+        data = json.loads(request.body)
+        prompt, meta = build_generation_prompt(data)
+    except PromptFieldError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"JSON decode error: {e}")
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
 
-Focus on the most impactful improvements like: duration/timing, output format, specificity, differentiation, assessment criteria, etc.
+    if not request.session.session_key:
+        await request.session.acreate()
 
-Do not include ```json, markdown, or any other formatting. Just pure JSON.
+    if settings.GENERATION_QUEUE_MODE:
+        job = await sync_to_async(enqueue_generation_job)(request.session.session_key, data, prompt, meta)
+        return queued_job_response(job)
 
-""" + prompt
-            else:
-                prompt = """You are an educational psychology expert. Respond with ONLY valid JSON in this exact format:
-{"theory_explanation": "Your explanation here", "teaching_tip": "Your tip here"}
+    payload = build_gemini_payload(prompt)
 
-Do not include ```json, markdown, or any other formatting. Just pure JSON.
+    try:
+        response_text, served_from_cache = await afetch_gemini_response(payload, start_time)
+    except GeminiError as e:
+        body, status = gemini_failure(e)
+        return JsonResponse(body, status=status)
 
-""" + prompt
-        else:
-            # Apply NEW ENHANCED theoretical enhancement for regular prompts
-            if enhancement_type == "enhanced":
-                # Extract form data for enhancement
-                form_data = {
-                    "role": data.get("role", ""),
-                    "task": data.get("task", ""),
-                    "context": data.get("context", ""),
-                    "methodology": data.get("methodology", ""),
-                    "subject": data.get("subject", ""),
-                    "tone": data.get("tone", "")
-                }
-                
-                # Use NEW enhancement system
-                # Use NEW enhancement system
-                #print(f"DEBUG: selected_theory = {selected_theory}")
-                #print(f"DEBUG: enhancement_type = {enhancement_type}")
-                prompt, applied_theory = add_selected_theory_enhancement(prompt, form_data, selected_theory)
-                #print(f"DEBUG: applied_theory = {applied_theory}")
-                #print(f"DEBUG: enhanced prompt length = {len(prompt)}")
-                
-                # Log which theory was applied for research purposes
-                logger.info(f"Applied theory: {applied_theory} (user selected: {selected_theory})")
-
-        # [Rest of the API call logic remains the same]
-        #print(f"DEBUG: Final prompt being sent to Gemini:")
-        #print(f"DEBUG: {prompt}")
-        #print("="*80)
-        payload = {
-            "contents": [
-                {
-                    "parts": [
-                        {"text": prompt}
-                    ]
-                }
-            ],
-            "generationConfig": {
-                "temperature": 0.7,
-                "topK": 40,
-                "topP": 0.95,
-                "maxOutputTokens": 2000,
-                "stopSequences": []
-            }
-        }
+    text_response = extract_generated_text(response_text, meta)
+    logger.info(f"✅ Total processing time: {time.time() - start_time:.2f}s")
 
-        logger.info(f"📤 Sending request to Gemini at {time.time() - start_time:.2f}s")
-        
-        try:
-            response = requests.post(
-                url, 
-                json=payload, 
-                timeout=30,
-                headers={
-                    'Content-Type': 'application/json',
-                    'User-Agent': 'AI-Prompt-Generator/1.0'
-                }
-            )
-            
-            api_time = time.time() - start_time
-            logger.info(f"📨 Got response from Gemini in {api_time:.2f}s")
-            logger.info(f"📄 Response status: {response.status_code}")
-            logger.info(f"📏 Response length: {len(response.text)} chars")
-            
-            if response.status_code != 200:
-                logger.error(f"Gemini API error: {response.status_code} - {response.text}")
-                return JsonResponse({
-                    "error": f"API Error: {response.status_code}",
-                    "response": "Sorry, there was an error generating your prompt. Please try again."
-                }, status=500)
-            
-        except requests.exceptions.Timeout:
-            logger.error("Gemini API timeout")
-            return JsonResponse({
-                "error": "Request timeout", 
-                "response": "The request took too long. Please try again with a shorter prompt."
-            }, status=408)
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Network error: {e}")
-            return JsonResponse({
-                "error": "Network error",
-                "response": "Network error occurred. Please check your connection and try again."
-            }, status=500)
+    generation = await sync_to_async(record_prompt_generation)(
+        request.session.session_key, data, meta, text_response, start_time, served_from_cache
+    )
+    
+    return JsonResponse({
+        "response": text_response,
+        "generation": generation_ref(request.session.session_key, generation.pk),
+    })
+
+# QUEUE MODE - /generate/ enqueues a GenerationJob and the client polls for the result
+
+def queued_job_response(job):
+    return JsonResponse({
+        "job_id": str(job.pk),
+        "status": job.status,
+        "poll_url": reverse('generation_job_status', args=[job.pk]),
+        # Only the async status view long-polls; sync workers answer at once and the client backs off
+        "long_poll": settings.SERVER_PROFILE == 'asgi',
+    }, status=202)
+
+def run_generation_job(job):
+    """Worker handler for one GenerationJob: Gemini call plus the PromptAnalyzer pass"""
+    start_time = job.created_at.timestamp()  # response time includes time spent queued
+    payload = build_gemini_payload(job.prompt)
+    
+    try:
+        response_text, served_from_cache = fetch_gemini_response(payload, start_time)
+    except GeminiError as e:
+        body, status = gemini_failure(e)
+        fail_job(job, body, status)
+        return
+    
+    text_response = extract_generated_text(response_text, job.meta)
+    # Recording and finishing commit together, and only while this worker still holds the
+    # lease - a job re-claimed after an expired lease is recorded once, by its new worker
+    with transaction.atomic():
+        if not holds_job_lease(job):
+            logger.warning(f"⚠️ Job {str(job.pk)[:8]} lost its lease, dropping the result")
+            return
+        generation = record_prompt_generation(
+            job.session_id, job.request_data, job.meta, text_response, start_time, served_from_cache
+        )
+        finish_job(job, text_response, generation)
+    logger.info(f"✅ Job {str(job.pk)[:8]} done in {time.time() - start_time:.2f}s")
+
+def job_wait_seconds(request):
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        wait = 0
+    return max(0, min(wait, settings.GENERATION_QUEUE_MAX_WAIT))
+
+def job_status_response(job):
+    if job is None:
+        return JsonResponse({"error": "Job not found"}, status=404)
+    if job.status == 'failed':
+        return JsonResponse(job_status_payload(job), status=job.error_status or 500)
+    return JsonResponse(job_status_payload(job), status=200 if job.status == 'done' else 202)
 
+@require_http_methods(["GET"])
+def generation_job_status(request, job_id):
+    """
+    Poll a queued generation. Answers at once: ?wait is ignored, since a sleeping sync
+    worker would block every other request (the client short-polls with backoff instead).
+    """
+    job = GenerationJob.objects.filter(pk=job_id, session_id=request.session.session_key).first()
+    return job_status_response(job)
+
+@require_http_methods(["GET"])
+async def generation_job_status_async(request, job_id):
+    """
+    ASGI version of generation_job_status. ?wait=<seconds> long-polls until the job finishes
+    (capped at GENERATION_QUEUE_MAX_WAIT) - waiting doesn't hold a thread here.
+    """
+    deadline = time.time() + job_wait_seconds(request)
+    while True:
+        job = await GenerationJob.objects.filter(pk=job_id, session_id=request.session.session_key).afirst()
+        if job is None or job.is_finished or time.time() >= deadline:
+            return job_status_response(job)
+        await asyncio.sleep(settings.GENERATION_QUEUE_POLL_INTERVAL)
+
+# BATCH - many form configurations in one request (workshop pre-generation)
+
+def parse_batch_request(request):
+    """
+    Validate a /generate/batch/ body: {"items": [<same payload as /generate/>, ...]}.
+    Returns (entries, error_response); items that can't be prepared become per-item errors.
+    """
+    try:
+        items = json.loads(request.body).get("items")
+    except Exception as e:
+        logger.error(f"JSON decode error: {e}")
+        return None, JsonResponse({"error": "Invalid JSON"}, status=400)
+    
+    if not isinstance(items, list) or not items:
+        return None, JsonResponse({"error": "'items' must be a non-empty list"}, status=400)
+    if len(items) > settings.GENERATION_BATCH_MAX_ITEMS:
+        return None, JsonResponse(
+            {"error": f"Too many items (max {settings.GENERATION_BATCH_MAX_ITEMS} per batch)"}, status=400
+        )
+    
+    entries = []
+    for index, item in enumerate(items):
+        entry = {'index': index, 'data': item}
         try:
-            result = response.json()
-            text_response = result["candidates"][0]["content"]["parts"][0]["text"]
-            
-            # Handle special requests - ensure JSON format
-            if is_theory_request or is_improvement_request:
-                try:
-                    json.loads(text_response)
-                except json.JSONDecodeError:
-                    if is_improvement_request:
-                        fallback_response = {
-                            "prompt_improvements": text_response
-                        }
-                    else:
-                        fallback_response = {
-                            "theory_explanation": text_response,
-                            "teaching_tip": "Remember to adapt this approach based on your students' individual needs."
-                        }
-                    text_response = json.dumps(fallback_response)
-            
-            total_time = time.time() - start_time
-            logger.info(f"✅ Total processing time: {total_time:.2f}s")
-            
-        except (KeyError, IndexError) as e:
-            logger.error(f"Response parsing error: {e}")
-            logger.error(f"Full response: {response.text}")
-            text_response = "Sorry, no prompt was generated. Please try again."
+            entry['prompt'], entry['meta'] = build_generation_prompt(item)
+        except PromptFieldError as e:
+            entry['error'], entry['status'] = {"error": str(e)}, 400
         except Exception as e:
-            logger.error(f"Unexpected parsing error: {e}")
-            text_response = "Sorry, an unexpected error occurred."
-
-        # Enhanced analytics tracking
-        session_id = request.session.session_key or request.session.create()
-        session, created = UserSession.objects.get_or_create(session_id=session_id)
-        
-        # Update template usage if template was used
-        template_used = data.get("template", "")
-        if template_used:
-            template_obj, created = TemplateUsage.objects.get_or_create(template_name=template_used)
-            template_obj.usage_count += 1
-            template_obj.save()
-        
-        # Auto-analysis of educational data
-        subject_category = PromptAnalyzer.enhanced_subject_classification(
-            data.get("subject", ""),
-            data.get("task", ""),
-            data.get("role", ""), 
-            text_response
-        )
-        age_group_category = PromptAnalyzer.categorize_age_group(data.get("context", ""))
-        methodology_category = PromptAnalyzer.categorize_methodology(data.get("methodology", ""))
-        complexity_level = PromptAnalyzer.assess_complexity(
-            text_response, 
-            data.get("task", ""), 
-            data.get("methodology", "")
+            logger.error(f"Batch item {index} rejected: {e}")
+            entry['error'], entry['status'] = {"error": "Invalid item"}, 400
+        entries.append(entry)
+    return entries, None
+
+def fetch_batch_item(entry, start_time):
+    """Gemini call for one batch entry; runs on a fan-out thread"""
+    try:
+        response_text, entry['served_from_cache'] = fetch_gemini_response(
+            build_gemini_payload(entry['prompt']), start_time
         )
+        entry['response_time'] = time.time() - start_time
+        entry['text_response'] = extract_generated_text(response_text, entry['meta'])
+    except GeminiError as e:
+        entry['error'], entry['status'] = gemini_failure(e)
+    finally:
+        # The response cache may have opened a DB connection on this thread
+        connections.close_all()
+
+async def afetch_batch_item(entry, start_time, semaphore):
+    """Async fetch_batch_item(), bounded by the batch semaphore"""
+    async with semaphore:
+        try:
+            response_text, entry['served_from_cache'] = await afetch_gemini_response(
+                build_gemini_payload(entry['prompt']), start_time
+            )
+            entry['response_time'] = time.time() - start_time
+            entry['text_response'] = extract_generated_text(response_text, entry['meta'])
+        except GeminiError as e:
+            entry['error'], entry['status'] = gemini_failure(e)
+
+def record_batch_generations(session_id, entries):
+    """
+    Analytics for every successful batch entry: one bulk_create, one usage update per template.
+    Each recorded entry gets its generation reference for /track-copy/.
+    """
+    session, created = UserSession.objects.get_or_create(session_id=session_id)
+    deferred = settings.ANALYSIS_DEFERRED
+    
+    recorded = [entry for entry in entries if 'error' not in entry]
+    generations = []
+    template_counts = Counter()
+    for entry in recorded:
+        generations.append(build_prompt_generation(
+            session, entry['data'], entry['meta'], entry['text_response'],
+            entry['response_time'], entry['served_from_cache'], analyze=not deferred
+        ))
+        if entry['data'].get("template"):
+            template_counts[entry['data']["template"]] += 1
+    
+    with transaction.atomic():
+        for template_name, count in template_counts.items():
+            bump_template_usage(template_name, count)
+        PromptGeneration.objects.bulk_create(generations)
+    
+    for generation, entry in zip(generations, recorded):
+        entry['generation'] = generation_ref(session_id, generation.pk)
+    if deferred:
+        # After commit, like record_prompt_generation: under an outer transaction the
+        # executor threads couldn't see the rows yet
+        def submit_analysis():
+            executor = get_analysis_executor()
+            for generation, entry in zip(generations, recorded):
+                executor.submit(generation.pk, entry['data'], entry['text_response'])
+        transaction.on_commit(submit_analysis)
+    return generations
+
+def batch_response(entries, start_time):
+    results = []
+    for entry in entries:
+        if 'error' in entry:
+            results.append({"index": entry['index'], "status": entry['status'], **entry['error']})
+        else:
+            results.append({
+                "index": entry['index'], "status": 200, "response": entry['text_response'],
+                "generation": entry.get('generation'),
+            })
+    
+    failed = sum(1 for result in results if result["status"] != 200)
+    logger.info(f"✅ Batch of {len(results)} done in {time.time() - start_time:.2f}s ({failed} failed)")
+    return JsonResponse({
+        "results": results,
+        "succeeded": len(results) - failed,
+        "failed": failed,
+    })
+
+def generate_prompt_batch(request):
+    """
+    Generate many prompt configurations in one request. Gemini calls fan out on at most
+    GENERATION_BATCH_CONCURRENCY threads; each item reports its own result or error.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST requests are allowed."}, status=400)
+    
+    start_time = time.time()
+    entries, error_response = parse_batch_request(request)
+    if error_response:
+        return error_response
+    
+    if not request.session.session_key:
+        request.session.create()
+    
+    pending = [entry for entry in entries if 'error' not in entry]
+    if pending:
+        workers = min(settings.GENERATION_BATCH_CONCURRENCY, len(pending))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="generate-batch") as executor:
+            list(executor.map(lambda entry: fetch_batch_item(entry, start_time), pending))
+    
+    record_batch_generations(request.session.session_key, entries)
+    return batch_response(entries, start_time)
+
+async def generate_prompt_batch_async(request):
+    """ASGI version of generate_prompt_batch - the fan-out is a bounded asyncio.gather"""
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST requests are allowed."}, status=400)
+    
+    start_time = time.time()
+    entries, error_response = parse_batch_request(request)
+    if error_response:
+        return error_response
+    
+    if not request.session.session_key:
+        await request.session.acreate()
+    
+    semaphore = asyncio.Semaphore(settings.GENERATION_BATCH_CONCURRENCY)
+    await asyncio.gather(*(
+        afetch_batch_item(entry, start_time, semaphore) for entry in entries if 'error' not in entry
+    ))
+    
+    await sync_to_async(record_batch_generations)(request.session.session_key, entries)
+    return batch_response(entries, start_time)
+
+def generate_prompt_stream(request):
+    """
+    Server-Sent Events version of generate_prompt backed by Gemini streamGenerateContent.
+    Emits `chunk` events as text arrives and a final `done` event with the processed response;
+    the PromptGeneration row is written once, after the stream completes. In queue mode it
+    answers like /generate/ does, with the queued job.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST requests are allowed."}, status=400)
+    
+    start_time = time.time()
+    
+    try:
+        data = json.loads(request.body)
+        prompt, meta = build_generation_prompt(data)
+    except PromptFieldError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"JSON decode error: {e}")
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    # Session must exist before the response starts streaming
+    if not request.session.session_key:
+        request.session.create()
+    session_id = request.session.session_key
+
+    if settings.GENERATION_QUEUE_MODE:
+        # Workers make the call; the client polls the job instead of reading a stream
+        job = enqueue_generation_job(session_id, data, prompt, meta)
+        return queued_job_response(job)
+
+    payload = build_gemini_payload(prompt)
+
+    def event_stream():
+        response_cache = get_response_cache()
+        cache_key = response_cache.key_for(payload, settings.GEMINI_MODEL)
+        response_body = response_cache.get(cache_key)
+        served_from_cache = response_body is not None
+        first_token_time = None
         
-        # Content analysis
-        content_analysis = PromptAnalyzer.analyze_content(text_response)
-        
-        # Determine the final applied theory for analytics
-        if enhancement_type == "enhanced" and not (is_theory_request or is_improvement_request):
-            final_applied_theory = applied_theory
-            theory_was_auto_suggested = not bool(selected_theory)
+        if served_from_cache:
+            first_token_time = time.time() - start_time
+            yield sse_event('chunk', {'text': extract_generated_text(response_body, meta)})
         else:
-            final_applied_theory = None
-            theory_was_auto_suggested = False
-        
-        # Create comprehensive prompt generation record with NEW THEORY TRACKING
-        PromptGeneration.objects.create(
-            session=session,
-            template_used=template_used,
-            role=data.get("role", ""),
-            subject=data.get("subject", ""),
-            task=data.get("task", ""),
-            context=data.get("context", ""),
-            methodology=data.get("methodology", ""),
-            tone=data.get("tone", ""),
-            enhancement_mode=enhancement_type,
-            success=True,
-            response_time_seconds=time.time() - start_time,
-            generated_prompt=text_response,
-            
-            # Auto-analyzed categories
-            subject_category=subject_category,
-            age_group_category=age_group_category,
-            methodology_category=methodology_category,
-            complexity_level=complexity_level,
-            
-            # NEW: Theory selection tracking (will need to add these fields to model)
-            selected_theory=final_applied_theory,
-            theory_auto_suggested=theory_was_auto_suggested,
-            
-            # Content analysis results
-            **content_analysis
+            chunks = []
+            coalesced = False
+            try:
+                for text, coalesced in stream_gemini_text(payload, cache_key):
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                        logger.info(f"⏱️ Time to first token: {first_token_time:.2f}s"
+                                    f"{' (coalesced)' if coalesced else ''}")
+                    chunks.append(text)
+                    yield sse_event('chunk', {'text': text})
+            except GeminiError as e:
+                body, status = gemini_failure(e)
+                yield sse_event('error', body)
+                return
+            response_body = assemble_response_body(''.join(chunks))
+            if chunks and not coalesced:
+                response_cache.set(cache_key, response_body)
+
+        text_response = extract_generated_text(response_body, meta)
+        logger.info(f"✅ Total streaming time: {time.time() - start_time:.2f}s")
+        generation = record_prompt_generation(
+            session_id, data, meta, text_response, start_time, served_from_cache, first_token_time
         )
-        
-        return JsonResponse({"response": text_response})
-    
-    else:
+        yield sse_event('done', {'response': text_response, 'generation': generation_ref(session_id, generation.pk)})
+
+    return sse_response(event_stream())
+
+async def generate_prompt_stream_async(request):
+    """ASGI version of generate_prompt_stream"""
+    if request.method != "POST":
         return JsonResponse({"error": "Only POST requests are allowed."}, status=400)
+    
+    start_time = time.time()
+    
+    try:
+        data = json.loads(request.body)
+        prompt, meta = build_generation_prompt(data)
+    except PromptFieldError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"JSON decode error: {e}")
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    if not request.session.session_key:
+        await request.session.acreate()
+    session_id = request.session.session_key
+
+    if settings.GENERATION_QUEUE_MODE:
+        job = await sync_to_async(enqueue_generation_job)(session_id, data, prompt, meta)
+        return queued_job_response(job)
+
+    payload = build_gemini_payload(prompt)
+
+    async def event_stream():
+        response_cache = get_response_cache()
+        cache_key = response_cache.key_for(payload, settings.GEMINI_MODEL)
+        response_body = await response_cache.aget(cache_key)
+        served_from_cache = response_body is not None
+        first_token_time = None
+        
+        if served_from_cache:
+            first_token_time = time.time() - start_time
+            yield sse_event('chunk', {'text': extract_generated_text(response_body, meta)})
+        else:
+            chunks = []
+            coalesced = False
+            try:
+                async for text, coalesced in astream_gemini_text(payload, cache_key):
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                        logger.info(f"⏱️ Time to first token: {first_token_time:.2f}s"
+                                    f"{' (coalesced)' if coalesced else ''}")
+                    chunks.append(text)
+                    yield sse_event('chunk', {'text': text})
+            except GeminiError as e:
+                body, status = gemini_failure(e)
+                yield sse_event('error', body)
+                return
+            response_body = assemble_response_body(''.join(chunks))
+            if chunks and not coalesced:
+                await response_cache.aset(cache_key, response_body)
+
+        text_response = extract_generated_text(response_body, meta)
+        logger.info(f"✅ Total streaming time: {time.time() - start_time:.2f}s")
+        generation = await sync_to_async(record_prompt_generation)(
+            session_id, data, meta, text_response, start_time, served_from_cache, first_token_time
+        )
+        yield sse_event('done', {'response': text_response, 'generation': generation_ref(session_id, generation.pk)})
+
+    return sse_response(event_stream())
+
+def sse_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # don't let proxies buffer the stream
+    return response
 
 def help_page(request):
     return render(request, "generator/help.html")
 
 @csrf_exempt
 def track_copy(request):
-    if request.method == "POST":
-        session_id = request.session.session_key
-        if session_id:
-            # Find the latest prompt generation for this session
-            latest_prompt = PromptGeneration.objects.filter(
-                session__session_id=session_id
-            ).order_by('-timestamp').first()
-            
-            if latest_prompt:
-                latest_prompt.copied_to_clipboard = True
-                latest_prompt.save()
-        
-        return JsonResponse({"status": "success"})
-    return JsonResponse({"error": "Only POST allowed"}, status=400)
+    """
+    Mark copied prompts. Body: {"generations": [{"id": ..., "token": ...}, ...]}, the references
+    returned by the generate endpoints - checked in memory and written with one UPDATE by
+    primary key. A body without references marks the session's latest generation.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST allowed"}, status=400)
+    
+    try:
+        body = json.loads(request.body or b'{}')
+    except Exception as e:
+        logger.error(f"JSON decode error: {e}")
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    if not isinstance(body, dict):
+        return JsonResponse({"error": "Body must be a JSON object"}, status=400)
+    refs = body.get('generations')
+    if refs is not None and not isinstance(refs, list):
+        return JsonResponse({"error": "'generations' must be a list"}, status=400)
+    if refs and len(refs) > settings.TRACK_COPY_MAX_ITEMS:
+        return JsonResponse(
+            {"error": f"Too many generations (max {settings.TRACK_COPY_MAX_ITEMS} per request)"}, status=400
+        )
+    
+    session_id = request.session.session_key
+    marked = 0
+    if session_id:
+        if refs is None:
+            marked = mark_latest_copied(session_id)
+        else:
+            marked = mark_copied(verified_generation_ids(session_id, refs))
+    return JsonResponse({"status": "success", "marked": marked})
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -546,16 +987,9 @@ def onboarding_data_collection(request):
                 user_agent=request.META.get('HTTP_USER_AGENT', '')
             )
         
-        # Update demographics data
-        session.ai_experience = ai_experience
-        session.teaching_years = teaching_years
-        session.onboarding_completed = True
-        session.onboarding_completion_time = timezone.now()
-        session.research_consent = True  # Implied by participation
-        
-        # Save with validation
+        # Update demographics data (validates and writes only the onboarding fields)
         try:
-            session.save()
+            session.record_onboarding(ai_experience, teaching_years)
             
             # Log for research analytics
             logger.info(f"Onboarding completed - Session: {session_id[:8]}, "
@@ -803,17 +1237,21 @@ def training_needs_data_collection(request):
                 'error': 'Session not found'
             }, status=404)
         
-        # Update training needs data
-        session.training_interests = training_interests
-        session.training_priorities = training_priorities
-        session.training_other_needs = data.get('training_other_needs')
-        session.follow_up_email = data.get('follow_up_email')
-        session.research_interview_interest = data.get('research_interview_interest', False)
-        session.training_needs_completed = True
-        session.training_needs_completion_time = timezone.now()
-        
-        # Save
-        session.save()
+        # Update training needs data (validates and writes only the survey fields)
+        try:
+            session.record_training_needs(
+                training_interests,
+                training_priorities,
+                other_needs=data.get('training_other_needs'),
+                follow_up_email=data.get('follow_up_email'),
+                interview_interest=data.get('research_interview_interest', False),
+            )
+        except ValidationError as validation_error:
+            logger.error(f"Training needs validation error: {validation_error}")
+            return JsonResponse({
+                'error': 'Data validation failed',
+                'details': str(validation_error)
+            }, status=400)
         
         # Log for research analytics
         logger.info(f"Training needs completed - Session: {session_id[:8]}, "
@@ -0,0 +1,34 @@
+"""
+Gunicorn deployment profiles for promptbuilder.
+
+SERVER_PROFILE=wsgi  - classic sync workers serving promptbuilder.wsgi (default)
+SERVER_PROFILE=asgi  - uvicorn workers serving promptbuilder.asgi, /generate/ runs
+                       the async pipeline so a single worker keeps many Gemini calls in flight
+"""
+from decouple import config
+
+# Read like promptbuilder/settings.py (environment, then .env), so the worker class always
+# matches the views promptbuilder/urls.py routes to
+SERVER_PROFILE = config('SERVER_PROFILE', default='wsgi')
+
+bind = f"0.0.0.0:{config('PORT', default='8000')}"
+workers = config('WEB_CONCURRENCY', default=1, cast=int)
+timeout = config('GUNICORN_TIMEOUT', default=60, cast=int)
+keepalive = 5
+
+if SERVER_PROFILE == 'asgi':
+    wsgi_app = 'promptbuilder.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'promptbuilder.wsgi:application'
+    worker_class = 'sync'
+
+
+def worker_exit(server, worker):
+    # Finish deferred PromptAnalyzer work, buffered page views and counter deltas before the worker goes away
+    from generator.deferred_analysis import flush_deferred_analysis
+    from generator.activity_tracker import flush_page_views
+    from generator.counters import flush_counters
+    flush_deferred_analysis()
+    flush_page_views()
+    flush_counters()
@@ -7,7 +7,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
+
+from .database import database_config
 
 import os
 
@@ -85,14 +87,56 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'promptbuilder.wsgi.application'
+ASGI_APPLICATION = 'promptbuilder.asgi.application'
+
+# Server profile: 'wsgi' (sync gunicorn workers) or 'asgi' (gunicorn + uvicorn workers).
+# The asgi profile routes /generate/ to the async pipeline - see gunicorn.conf.py
+SERVER_PROFILE = config('SERVER_PROFILE', default='wsgi')
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# SQLite file by default, PostgreSQL (or any dj-database-url URL) with DATABASE_URL;
+# profiles and pragmas are explained in promptbuilder/database.py. Persistent connections are
+# per thread, so the asgi profile (async views, short-lived sync_to_async threads) defaults to
+# closing them after each request - use DATABASE_POOL there instead
 DATABASES = {
+    'default': database_config(
+        BASE_DIR,
+        url=config('DATABASE_URL', default=''),
+        conn_max_age=config('DATABASE_CONN_MAX_AGE', default=0 if SERVER_PROFILE == 'asgi' else 600, cast=int),
+        health_checks=config('DATABASE_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        ssl_require=config('DATABASE_SSL_REQUIRE', default=False, cast=bool),
+        pool=config('DATABASE_POOL', default=False, cast=bool),
+        pool_min_size=config('DATABASE_POOL_MIN_SIZE', default=2, cast=int),
+        pool_max_size=config('DATABASE_POOL_MAX_SIZE', default=10, cast=int),
+        pool_timeout=config('DATABASE_POOL_TIMEOUT', default=10, cast=int),
+    )
+}
+
+# Applied to every new SQLite connection (ignored on other databases)
+SQLITE_PRAGMAS = {
+    'journal_mode': config('SQLITE_JOURNAL_MODE', default='wal'),
+    'synchronous': config('SQLITE_SYNCHRONOUS', default='normal'),
+    'busy_timeout': config('SQLITE_BUSY_TIMEOUT_MS', default=20000, cast=int),
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+    'cache_size': config('SQLITE_CACHE_SIZE', default=-64 * 1024, cast=int),  # negative = KiB
+}
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# 'gemini_responses' is shared by all gunicorn workers (run `manage.py createcachetable`)
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'gemini_responses': {
+        'BACKEND': config('GEMINI_CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('GEMINI_CACHE_LOCATION', default='gemini_response_cache'),
+        'TIMEOUT': config('GEMINI_CACHE_TTL', default=86400, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('GEMINI_CACHE_MAX_ENTRIES', default=5000, cast=int),
+        },
+    },
 }
 
 # Password validation
@@ -133,4 +177,74 @@ STATICFILES_DIRS = [
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Gemini API Key - uses environment variable for security
-GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
\ No newline at end of file
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+
+# Gemini client (generator/gemini.py) - point GEMINI_API_BASE at a local stub for tests
+GEMINI_API_BASE = config('GEMINI_API_BASE', default='https://generativelanguage.googleapis.com/v1')
+GEMINI_MODEL = config('GEMINI_MODEL', default='gemini-2.5-flash')
+GEMINI_POOL_SIZE = config('GEMINI_POOL_SIZE', default=20, cast=int)
+GEMINI_ASYNC_MAX_CONNECTIONS = config('GEMINI_ASYNC_MAX_CONNECTIONS', default=500, cast=int)
+GEMINI_MAX_RETRIES = config('GEMINI_MAX_RETRIES', default=2, cast=int)
+GEMINI_BACKOFF_BASE = config('GEMINI_BACKOFF_BASE', default=0.5, cast=float)
+GEMINI_BACKOFF_MAX = config('GEMINI_BACKOFF_MAX', default=8.0, cast=float)
+GEMINI_CONNECT_TIMEOUT = config('GEMINI_CONNECT_TIMEOUT', default=5.0, cast=float)
+GEMINI_READ_TIMEOUT = config('GEMINI_READ_TIMEOUT', default=30.0, cast=float)
+
+# Gemini response cache (generator/response_cache.py)
+GEMINI_CACHE_ENABLED = config('GEMINI_CACHE_ENABLED', default=True, cast=bool)
+GEMINI_CACHE_ALIAS = 'gemini_responses'
+GEMINI_CACHE_TTL = config('GEMINI_CACHE_TTL', default=86400, cast=int)
+GEMINI_CACHE_LOCAL_ENTRIES = config('GEMINI_CACHE_LOCAL_ENTRIES', default=512, cast=int)
+
+# Single-flight coalescing of identical in-flight Gemini calls (generator/singleflight.py).
+# Cross-process mode shares a lock and the result through the gemini_responses cache.
+GEMINI_SINGLE_FLIGHT = config('GEMINI_SINGLE_FLIGHT', default=True, cast=bool)
+GEMINI_SINGLE_FLIGHT_CROSS_PROCESS = config('GEMINI_SINGLE_FLIGHT_CROSS_PROCESS', default=False, cast=bool)
+
+# Queue mode: /generate/ enqueues a GenerationJob and returns its id; run the workers with
+# `python manage.py run_generation_workers` (generator/jobs.py). Off by default: the web
+# process doesn't run jobs, so only turn it on where a worker process runs too (railway.toml)
+GENERATION_QUEUE_MODE = config('GENERATION_QUEUE_MODE', default=False, cast=bool)
+GENERATION_QUEUE_POLL_INTERVAL = config('GENERATION_QUEUE_POLL_INTERVAL', default=0.5, cast=float)
+GENERATION_QUEUE_LEASE_SECONDS = config('GENERATION_QUEUE_LEASE_SECONDS', default=120, cast=int)
+GENERATION_QUEUE_MAX_ATTEMPTS = config('GENERATION_QUEUE_MAX_ATTEMPTS', default=3, cast=int)
+GENERATION_QUEUE_MAX_WAIT = config('GENERATION_QUEUE_MAX_WAIT', default=25, cast=float)
+# Finished jobs are deleted by the workers once they are this old (their PromptGeneration stays)
+GENERATION_QUEUE_RETENTION_HOURS = config('GENERATION_QUEUE_RETENTION_HOURS', default=24, cast=float)
+
+# /generate/batch/: concurrent Gemini calls per batch request, and the largest batch accepted
+GENERATION_BATCH_CONCURRENCY = config('GENERATION_BATCH_CONCURRENCY', default=8, cast=int)
+GENERATION_BATCH_MAX_ITEMS = config('GENERATION_BATCH_MAX_ITEMS', default=50, cast=int)
+
+# Deferred analysis: /generate/ saves a minimal PromptGeneration and responds; the PromptAnalyzer
+# pass runs on a per-process thread pool (generator/deferred_analysis.py)
+ANALYSIS_DEFERRED = config('ANALYSIS_DEFERRED', default=False, cast=bool)
+ANALYSIS_WORKERS = config('ANALYSIS_WORKERS', default=2, cast=int)
+ANALYSIS_MAX_BACKLOG = config('ANALYSIS_MAX_BACKLOG', default=500, cast=int)
+ANALYSIS_FLUSH_TIMEOUT = config('ANALYSIS_FLUSH_TIMEOUT', default=30, cast=float)
+
+# Page view tracking (generator/activity_tracker.py). Buffered: index() queues the PageView and
+# pages_visited increment in memory and a per-process thread writes them in batches. When
+# PAGE_VIEW_MAX_BUFFER views are waiting, PAGE_VIEW_OVERFLOW='drop' discards new views and
+# 'inline' makes the request write the buffer itself
+PAGE_VIEW_BUFFERED = config('PAGE_VIEW_BUFFERED', default=False, cast=bool)
+PAGE_VIEW_FLUSH_INTERVAL = config('PAGE_VIEW_FLUSH_INTERVAL', default=2.0, cast=float)
+PAGE_VIEW_FLUSH_BATCH = config('PAGE_VIEW_FLUSH_BATCH', default=500, cast=int)
+PAGE_VIEW_MAX_BUFFER = config('PAGE_VIEW_MAX_BUFFER', default=5000, cast=int)
+PAGE_VIEW_OVERFLOW = config('PAGE_VIEW_OVERFLOW', default='drop')
+
+# /healthz/ and /readyz/ (generator/health.py): readiness probe results are cached per process
+HEALTH_PROBE_TTL = config('HEALTH_PROBE_TTL', default=10.0, cast=float)
+
+# Automated traffic (generator/traffic.py): bots, monitors and prefetches get pages without
+# sessions or analytics rows. Extra user agent regexes are comma-separated
+TRAFFIC_SKIP_AUTOMATED = config('TRAFFIC_SKIP_AUTOMATED', default=True, cast=bool)
+TRAFFIC_EXTRA_BOT_PATTERNS = config('TRAFFIC_EXTRA_BOT_PATTERNS', default='', cast=Csv())
+
+# TemplateUsage / pages_visited counters (generator/counters.py): aggregated mode sums increments
+# in memory and writes the deltas every COUNTERS_FLUSH_INTERVAL seconds
+COUNTERS_AGGREGATED = config('COUNTERS_AGGREGATED', default=False, cast=bool)
+COUNTERS_FLUSH_INTERVAL = config('COUNTERS_FLUSH_INTERVAL', default=5.0, cast=float)
+
+# /track-copy/ (generator/copy_tracking.py): most generation references accepted per beacon
+TRACK_COPY_MAX_ITEMS = config('TRACK_COPY_MAX_ITEMS', default=50, cast=int)
@@ -4,11 +4,26 @@ from django.conf import settings
 from django.conf.urls.static import static
 from generator import views  # ΑΛΛΑΓΗ ΕΔΩ
 
+# Async generate pipeline when served through promptbuilder/asgi.py
+if settings.SERVER_PROFILE == 'asgi':
+    generate_view, generate_stream_view = views.generate_prompt_async, views.generate_prompt_stream_async
+    job_status_view = views.generation_job_status_async
+    batch_view = views.generate_prompt_batch_async
+else:
+    generate_view, generate_stream_view = views.generate_prompt, views.generate_prompt_stream
+    job_status_view = views.generation_job_status
+    batch_view = views.generate_prompt_batch
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.index, name='index'),
     path('help/', views.help_page, name='help_page'),
-    path('generate/', views.generate_prompt, name='generate_prompt'),
+    path('healthz/', views.liveness, name='liveness'),
+    path('readyz/', views.readiness, name='readiness'),
+    path('generate/', generate_view, name='generate_prompt'),
+    path('generate/stream/', generate_stream_view, name='generate_prompt_stream'),
+    path('generate/batch/', batch_view, name='generate_prompt_batch'),
+    path('generate/jobs/<uuid:job_id>/', job_status_view, name='generation_job_status'),
     path('track-copy/', views.track_copy, name='track_copy'),
     path('onboarding/', views.onboarding_data_collection, name='onboarding_data'),
     path('onboarding/stats/', views.onboarding_stats, name='onboarding_stats'),